@@ -1,21 +1,19 @@
-from flask import Flask, request, redirect, session, url_for, render_template, jsonify
+from flask import Flask, request, redirect, session, url_for, render_template, jsonify, Response
 from flask_cors import CORS
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from google.auth.transport.requests import Request
 import os
 import threading
 import time
-import uuid
 from flask import jsonify
 import pickle
 import json
 from datetime import timedelta
 import base64
-from utils import EmailClient, gen_categories, QuerySaver, CategoryStorage
+from utils import get_category_cache, CategoryStorage, INBOX_PAGE_SIZE
+from change_log import validate_operation
 import random
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 import ssl
 from googleapiclient.errors import HttpError
 import httplib2
@@ -23,11 +21,15 @@ import httplib2
 # Configure httplib2 for better SSL handling
 httplib2.Http.force_exception_to_status_code = True
 
-# Create a thread pool executor
-executor = ThreadPoolExecutor(max_workers=4)
+# Gmail fetch pool, built services, per-user email clients and categorization jobs,
+# the same instances the blueprints use
+from blueprints import fetch_engine, service_cache, client_registry, job_runner, job_events, job_store, \
+    get_email_client, release_email_clients
+from blueprints.categorize_jobs import wants_json, submit_categorization, owns_job, stream_job_events
 
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:5000"], supports_credentials=True)  # Enable CORS for static frontend
+app.teardown_request(release_email_clients)  # Unpin EmailClients once each request is done
 app.secret_key = 'your-secret-key'  # Use consistent secret key
 app.permanent_session_lifetime = timedelta(minutes=15)
 
@@ -50,10 +52,6 @@ CLIENT_SECRETS_FILE = 'credentials.json'
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly', 'https://www.googleapis.com/auth/gmail.modify']
 REDIRECT_URI = 'http://localhost:5000/login/google/authorized'  # Matches your credentials.json
 
-# Initialize email client
-email_client = EmailClient()
-query = QuerySaver()
-
 # Retry decorator for handling transient network/SSL errors
 def retry_on_ssl_error(max_retries=3, base_delay=1.0, max_delay=10.0):
     """
@@ -123,17 +121,11 @@ def inbox():
         return redirect(url_for('index'))
     
     try:
-        if email_client.has_service and email_client.email_list!=None:
-            email_list = email_client.email_list
-            profile = email_client.profile
-            user_email = profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            email_list = email_client.get_messages(max_results=100)
-            profile = email_client.profile
-            user_email = profile.get('emailAddress', 'Unknown')
+        email_client = get_email_client()
+        # Brings the restored or cached mail set up to date (a history delta when the checkpoint is fresh)
+        email_list = email_client.sync_messages(max_results=100)
+        profile = email_client.profile
+        user_email = profile.get('emailAddress', 'Unknown')
         
         return render_template('inbox.html', 
                              emails=email_list, 
@@ -143,10 +135,6 @@ def inbox():
     except Exception as e:
         return f"Error: {str(e)} <a href='/logout'>Try again</a>"
 
-# Global dictionary to store categorization results (kept for API compatibility)
-categorization_results = {}
-categorization_status = {}
-
 @app.route('/categorize')
 def categorize():
     """Categorize emails and display results immediately"""
@@ -158,17 +146,11 @@ def categorize():
     force_new = request.args.get('force_new', 'false').lower() == 'true'
     
     try:
-        if email_client.has_service and email_client.email_list != None:
-            email_list = email_client.email_list
-            profile = email_client.profile
-            user_email = profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            email_list = email_client.get_messages(max_results=100)
-            profile = email_client.profile
-            user_email = profile.get('emailAddress', 'Unknown')
+        email_client = get_email_client()
+        # Brings the restored or cached mail set up to date (a history delta when the checkpoint is fresh)
+        email_list = email_client.sync_messages(max_results=100)
+        profile = email_client.profile
+        user_email = profile.get('emailAddress', 'Unknown')
 
         # Validate email_list
         if not email_list or len(email_list) == 0:
@@ -180,7 +162,16 @@ def categorize():
         # Check if we have saved categories and user isn't forcing a new categorization
         # AND no new query is provided (if there's a new query, always generate new categories)
         if not force_new and not user_query and category_storage.has_saved_categories():
-            saved_data = category_storage.load_categories()
+            saved_data = category_storage.load_categories(message_store=email_client.message_store)
+            if saved_data and wants_json():
+                return jsonify({
+                    'categories': saved_data['categories'],
+                    'user_email': saved_data['user_email'],
+                    'total_emails': saved_data['email_count'],
+                    'query': saved_data.get('query', ''),
+                    'saved_at': saved_data.get('saved_at', ''),
+                    'is_saved': True
+                })
             if saved_data:
                 return render_template('categorize.html', 
                                      categories=saved_data['categories'],
@@ -190,241 +181,85 @@ def categorize():
                                      saved_at=saved_data.get('saved_at', ''),
                                      is_saved=True)
 
-        # Show loading page with immediate categorization
-        if request.args.get('loading') == 'true':
-            # This is the actual categorization request
-            print(f"[DEBUG] Starting categorization for {user_email}")
-            print(f"[DEBUG] Email count: {len(email_list)}")
-            print(f"[DEBUG] User query: '{user_query}'")
-            
-            # Call the categorization function directly
-            print(f"[DEBUG] Calling gen_categories...")
-            categories = gen_categories(email_list, user_query)
-            print(f"[DEBUG] gen_categories returned: {categories}")
-            
-            # Group emails by category
-            print(f"[DEBUG] Grouping emails by category...")
-            categorized_emails = {}
-            
-            for i, email in enumerate(email_list):
-                if i < len(categories):
-                    category = categories[i]
-                else:
-                    category = 'Others'
-                
-                if category not in categorized_emails:
-                    categorized_emails[category] = []
-                
-                categorized_emails[category].append(email)
-            
-            print(f"[DEBUG] Categorized emails: {list(categorized_emails.keys())}")
-            print(f"[DEBUG] Category counts: {[(k, len(v)) for k, v in categorized_emails.items()]}")
-            
-            # Render the categorize template with results
-            return render_template('categorize.html', 
-                                 categories=categorized_emails,
-                                 user_email=user_email,
-                                 total_emails=len(email_list),
-                                 query=user_query,
-                                 is_saved=False)
-        else:
-            # First request - show loading page
-            return render_template('categorize_loading.html',
-                                 user_email=user_email,
-                                 total_emails=len(email_list),
-                                 query=user_query)
+        # Categorize on the job pool; the loading page follows the job's progress
+        session_id = submit_categorization(email_list, user_query, user_email, category_storage,
+                                           incremental=not force_new)
+        if session_id is None:
+            message = 'Too many categorizations in progress for this account, please wait for them to finish.'
+            if wants_json():
+                return jsonify({'error': message}), 429
+            return f"{message} <a href='/inbox'>Go back</a>"
+        
+        if wants_json():
+            return jsonify({
+                'success': True,
+                'session_id': session_id,
+                'status': 'queued',
+                'user_email': user_email,
+                'total_emails': len(email_list),
+                'query': user_query
+            }), 202
+        return render_template('categorize_loading.html',
+                             session_id=session_id,
+                             user_email=user_email,
+                             total_emails=len(email_list),
+                             query=user_query)
 
     except Exception as e:
+        if wants_json():
+            return jsonify({'error': str(e)}), 500
         return f"Error during categorization: {str(e)} <a href='/inbox'>Go back</a>"
 
 @app.route('/api/categorize')
 def api_categorize():
-    """API endpoint to get categorized emails as JSON"""
+    """API endpoint to start a background categorization job"""
     if 'credentials' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
     user_query = request.args.get('query', '')
+    force_new = request.args.get('force_new', 'false').lower() == 'true'
     
     try:
-        if email_client.has_service and email_client.email_list != None:
-            email_list = email_client.email_list
-            profile = email_client.profile
-            user_email = profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            email_list = email_client.get_messages(max_results=100)
-            profile = email_client.profile
-            user_email = profile.get('emailAddress', 'Unknown')
+        email_client = get_email_client()
+        # Brings the restored or cached mail set up to date (a history delta when the checkpoint is fresh)
+        email_list = email_client.sync_messages(max_results=100)
+        profile = email_client.profile
+        user_email = profile.get('emailAddress', 'Unknown')
 
         if not email_list:
             return jsonify({'error': 'No emails found'}), 404
 
-        # Call the categorization function
-        categories = gen_categories(email_list, user_query)
-        
-        # Group emails by category
-        categorized_emails = {}
-        for i, email in enumerate(email_list):
-            category = categories[i] if i < len(categories) else 'Others'
-            if category not in categorized_emails:
-                categorized_emails[category] = []
-            categorized_emails[category].append(email)
+        # Queue the categorization and return straight away; poll /categorize_status/<session_id>
+        session_id = submit_categorization(email_list, user_query, user_email, CategoryStorage(user_email),
+                                           incremental=not force_new)
+        if session_id is None:
+            return jsonify({'error': 'Too many categorizations in progress for this account'}), 429
         
         return jsonify({
             'success': True,
-            'categories': categorized_emails,
+            'session_id': session_id,
+            'status': 'queued',
             'user_email': user_email,
             'total_emails': len(email_list),
             'query': user_query
-        })
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def categorize_emails_background(email_list, user_query, session_id, user_email, category_storage):
-    """Background function to categorize emails"""
-    try:
-        print(f"[DEBUG] Starting categorization for session {session_id}")
-        print(f"[DEBUG] Email count: {len(email_list)}")
-        print(f"[DEBUG] User query: '{user_query}'")
-        
-        # Update status to processing
-        categorization_status[session_id] = {
-            'status': 'processing',
-            'progress': 10,
-            'message': 'Starting email categorization...'
-        }
-        
-        # Call the categorization function
-        print(f"[DEBUG] Calling gen_categories...")
-        categories = gen_categories(email_list, user_query)
-        print(f"[DEBUG] gen_categories returned: {categories}")
-        
-        # Update progress
-        categorization_status[session_id] = {
-            'status': 'processing',
-            'progress': 70,
-            'message': 'Organizing emails into categories...'
-        }
-        
-        # Group emails by category
-        print(f"[DEBUG] Grouping emails by category...")
-        categorized_emails = {}
-        
-        for i, email in enumerate(email_list):
-            if i < len(categories):
-                category = categories[i]
-            else:
-                category = 'Others'
-            
-            if category not in categorized_emails:
-                categorized_emails[category] = []
-            
-            categorized_emails[category].append(email)
-        
-        print(f"[DEBUG] Categorized emails: {list(categorized_emails.keys())}")
-        print(f"[DEBUG] Category counts: {[(k, len(v)) for k, v in categorized_emails.items()]}")
-        
-        # Store results
-        categorization_results[session_id] = {
-            'categories': categorized_emails,
-            'user_email': user_email,
-            'total_emails': len(email_list),
-            'query': user_query
-        }
-        
-        # Don't save automatically - let user choose when to save
-        # category_storage.save_categories(final_classification, user_query)
-        
-        # Update status to complete
-        categorization_status[session_id] = {
-            'status': 'completed',
-            'progress': 100,
-            'message': 'Categorization completed successfully!'
-        }
-        
-        print(f"[DEBUG] Categorization completed successfully for session {session_id}")
-        
-    except IndexError as e:
-        print(f"[DEBUG] IndexError in categorization: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        
-        # Handle index error gracefully
-        categorization_status[session_id] = {
-            'status': 'index_error',
-            'progress': 100,
-            'message': 'Index error detected - proceeding with fallback categorization',
-            'redirect': True
-        }
-        
-        # Create a fallback categorization with all emails in one category
-        categorization_results[session_id] = {
-            'categories': {'All Emails': email_list},
-            'user_email': user_email,
-            'total_emails': len(email_list),
-            'query': user_query
-        }
-        
-    except Exception as e:
-        print(f"[DEBUG] Exception in categorization: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        
-        # Try simple categorization as fallback
-        try:
-            print(f"[DEBUG] Attempting fallback categorization...")
-            from utils import simple_categorize
-            categories = simple_categorize(email_list)
-            
-            # Group emails by category
-            categorized_emails = {}
-            for i, email in enumerate(email_list):
-                if i < len(categories):
-                    category = categories[i]
-                else:
-                    category = 'Others'
-                
-                if category not in categorized_emails:
-                    categorized_emails[category] = []
-                
-                categorized_emails[category].append(email)
-            
-            # Store fallback results
-            categorization_results[session_id] = {
-                'categories': categorized_emails,
-                'user_email': user_email,
-                'total_emails': len(email_list)
-            }
-            
-            categorization_status[session_id] = {
-                'status': 'completed',
-                'progress': 100,
-                'message': 'Categorization completed with fallback method'
-            }
-            
-            print(f"[DEBUG] Fallback categorization successful for session {session_id}")
-            
-        except Exception as fallback_error:
-            print(f"[DEBUG] Fallback categorization also failed: {str(fallback_error)}")
-            categorization_status[session_id] = {
-                'status': 'error',
-                'progress': 0,
-                'message': f'Error: {str(e)}'
-            }
-
 @app.route('/categorize_status/<session_id>')
 def categorize_status_check(session_id):
     """Check the status of categorization process"""
     try:
         print(f"[DEBUG] Status check for session: {session_id}")
-        status = categorization_status.get(session_id, {
-            'status': 'not_found',
-            'progress': 0,
-            'message': 'Session not found'
-        })
+        # Other users' jobs look the same as unknown ones
+        status = job_store.get_status(session_id) if owns_job(session_id) else None
+        if status is None:
+            return jsonify({
+                'status': 'not_found',
+                'progress': 0,
+                'message': 'Session not found'
+            }), 404
         print(f"[DEBUG] Status response: {status}")
         return jsonify(status)
     except Exception as e:
@@ -435,18 +270,30 @@ def categorize_status_check(session_id):
             'message': f'Status check error: {str(e)}'
         }), 500
 
+@app.route('/categorize_stream/<session_id>')
+def categorize_stream(session_id):
+    """Server-Sent Events: status transitions and per-batch partial results until the job finishes"""
+    if not owns_job(session_id):
+        return jsonify({'error': 'Session not found or expired'}), 404
+    
+    try:
+        last_id = int(request.headers.get('Last-Event-ID', -1))
+    except ValueError:
+        last_id = -1
+    
+    return Response(stream_job_events(session_id, last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/categorize_results/<session_id>')
 def categorize_results(session_id):
     """Get categorization results"""
-    if session_id in categorization_results:
-        results = categorization_results[session_id]
-        
+    results = job_store.get_result(session_id) if owns_job(session_id) else None
+    if results is not None:
         # Don't clean up stored data immediately - let the frontend handle cleanup
         # This allows for multiple requests to the same session
         
         # Check if this is an API request (from Next.js) or direct browser request
-        if request.headers.get('Accept', '').startswith('application/json') or \
-           'application/json' in request.headers.get('Content-Type', ''):
+        if wants_json():
             # Return JSON for API requests
             return jsonify({
                 'categories': results['categories'],
@@ -466,38 +313,6 @@ def categorize_results(session_id):
     else:
         return jsonify({'error': 'Session not found or expired'}), 404
 
-def cleanup_old_sessions(user_email, max_age_seconds=3600):
-    """Clean up old sessions to prevent memory leaks"""
-    current_time = int(time.time())
-    sessions_to_remove = []
-    
-    print(f"[DEBUG] Cleanup: Checking sessions for {user_email}, max age: {max_age_seconds}s")
-    print(f"[DEBUG] Current sessions: {list(categorization_status.keys())}")
-    
-    # Find old sessions for this user
-    for session_id in list(categorization_status.keys()):
-        if session_id.startswith(user_email):
-            try:
-                # Extract timestamp from session_id
-                session_time = int(session_id.split('_')[1])
-                age = current_time - session_time
-                print(f"[DEBUG] Session {session_id} age: {age}s")
-                if age > max_age_seconds:
-                    sessions_to_remove.append(session_id)
-                    print(f"[DEBUG] Marking session {session_id} for removal (too old)")
-            except (IndexError, ValueError) as e:
-                # If we can't parse the timestamp, remove the session
-                print(f"[DEBUG] Cannot parse session {session_id}: {e}")
-                sessions_to_remove.append(session_id)
-    
-    # Remove old sessions
-    print(f"[DEBUG] Removing {len(sessions_to_remove)} old sessions")
-    for session_id in sessions_to_remove:
-        if session_id in categorization_status:
-            del categorization_status[session_id]
-        if session_id in categorization_results:
-            del categorization_results[session_id]
-
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
@@ -505,7 +320,14 @@ def health_check():
         'status': 'healthy',
         'message': 'Flask backend is running',
         'authenticated': 'credentials' in session,
-        'session_keys': list(session.keys())
+        'session_keys': list(session.keys()),
+        'fetch_engine': fetch_engine.get_stats(),
+        'email_clients': client_registry.get_stats(),
+        'service_cache': service_cache.get_stats(),
+        'category_cache': get_category_cache().get_stats(),
+        'categorize_jobs': job_runner.get_stats(),
+        'job_events': job_events.get_stats(),
+        'job_store': job_store.get_stats()
     })
 
 @app.route('/api/debug')
@@ -535,14 +357,9 @@ def session_test():
     })
 
 @retry_on_ssl_error(max_retries=3, base_delay=1.0)
-def _fetch_emails_with_retry(email_client, max_results, query):
-    """Helper function to fetch emails with retry logic"""
-    return email_client.get_messages(max_results=max_results, query=query)
-
-@retry_on_ssl_error(max_retries=2, base_delay=0.5)
-def _get_user_profile_with_retry(service):
-    """Helper function to get user profile with retry logic"""
-    return service.users().getProfile(userId='me').execute()
+def _fetch_page_with_retry(email_client, cursor, page_size, query):
+    """Helper function to fetch a page of emails with retry logic (first page via the history delta)"""
+    return email_client.get_page(cursor=cursor, page_size=page_size, query=query)
 
 @app.route('/api/emails')
 def get_emails():
@@ -556,23 +373,26 @@ def get_emails():
     
     try:
         print("[DEBUG] /api/emails - Loading credentials from session")
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
-        email_client.add_service(service)
+        email_client = get_email_client()
         
-        # Get query parameters
-        max_results = request.args.get('max_results', 100, type=int)
+        # Get query parameters (max_results is the older name of page_size)
+        page_size = request.args.get('page_size', request.args.get('max_results', INBOX_PAGE_SIZE, type=int), type=int)
         query = request.args.get('q', '')
+        cursor = request.args.get('cursor')
         
-        print(f"[DEBUG] /api/emails - Fetching {max_results} emails")
-        email_list = _fetch_emails_with_retry(email_client, max_results, query)
+        print(f"[DEBUG] /api/emails - Fetching a page of {page_size} emails")
+        try:
+            email_list, next_cursor = _fetch_page_with_retry(email_client, cursor, page_size, query)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Get user profile for email address
         profile = email_client.profile
         user_email = profile.get('emailAddress', 'Unknown') if profile else 'Unknown'
         
         print(f"[DEBUG] /api/emails - Successfully fetched {len(email_list)} emails for {user_email}")
-        return jsonify({'emails': email_list, 'total': len(email_list), 'user_email': user_email})
+        return jsonify({'emails': email_list, 'total': len(email_list), 'user_email': user_email,
+                        'next_cursor': next_cursor, 'has_more': next_cursor is not None})
         
     except Exception as e:
         print(f"[DEBUG] /api/emails - Error: {str(e)}")
@@ -581,13 +401,9 @@ def get_emails():
         return jsonify({'error': str(e), 'debug': 'Exception occurred'}), 500
 
 @retry_on_ssl_error(max_retries=3, base_delay=1.0)
-def _fetch_email_with_retry(service, email_id):
-    """Helper function to fetch email with retry logic"""
-    return service.users().messages().get(
-        userId='me', 
-        id=email_id,
-        format='full'
-    ).execute()
+def _fetch_email_with_retry(email_client, email_id):
+    """Helper function to fetch a fully parsed email with retry logic (body loaded on first open)"""
+    return email_client.get_message(email_id)
 
 @retry_on_ssl_error(max_retries=2, base_delay=0.5)
 def _mark_email_read_with_retry(service, email_id):
@@ -610,22 +426,19 @@ def get_email_detail(email_id):
     
     try:
         print(f"[DEBUG] /api/email/{email_id} - Loading credentials from session")
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
-        email_client.add_service(service)
+        email_client = get_email_client()
+        service = email_client.service
         
         print(f"[DEBUG] /api/email/{email_id} - Fetching email details")
-        msg = _fetch_email_with_retry(service, email_id)
-        
-        print(f"[DEBUG] /api/email/{email_id} - Parsing email message")
-        email_data = email_client.parse_message(msg)
+        email_data = _fetch_email_with_retry(email_client, email_id)
         
         # Mark as read if it was unread
-        if 'UNREAD' in msg.get('labelIds', []):
+        if email_data.get('is_unread'):
             print(f"[DEBUG] /api/email/{email_id} - Marking email as read")
             try:
                 _mark_email_read_with_retry(service, email_id)
                 email_data['is_unread'] = False
+                email_data['labels'] = [label for label in email_data.get('labels', []) if label != 'UNREAD']
             except Exception as mark_read_error:
                 print(f"[WARNING] Failed to mark email as read: {str(mark_read_error)}")
                 # Don't fail the whole request if marking as read fails
@@ -649,9 +462,8 @@ def get_email_details(email_id):
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
-        email_client.add_service(service)
+        email_client = get_email_client()
+        service = email_client.service
         
         # Get the full email message
         msg = service.users().messages().get(
@@ -694,8 +506,7 @@ def mark_email_read(email_id):
     
     try:
         print(f"[DEBUG] /api/email/{email_id}/mark-read - Loading credentials from session")
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
+        service = service_cache.get_service(session['credentials'])
         
         print(f"[DEBUG] /api/email/{email_id}/mark-read - Marking email as read")
         # Remove the UNREAD label to mark as read
@@ -722,8 +533,7 @@ def mark_email_unread(email_id):
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
+        service = service_cache.get_service(session['credentials'])
         
         # Add the UNREAD label to mark as unread
         result = service.users().messages().modify(
@@ -749,8 +559,7 @@ def delete_email(email_id):
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
+        service = service_cache.get_service(session['credentials'])
         
         # Move email to trash (Gmail doesn't permanently delete via API by default)
         result = service.users().messages().trash(
@@ -775,8 +584,7 @@ def restore_email(email_id):
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
+        service = service_cache.get_service(session['credentials'])
         
         # Remove email from trash
         result = service.users().messages().untrash(
@@ -801,8 +609,7 @@ def star_email(email_id):
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
+        service = service_cache.get_service(session['credentials'])
         
         # Get current message to check if it's already starred
         msg = service.users().messages().get(userId='me', id=email_id).execute()
@@ -850,28 +657,29 @@ def load_inbox():
     
     try:
         print("[DEBUG] /api/load-inbox - Loading credentials from session")
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
-        email_client.add_service(service)
+        email_client = get_email_client()
         
         # Get user profile info
         print("[DEBUG] /api/load-inbox - Getting user profile")
-        profile = _get_user_profile_with_retry(service)
+        profile = email_client.profile
         user_email = profile.get('emailAddress', 'Unknown')
         
         # Get emails
         print("[DEBUG] /api/load-inbox - Getting emails")
-        if email_client.has_service and email_client.email_list!=None:
-            email_list = email_client.email_list
-        else:
-            email_list = _fetch_emails_with_retry(email_client, 50, '')
+        page_size = request.args.get('page_size', INBOX_PAGE_SIZE, type=int)
+        try:
+            email_list, next_cursor = _fetch_page_with_retry(email_client, request.args.get('cursor'), page_size, '')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         print(f"[DEBUG] /api/load-inbox - Successfully loaded {len(email_list)} emails for {user_email}")
         return jsonify({
             'success': True,
             'user_email': user_email,
             'emails': email_list,
-            'total_emails': len(email_list)
+            'total_emails': len(email_list),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
         })
         
     except Exception as e:
@@ -915,13 +723,8 @@ def chat_page():
         return redirect(url_for('login_page'))
     
     try:
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         return render_template('chat.html', user_email=user_email)
     except Exception as e:
@@ -962,10 +765,10 @@ def generate_reply():
         
         # Get user's name from email if available
         user_name = "there"  # Default
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', '')
-            if user_email and '@' in user_email:
-                user_name = user_email.split('@')[0].title()
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', '')
+        if user_email and '@' in user_email:
+            user_name = user_email.split('@')[0].title()
         
         # Create prompt for Gemini
         prompt = f"""You are an AI assistant helping to write email replies. Generate a {tone} reply to the following email:
@@ -1096,6 +899,7 @@ def authorized():
 
 @app.route('/logout')
 def logout():
+    session.pop('user_email', None)
     session.pop('credentials', None)
     session.pop('oauth_state', None)
     return redirect(url_for('login_page'))
@@ -1108,13 +912,8 @@ def save_categories():
     
     try:
         # Get user email
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         # Get categories from request
         data = request.get_json()
@@ -1148,13 +947,8 @@ def save_folders():
     
     try:
         # Get user email
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         # Get folders from request
         data = request.get_json()
@@ -1188,13 +982,8 @@ def load_saved_categories():
     
     try:
         # Get user email
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         # Initialize category storage and load
         category_storage = CategoryStorage(user_email)
@@ -1220,13 +1009,8 @@ def load_saved_folders():
     
     try:
         # Get user email
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         # Initialize category storage and load
         category_storage = CategoryStorage(user_email)
@@ -1246,6 +1030,46 @@ def load_saved_folders():
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
+def saved_changes(file_type):
+    """Append edits to the user's saved categories or folders, or list the logged ones"""
+    if 'credentials' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
+        category_storage = CategoryStorage(user_email)
+        
+        if request.method == 'GET':
+            changes, snapshot_seq = category_storage.get_changes(file_type, since=request.args.get('since', 0, type=int))
+            # Edits at or below snapshot_seq were compacted and are only in the saved data
+            return jsonify({'success': True, 'changes': changes, 'snapshot_seq': snapshot_seq})
+        
+        data = request.get_json() or {}
+        operations = data.get('operations', [])
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': 'operations must be a non-empty list', 'success': False}), 400
+        for operation in operations:
+            error = validate_operation(operation)
+            if error:
+                return jsonify({'error': error, 'success': False}), 400
+        
+        entries = category_storage.append_changes(file_type, operations)
+        return jsonify({'success': True, 'changes': entries})
+            
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@app.route('/api/category-changes', methods=['GET', 'POST'])
+def category_changes():
+    """Log edits (move_message, create, rename, delete) to the saved categories"""
+    return saved_changes('categories')
+
+@app.route('/api/folder-changes', methods=['GET', 'POST'])
+def folder_changes():
+    """Log edits (move_message, create, rename, delete) to the saved folders"""
+    return saved_changes('folders')
+
 @app.route('/api/has-saved-data')
 def has_saved_data():
     """Check if user has saved categories or folders"""
@@ -1254,13 +1078,8 @@ def has_saved_data():
     
     try:
         # Get user email
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         # Initialize category storage and check
         category_storage = CategoryStorage(user_email)
@@ -1288,15 +1107,10 @@ def chat_with_mail():
             return jsonify({'error': 'No query provided'}), 400
         
         # Load user's actual emails
-        if email_client.has_service and email_client.email_list != None:
-            emails = email_client.email_list
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            emails = email_client.get_messages(max_results=100)
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
+        email_client = get_email_client()
+        # Brings the restored or cached mail set up to date (a history delta when the checkpoint is fresh)
+        emails = email_client.sync_messages(max_results=100)
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         if not emails:
             return jsonify({'error': 'No emails found to analyze'}), 404
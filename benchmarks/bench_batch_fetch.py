@@ -0,0 +1,69 @@
+"""Compare EmailClient.get_messages fetch modes against FakeGmail.
+
+Modes: sequential gets, batched gets, per-message gets on a FetchEngine pool,
+and batches run in parallel on a FetchEngine pool.
+
+Usage: python benchmarks/bench_batch_fetch.py [--latency 0.02]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_gmail import FakeGmail, build_fake_service  # noqa: E402
+from fetch_engine import FetchEngine  # noqa: E402
+from utils import EmailClient  # noqa: E402
+
+MODES = {
+    'sequential': (False, False),
+    'batched': (True, False),
+    'pool': (False, True),
+    'batched+pool': (True, True),
+}
+
+
+def run(fake, count, mode, args):
+    use_batch, use_engine = MODES[mode]
+    # A fresh engine per run so every run starts with a full token bucket
+    engine = FetchEngine(max_workers=args.workers, quota_per_second=args.quota)
+    client = EmailClient(batch_uri=fake.batch_uri, fetch_engine=engine if use_engine else None)
+    client.use_batch = use_batch
+    client.add_service(build_fake_service(fake))
+    fake.reset_counters()
+
+    start = time.perf_counter()
+    emails = client.get_messages(max_results=count)
+    elapsed = time.perf_counter() - start
+
+    assert len(emails) == count, f'expected {count} emails, got {len(emails)}'
+    engine.shutdown()
+    return fake.round_trips, elapsed, engine.last_run if use_engine else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='simulated seconds per HTTP round trip')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--quota', type=float, default=250,
+                        help='per-user quota units per second for the pool')
+    args = parser.parse_args()
+
+    fake = FakeGmail(message_count=500, latency=args.latency).start()
+    try:
+        print(f'{"messages":>8} {"mode":>13} {"round trips":>12} {"wall (s)":>9} '
+              f'{"limiter (s)":>12} {"io (s)":>8}')
+        for count in (50, 100, 500):
+            for mode in MODES:
+                trips, elapsed, pool_run = run(fake, count, mode, args)
+                waited = f'{pool_run["limiter_wait_seconds"]:.3f}' if pool_run else '-'
+                io = f'{pool_run["io_seconds"]:.3f}' if pool_run else '-'
+                print(f'{count:>8} {mode:>13} {trips:>12} {elapsed:>9.3f} {waited:>12} {io:>8}')
+    finally:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Throughput and tail latency of gen_categories against a local stub model.
+
+Compares the old single-prompt approach (one call for the whole inbox) with
+the chunked engine at several pool sizes, then repeats the chunked run with a
+warm category cache.
+
+Usage: python benchmarks/bench_categorize.py [--emails 100 1000] [--output-limit 300]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from categorizer import CategorizationEngine  # noqa: E402
+from category_cache import CategoryCache  # noqa: E402
+from stub_model import StubModel, make_emails  # noqa: E402
+from utils import gen_categories, simple_categorize  # noqa: E402
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(emails, output_limit, workers, chunked, cache=None):
+    model = StubModel(max_output_lines=output_limit)
+    if chunked:
+        engine = CategorizationEngine(model=model, max_workers=workers, fallback=simple_categorize)
+    else:
+        engine = CategorizationEngine(model=model, max_workers=1, token_budget=10 ** 9,
+                                      max_chunk_emails=10 ** 9, fallback=simple_categorize, retries=0)
+    try:
+        start = time.perf_counter()
+        categories = gen_categories(emails, engine=engine, cache=cache or CategoryCache())
+        elapsed = time.perf_counter() - start
+        stats = engine.get_stats() if model.calls else None
+    finally:
+        engine.shutdown()
+
+    assert len(categories) == len(emails)
+    latencies = stats['chunk_latencies'] if stats else [0.0]
+    return {
+        'wall': elapsed,
+        'rate': len(emails) / elapsed,
+        'p50': statistics.median(latencies),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'chunks': stats['chunks'] if stats else 0,
+        'fallback': stats['fallback_chunks'] if stats else 0,
+        'categories': len(set(categories))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--emails', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+    parser.add_argument('--output-limit', type=int, default=300,
+                        help='max reply lines the stub returns, like a model output cap')
+    args = parser.parse_args()
+
+    print(f'{"emails":>6} {"mode":>12} {"chunks":>6} {"emails/s":>9} {"wall (s)":>9} '
+          f'{"p50 (s)":>8} {"p95 (s)":>8} {"p99 (s)":>8} {"fell back":>9} {"labels":>6}')
+    for count in args.emails:
+        emails = make_emails(count)
+        modes = [('single', 1, False)] + [(f'chunked x{w}', w, True) for w in args.workers]
+        for name, workers, chunked in modes:
+            report(count, name, run(emails, args.output_limit, workers, chunked))
+
+        cache = CategoryCache()
+        workers = args.workers[-1]
+        run(emails, args.output_limit, workers, True, cache)
+        cold = cache.get_stats()
+        report(count, 'cached', run(emails, args.output_limit, workers, True, cache))
+        warm = cache.get_stats()
+        hits = warm['memory_hits'] + warm['disk_hits'] - cold['memory_hits'] - cold['disk_hits']
+        print(f'{"":>6} warm-run cache hit rate {hits / count:.0%}')
+
+
+def report(count, name, r):
+    print(f'{count:>6} {name:>12} {r["chunks"]:>6} {r["rate"]:>9.1f} {r["wall"]:>9.2f} '
+          f'{r["p50"]:>8.2f} {r["p95"]:>8.2f} {r["p99"]:>8.2f} {r["fallback"]:>9} {r["categories"]:>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Prompt size with and without subject deduplication.
+
+Categorizes inboxes built from the recorded payload shapes in payloads.py and
+from a mix of typical notification subjects, once with every subject sent to
+the (stub) model and once with near-identical subjects collapsed, and reports
+the duplicate ratio, prompt tokens and model calls of each run.
+
+Usage: python benchmarks/bench_dedupe.py [--emails 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from categorizer import CategorizationEngine  # noqa: E402
+from payloads import SHAPES, corpus  # noqa: E402
+from stub_model import StubModel  # noqa: E402
+from utils import EmailClient  # noqa: E402
+
+NOTIFICATION_SUBJECTS = [
+    'Your order #{n} has shipped',
+    'Re: Project review notes for sprint {n}',
+    '[CI] Build {n} failed on main ({h})',
+    'Weekly digest - {d}',
+    'Your statement for {d} is ready',
+    'Invoice INV-{n} payment received',
+    'Meeting invite: standup {d} 9:30am',
+    'Fwd: Flight booking confirmation {h}',
+    'Security alert: new login from device {n}',
+    'Lunch on Friday?',
+    'Quick question about the {w} proposal',
+    'Photos from the {w} trip',
+]
+WORDS = ['budget', 'hiring', 'design', 'offsite', 'roadmap', 'launch', 'vendor', 'pricing']
+
+
+def recorded_inbox(count):
+    client = EmailClient()
+    per_shape = max(1, count // len(SHAPES))
+    return [client.parse_message(message) for message in corpus(per_shape)][:count]
+
+
+def notification_inbox(count):
+    rng = random.Random(3)
+    emails = []
+    for i in range(count):
+        subject = rng.choice(NOTIFICATION_SUBJECTS).format(
+            n=rng.randint(1, 99999), h=f'{rng.getrandbits(28):07x}', w=rng.choice(WORDS),
+            d=f'{rng.randint(1, 12)}/{rng.randint(1, 28)}/2025'
+        )
+        emails.append({'id': f'{i:016x}', 'subject': subject, 'snippet': ''})
+    return emails
+
+
+def run(emails, dedupe):
+    model = StubModel(base_latency=0.05, per_line_latency=0.001, tail_probability=0)
+    engine = CategorizationEngine(model=model, max_workers=4, dedupe=dedupe)
+    try:
+        start = time.perf_counter()
+        categories = engine.categorize(emails)
+        elapsed = time.perf_counter() - start
+        stats = engine.get_stats()
+    finally:
+        engine.shutdown()
+    return categories, stats, model.calls, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--emails', type=int, default=1000, help='emails per inbox')
+    args = parser.parse_args()
+
+    print(f'{"inbox":>14} {"mode":>8} {"unique":>7} {"dup ratio":>9} {"prompt tokens":>13} '
+          f'{"calls":>6} {"wall (s)":>9}')
+    for name, build in [('recorded', recorded_inbox), ('notifications', notification_inbox)]:
+        emails = build(args.emails)
+        baseline = None
+        for mode, dedupe in [('all', False), ('dedupe', True)]:
+            categories, stats, calls, elapsed = run(emails, dedupe)
+            assert len(categories) == len(emails)
+            baseline = baseline or stats['prompt_tokens']
+            print(f'{name:>14} {mode:>8} {stats["unique_subjects"]:>7} {stats["duplicate_ratio"]:>9.1%} '
+                  f'{stats["prompt_tokens"]:>13} {calls:>6} {elapsed:>9.2f}')
+        print(f'{"":>14} prompt tokens cut to {stats["prompt_tokens"] / baseline:.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark HTML-to-text extraction on large marketing emails.
+
+Compares the previous regex strip_html with the single-pass extractor in
+html_text.py, for full bodies and for short previews.
+
+Usage: python benchmarks/bench_html_text.py [--sizes 50000 250000 1000000] [--repeat 5]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from html import unescape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_text import html_to_text  # noqa: E402
+
+
+def legacy_strip_html(html_content):
+    """strip_html as it was before the single-pass extractor"""
+    if not html_content:
+        return ''
+    clean = re.compile('<.*?>')
+    text = re.sub(clean, '', html_content)
+    text = unescape(text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def marketing_email(size):
+    """Table-layout newsletter with inline CSS, a style block and tracking markup"""
+    style = ('<style type="text/css">' + '.c{color:#333;font-family:Helvetica,Arial,sans-serif}'
+             '@media only screen and (max-width:600px){.col{width:100%!important}}' * 40 + '</style>')
+    head = f'<head><meta charset="utf-8"><title>Summer sale</title>{style}</head>'
+    card = ('<tr><td class="col" style="padding:12px 24px;border-bottom:1px solid #eee">'
+            '<a href="https://shop.example.com/p/1234?utm_source=email&amp;utm_medium=newsletter">'
+            '<img src="https://cdn.example.com/i/1234.jpg" width="120" alt="Linen shirt"></a></td>'
+            '<td class="col" style="padding:12px"><h3 style="margin:0">Linen shirt &ndash; 40% off</h3>'
+            '<p style="margin:4px 0">Breathable, relaxed fit.&nbsp;Now&nbsp;$29.99</p></td></tr>\n')
+    cards = card * max(1, (size - len(head)) // len(card))
+    script = '<script type="application/ld+json">{"@context":"http://schema.org","@type":"EmailMessage"}</script>'
+    return (f'<!DOCTYPE html><html>{head}<body><!-- preheader -->{script}'
+            f'<table width="600" cellpadding="0" cellspacing="0">{cards}</table>'
+            f'<p>Unsubscribe &middot; View in browser</p></body></html>')
+
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50000, 250000, 1000000],
+                        help='HTML body sizes in bytes')
+    parser.add_argument('--preview', type=int, default=200, help='preview length in characters')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"size (KiB)":>10} {"legacy (ms)":>12} {"full (ms)":>10} {"preview (ms)":>13} '
+          f'{"legacy chars":>13} {"text chars":>11} {"CSS leaked":>11}')
+    for size in args.sizes:
+        html = marketing_email(size)
+        old_time, old_text = best_of(lambda: legacy_strip_html(html), args.repeat)
+        new_time, new_text = best_of(lambda: html_to_text(html), args.repeat)
+        preview_time, preview = best_of(lambda: html_to_text(html, args.preview), args.repeat)
+        assert new_text.startswith(preview), 'preview must be a prefix of the full text'
+        print(f'{len(html) / 1024:>10.0f} {old_time * 1000:>12.1f} {new_time * 1000:>10.1f} '
+              f'{preview_time * 1000:>13.3f} {len(old_text):>13} {len(new_text):>11} '
+              f'{str("font-family" in old_text) + "/" + str("font-family" in new_text):>11}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Scaling of the keyword fallback (simple_categorize) with inbox size.
+
+Times the compiled KeywordRuleEngine over subject, sender and snippet against
+the previous chained substring scans over the subject only, and against the
+same rules as one compiled alternation regex, at growing inbox sizes, so
+per-email cost can be checked for linear scaling.
+
+Usage: python benchmarks/bench_keyword_rules.py [--sizes 1000 10000 100000] [--rules 0]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_rules import DEFAULT_RULES, WORD_RE, KeywordRuleEngine  # noqa: E402
+from stub_model import make_emails  # noqa: E402
+
+SENDERS = ['LinkedIn', 'Acme Bank', 'GitHub', 'Team Calendar', 'Weekly Digest', 'Jane Doe', 'Store Updates']
+SNIPPETS = [
+    'Your statement is ready to view online',
+    'Reminder: the deadline for the project is Friday',
+    'Someone mentioned you in a comment',
+    'Thanks for your order, it will ship soon',
+    'Here is the agenda for tomorrow',
+]
+
+
+def legacy_simple_categorize(emails):
+    """simple_categorize as it was before the compiled rule engine"""
+    categories = []
+    for email in emails:
+        subject = email.get("subject", "").lower()
+        if any(word in subject for word in ["meeting", "calendar", "appointment", "schedule"]):
+            categories.append("Meetings")
+        elif any(word in subject for word in ["project", "task", "deadline", "work", "team"]):
+            categories.append("Work")
+        elif any(word in subject for word in ["newsletter", "news", "update", "weekly", "daily"]):
+            categories.append("Newsletters")
+        elif any(word in subject for word in ["bill", "payment", "invoice", "bank", "statement"]):
+            categories.append("Finance")
+        elif any(word in subject for word in ["security", "alert", "login", "password", "verification"]):
+            categories.append("Security")
+        elif any(word in subject for word in ["social", "facebook", "twitter", "linkedin", "instagram"]):
+            categories.append("Social")
+        else:
+            categories.append("Others")
+    return categories
+
+
+class AlternationEngine(KeywordRuleEngine):
+    """The same rules as one regex alternation, one named group per rule, tried at every word start"""
+
+    def __init__(self, rules):
+        super().__init__(rules)
+        groups = []
+        for index, (_, keywords) in enumerate(self.rules):
+            alternatives = []
+            for keyword in keywords:
+                keyword = keyword.strip().lower()
+                tokens = WORD_RE.findall(keyword)
+                if tokens:
+                    body = r'\W+'.join(re.escape(token) for token in tokens)
+                    alternatives.append(body if keyword.endswith('*') else body + r'\b')
+            if alternatives:
+                groups.append(f'(?P<r{index}>{"|".join(alternatives)})')
+        # Zero-width, so a match never hides a higher-priority one overlapping it
+        self.pattern = re.compile(r'\b(?=' + '|'.join(groups) + ')')
+
+    def match_text(self, text):
+        best = None
+        for match in self.pattern.finditer(text.lower()):
+            index = int(match.lastgroup[1:])
+            if best is None or index < best:
+                best = index
+                if best == 0:
+                    return best
+        return best
+
+
+def make_inbox(count):
+    rng = random.Random(2)
+    emails = make_emails(count)
+    for email in emails:
+        email['sender'] = rng.choice(SENDERS)
+        email['snippet'] = rng.choice(SNIPPETS)
+    return emails
+
+
+def extra_rules(count):
+    """count synthetic user rules of five keywords each, ahead of the defaults"""
+    return [(f'Custom {i}', [f'keyword{i}x{j}*' for j in range(5)]) for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='inbox sizes')
+    parser.add_argument('--rules', type=int, default=0, help='extra user rules to compile in')
+    args = parser.parse_args()
+
+    rules = extra_rules(args.rules) + DEFAULT_RULES
+    engine = KeywordRuleEngine(rules)
+    alternation = AlternationEngine(rules)
+    print(f'{"emails":>8} {"legacy (s)":>11} {"regex (s)":>10} {"engine (s)":>11} {"engine us/email":>16}')
+    for size in args.sizes:
+        emails = make_inbox(size)
+
+        start = time.perf_counter()
+        legacy_simple_categorize(emails)
+        legacy = time.perf_counter() - start
+
+        start = time.perf_counter()
+        expected = alternation.categorize(emails)
+        regex = time.perf_counter() - start
+
+        start = time.perf_counter()
+        categories = engine.categorize(emails)
+        elapsed = time.perf_counter() - start
+        assert categories == expected
+
+        print(f'{size:>8} {legacy:>11.3f} {regex:>10.3f} {elapsed:>11.3f} {elapsed / size * 1e6:>16.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Compare bytes on the wire and parse time for full vs metadata list fetches.
+
+Usage: python benchmarks/bench_list_format.py [--html-size 40000]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_gmail import FakeGmail, build_fake_service  # noqa: E402
+from utils import EmailClient  # noqa: E402
+
+
+def run(fake, count, list_format):
+    client = EmailClient(batch_uri=fake.batch_uri)
+    client.list_format = list_format
+    client.add_service(build_fake_service(fake))
+    fake.reset_counters()
+
+    # Time parsing separately from the transfer
+    parse_time = 0.0
+    parse_message = client.parse_message
+
+    def timed_parse(*args, **kwargs):
+        nonlocal parse_time
+        start = time.perf_counter()
+        try:
+            return parse_message(*args, **kwargs)
+        finally:
+            parse_time += time.perf_counter() - start
+
+    client.parse_message = timed_parse
+
+    start = time.perf_counter()
+    emails = client.get_messages(max_results=count)
+    elapsed = time.perf_counter() - start
+
+    assert len(emails) == count, f'expected {count} emails, got {len(emails)}'
+    return fake.bytes_sent, parse_time, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--html-size', type=int, default=40000,
+                        help='approximate HTML body size per message in bytes')
+    args = parser.parse_args()
+
+    fake = FakeGmail(message_count=500, html_size=args.html_size).start()
+    try:
+        print(f'{"messages":>8} {"format":>9} {"KiB":>9} {"parse (ms)":>11} {"wall (s)":>9}')
+        for count in (50, 100, 500):
+            for list_format in ('full', 'metadata'):
+                sent, parse_time, elapsed = run(fake, count, list_format)
+                print(f'{count:>8} {list_format:>9} {sent / 1024:>9.0f} '
+                      f'{parse_time * 1000:>11.1f} {elapsed:>9.3f}')
+    finally:
+        fake.stop()
+
+
+if __name__ == '__main__':
+    main()
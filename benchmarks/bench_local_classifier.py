@@ -0,0 +1,51 @@
+"""Training cost, throughput and accuracy of the local classifier.
+
+Labels a synthetic inbox with the stub model's categories (standing in for
+saved LLM labels), trains LocalClassifier on part of it and classifies the
+rest, reporting how many emails it answers confidently and how often those
+answers agree with the model.
+
+Usage: python benchmarks/bench_local_classifier.py [--train 2000] [--emails 20000] [--threshold 0.9]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_classifier import LocalClassifier  # noqa: E402
+from stub_model import KEYWORD_CATEGORIES, StubModel, make_emails  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--train', type=int, default=2000, help='labelled emails to train on')
+    parser.add_argument('--emails', type=int, default=20000, help='emails to classify')
+    parser.add_argument('--threshold', type=float, default=0.9, help='confidence needed to answer locally')
+    args = parser.parse_args()
+
+    model = StubModel()
+    vocabulary = {spellings[0] for _, spellings in KEYWORD_CATEGORIES}
+    emails = make_emails(args.train + args.emails)
+    labels = [model.pick_category(email['subject'], vocabulary) for email in emails]
+    train, test = emails[:args.train], emails[args.train:]
+
+    classifier = LocalClassifier(threshold=args.threshold).fit(train, labels[:args.train])
+
+    start = time.perf_counter()
+    answered, uncertain = classifier.classify(test)
+    elapsed = time.perf_counter() - start
+
+    expected = labels[args.train:]
+    correct = sum(1 for index, category in answered.items() if category == expected[index])
+    print(f'trained on {args.train} emails in {classifier.get_stats()["train_seconds"] * 1000:.1f} ms')
+    print(f'classified {len(test)} emails in {elapsed:.3f}s ({len(test) / elapsed:,.0f} emails/s)')
+    print(f'confident: {len(answered)} ({len(answered) / len(test):.1%}), '
+          f'sent to the model: {len(uncertain)}')
+    if answered:
+        print(f'agreement with model labels on confident answers: {correct / len(answered):.1%}')
+
+
+if __name__ == '__main__':
+    main()
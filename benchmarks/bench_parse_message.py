@@ -0,0 +1,130 @@
+"""Micro-benchmark EmailClient.parse_message against the previous recursive parser.
+
+Runs both parsers over the recorded payload shapes in payloads.py and checks
+that they extract the same headers and bodies.
+
+Usage: python benchmarks/bench_parse_message.py [--per-shape 200] [--repeat 5]
+"""
+import argparse
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from payloads import SHAPES, corpus  # noqa: E402
+from utils import EmailClient  # noqa: E402
+
+
+class LegacyEmailClient(EmailClient):
+    """parse_message as it was before the single-pass walker"""
+
+    def parse_message(self, message, include_html=False, headers_only=False):
+        headers = message['payload'].get('headers', [])
+        subject = self.get_header(headers, 'Subject') or '(No Subject)'
+        sender = self.clean_sender(self.get_header(headers, 'From') or 'Unknown Sender')
+        date = self.get_header(headers, 'Date') or ''
+        to = self.get_header(headers, 'To') or ''
+        body_data = self.get_body_content(message['payload'])
+        labels = message.get('labelIds', [])
+        result = {
+            'id': message['id'],
+            'subject': subject,
+            'sender': sender,
+            'date': self.parse_date(date),
+            'to': to,
+            'body': body_data['plain_text'],
+            'content': body_data['plain_text'],
+            'is_unread': 'UNREAD' in labels,
+            'snippet': self.clean_snippet(message.get('snippet', '')),
+            'labels': labels,
+            'timestamp': int(message.get('internalDate', 0)) / 1000,
+            'body_loaded': True
+        }
+        if body_data['html_content']:
+            result['html_body'] = body_data['html_content']
+        return result
+
+    def get_body_content(self, payload):
+        plain_text = ""
+        html_content = ""
+
+        def extract_content_from_part(part):
+            plain = ""
+            html = ""
+            if part.get('mimeType') == 'text/plain':
+                if 'data' in part.get('body', {}):
+                    plain = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
+            elif part.get('mimeType') == 'text/html':
+                if 'data' in part.get('body', {}):
+                    html = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
+            elif 'parts' in part:
+                for subpart in part['parts']:
+                    sub_plain, sub_html = extract_content_from_part(subpart)
+                    if sub_plain and not plain:
+                        plain = sub_plain
+                    if sub_html and not html:
+                        html = sub_html
+            return plain, html
+
+        if 'parts' in payload:
+            for part in payload['parts']:
+                part_plain, part_html = extract_content_from_part(part)
+                if part_plain and not plain_text:
+                    plain_text = part_plain
+                if part_html and not html_content:
+                    html_content = part_html
+        elif payload.get('body', {}).get('data'):
+            content = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8', errors='ignore')
+            if payload.get('mimeType') == 'text/html':
+                html_content = content
+                plain_text = self.strip_html(content)
+            else:
+                plain_text = content
+
+        if html_content and not plain_text:
+            plain_text = self.strip_html(html_content)
+        if plain_text and not html_content and '<' in plain_text and '>' in plain_text:
+            html_content = plain_text
+        return {
+            'plain_text': plain_text.strip(),
+            'html_content': html_content.strip() if html_content else None
+        }
+
+
+def best_of(client, messages, repeat):
+    """Best wall time over `repeat` passes, in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in messages:
+            client.parse_message(message)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--per-shape', type=int, default=200, help='messages per payload shape')
+    parser.add_argument('--repeat', type=int, default=5, help='passes per measurement (best is kept)')
+    args = parser.parse_args()
+
+    legacy = LegacyEmailClient()
+    current = EmailClient()
+
+    messages = corpus(args.per_shape)
+    for message in messages:
+        assert legacy.parse_message(message) == current.parse_message(message), message['id']
+
+    print(f'{"shape":>24} {"legacy (us)":>12} {"current (us)":>13} {"speedup":>8}')
+    groups = [(name, [build(i) for i in range(args.per_shape)]) for name, build in SHAPES.items()]
+    for name, group in groups + [('all', messages)]:
+        old = best_of(legacy, group, args.repeat) / len(group) * 1e6
+        new = best_of(current, group, args.repeat) / len(group) * 1e6
+        print(f'{name:>24} {old:>12.1f} {new:>13.1f} {old / new:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Save/load time and size on disk of saved category snapshots.
+
+Saves a grouping of synthetic messages through CategoryStorage in the JSON
+format and in the compact snapshot format with each available codec, then
+times a cold load (parse cache cleared) of each. The first row is the format
+from before message IDs were stored: full emails written with indent=2.
+zstd and orjson are used when installed.
+
+Usage: python benchmarks/bench_snapshot_format.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snapshot_format  # noqa: E402
+import utils  # noqa: E402
+from utils import CategoryStorage  # noqa: E402
+
+CATEGORIES = ['Work', 'Finance', 'Newsletters', 'Social', 'Security', 'Meetings', 'Others']
+SENDERS = ['LinkedIn <messages-noreply@linkedin.com>', 'Acme Bank <alerts@acmebank.com>',
+           'GitHub <notifications@github.com>', 'Jane Doe <jane.doe@example.com>']
+BODY = 'Hi there, here is the latest on the project and a few links you might find useful. ' * 20
+
+
+def make_grouping(count):
+    rng = random.Random(4)
+    categories = {name: [] for name in CATEGORIES}
+    for i in range(count):
+        categories[rng.choice(CATEGORIES)].append({
+            'id': f'{rng.getrandbits(64):016x}',
+            'subject': f'Update {i} on the quarterly roadmap review',
+            'sender': rng.choice(SENDERS),
+            'date': f'{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/2025 09:{rng.randint(0, 59):02d} AM',
+            'snippet': BODY[:180],
+            'content': BODY[:200],
+            'body': BODY,
+            'html_body': f'<html><body><p>{BODY}</p></body></html>',
+        })
+    return categories
+
+
+def time_legacy(categories):
+    path = 'legacy_categories.json'
+    data = {'user_email': 'bench@example.com', 'categories': categories, 'query': '',
+            'email_count': sum(len(emails) for emails in categories.values())}
+    start = time.perf_counter()
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    save = time.perf_counter() - start
+    start = time.perf_counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        json.load(f)
+    load = time.perf_counter() - start
+    return save, load, os.path.getsize(path)
+
+
+def time_storage(categories, compact, codec):
+    utils.CATEGORY_SNAPSHOT_CODEC = codec
+    storage = CategoryStorage('bench@example.com', snapshot_format='compact' if compact else 'json')
+    start = time.perf_counter()
+    assert storage.save_categories(categories)
+    save = time.perf_counter() - start
+
+    utils._storage_cache.clear()
+    start = time.perf_counter()
+    loaded = storage.load_categories()
+    load = time.perf_counter() - start
+    assert loaded['email_count'] == sum(len(emails) for emails in categories.values())
+    return save, load, os.path.getsize(storage.get_snapshot_path('categories'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='messages per grouping')
+    args = parser.parse_args()
+
+    formats = [('json', False, None), ('compact', True, 'none'), ('compact+gzip', True, 'gzip')]
+    if snapshot_format.zstandard is not None:
+        formats.append(('compact+zstd', True, 'zstd'))
+    print(f'serializer: {"orjson" if snapshot_format.orjson is not None else "json"}')
+    print(f'{"messages":>9} {"format":>14} {"save (s)":>9} {"load (s)":>9} {"size (KB)":>10}')
+
+    os.chdir(tempfile.mkdtemp(prefix='bench_snapshot_'))
+    for size in args.sizes:
+        categories = make_grouping(size)
+        save, load, nbytes = time_legacy(categories)
+        print(f'{size:>9} {"legacy json":>14} {save:>9.3f} {load:>9.3f} {nbytes / 1024:>10.0f}')
+        for name, compact, codec in formats:
+            save, load, nbytes = time_storage(categories, compact, codec)
+            print(f'{size:>9} {name:>14} {save:>9.3f} {load:>9.3f} {nbytes / 1024:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
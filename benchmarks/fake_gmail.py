@@ -0,0 +1,224 @@
+"""Local fake of the Gmail REST endpoints used by EmailClient.
+
+Serves getProfile, messages.list, messages.get, history.list and the
+/batch/gmail/v1 multipart batch endpoint from an in-memory mailbox, with an
+optional per-round-trip latency so fetch strategies can be compared offline.
+"""
+import base64
+import json
+import threading
+import time
+from email.parser import Parser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+def _encode(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def make_message(index, html_size=0):
+    """Build a Gmail API message resource with a multipart/alternative body"""
+    message_id = f'{index:016x}'
+    plain = f'Hello,\n\nThis is message number {index}.\n\nThanks,\nSender {index % 17}'
+    filler = '<tr><td style="padding:8px;font-family:Arial">Deals of the week</td></tr>' * (html_size // 70)
+    html = (f'<html><body><p>Hello,</p><p>This is message <b>number {index}</b>.</p>'
+            f'<table>{filler}</table></body></html>')
+    return {
+        'id': message_id,
+        'threadId': message_id,
+        'labelIds': ['INBOX', 'UNREAD'] if index % 3 == 0 else ['INBOX'],
+        'snippet': f'Hello, This is message number {index}.',
+        'historyId': str(1000 + index),
+        'internalDate': str(1750000000000 - index * 60000),
+        'sizeEstimate': 2048,
+        'payload': {
+            'mimeType': 'multipart/alternative',
+            'headers': [
+                {'name': 'Subject', 'value': f'Weekly update #{index}'},
+                {'name': 'From', 'value': f'"Sender {index % 17}" <sender{index % 17}@example.com>'},
+                {'name': 'To', 'value': 'me@example.com'},
+                {'name': 'Date', 'value': 'Sat, 21 Jun 2025 22:09:00 -0700'},
+            ],
+            'body': {'size': 0},
+            'parts': [
+                {'partId': '0', 'mimeType': 'text/plain', 'filename': '',
+                 'body': {'size': len(plain), 'data': _encode(plain)}},
+                {'partId': '1', 'mimeType': 'text/html', 'filename': '',
+                 'body': {'size': len(html), 'data': _encode(html)}},
+            ],
+        },
+    }
+
+
+class FakeGmail:
+    """In-memory Gmail backend served over HTTP on localhost"""
+
+    def __init__(self, message_count=500, latency=0.0, html_size=0):
+        self.messages = [make_message(i, html_size) for i in range(message_count)]
+        self.by_id = {m['id']: m for m in self.messages}
+        self.history_id = 1000 + message_count
+        self.history = []
+        self.latency = latency
+        self.round_trips = 0
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/'
+
+    @property
+    def batch_uri(self):
+        return self.base_url + 'batch/gmail/v1'
+
+    def start(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake._count()
+                status, body = fake.handle_get(self.path)
+                self._send(status, 'application/json', body)
+
+            def do_POST(self):
+                fake._count()
+                length = int(self.headers.get('Content-Length', 0))
+                payload = self.rfile.read(length).decode('utf-8')
+                boundary, body = fake.handle_batch(self.headers['Content-Type'], payload)
+                self._send(200, f'multipart/mixed; boundary={boundary}', body)
+
+            def _send(self, status, content_type, body):
+                data = body.encode('utf-8')
+                with fake.lock:
+                    fake.bytes_sent += len(data)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def reset_counters(self):
+        with self.lock:
+            self.round_trips = 0
+            self.bytes_sent = 0
+
+    def _count(self):
+        with self.lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _record(self, **change):
+        self.history_id += 1
+        self.history.append(dict(id=str(self.history_id), **change))
+
+    def add_message(self):
+        """Deliver a new message to the top of the mailbox"""
+        message = make_message(len(self.by_id) + 1000000)
+        self.messages.insert(0, message)
+        self.by_id[message['id']] = message
+        self._record(messagesAdded=[{'message': {'id': message['id'], 'labelIds': message['labelIds']}}])
+        return message
+
+    def delete_message(self, message_id):
+        message = self.by_id.pop(message_id)
+        self.messages.remove(message)
+        self._record(messagesDeleted=[{'message': {'id': message_id}}])
+
+    def mark_read(self, message_id):
+        message = self.by_id[message_id]
+        message['labelIds'] = [label for label in message['labelIds'] if label != 'UNREAD']
+        self._record(labelsRemoved=[{'message': {'id': message_id, 'labelIds': message['labelIds']},
+                                     'labelIds': ['UNREAD']}])
+
+    def handle_get(self, path):
+        """Serve a single GET call against the Gmail users resource"""
+        parts = urlsplit(path)
+        params = parse_qs(parts.query)
+        segments = parts.path.strip('/').split('/')
+        # gmail/v1/users/me/{profile,history,messages[/<id>]}
+        if segments[-1] == 'profile':
+            return 200, json.dumps({
+                'emailAddress': 'me@example.com',
+                'messagesTotal': len(self.messages),
+                'historyId': str(self.history_id),
+            })
+        if segments[-1] == 'history':
+            start = int(params['startHistoryId'][0])
+            records = [record for record in self.history if int(record['id']) > start]
+            return 200, json.dumps({'history': records, 'historyId': str(self.history_id)})
+        if segments[-1] == 'messages':
+            max_results = int(params.get('maxResults', ['100'])[0])
+            offset = int(params.get('pageToken', ['0'])[0])
+            matching = self.messages
+            # Only the before:<epoch seconds> search operator is understood
+            for term in params.get('q', [''])[0].split():
+                if term.startswith('before:'):
+                    before_ms = int(term[len('before:'):]) * 1000
+                    matching = [m for m in matching if int(m['internalDate']) < before_ms]
+            page = matching[offset:offset + max_results]
+            listed = [{'id': m['id'], 'threadId': m['threadId']} for m in page]
+            response = {'messages': listed, 'resultSizeEstimate': len(matching)}
+            if offset + max_results < len(matching):
+                response['nextPageToken'] = str(offset + max_results)
+            return 200, json.dumps(response)
+        message = self.by_id.get(segments[-1])
+        if message is None:
+            return 404, json.dumps({'error': {'code': 404, 'message': 'Not Found'}})
+        if params.get('format') == ['metadata']:
+            wanted = {name.lower() for name in params.get('metadataHeaders', [])}
+            headers = [h for h in message['payload']['headers'] if h['name'].lower() in wanted]
+            message = dict(message, payload={'mimeType': message['payload']['mimeType'], 'headers': headers})
+        return 200, json.dumps(message)
+
+    def handle_batch(self, content_type, payload):
+        """Answer each application/http part of a multipart/mixed batch"""
+        request = Parser().parsestr(f'Content-Type: {content_type}\r\n\r\n{payload}')
+        boundary = 'batch_fake_gmail'
+        chunks = []
+        for part in request.get_payload():
+            request_line = part.get_payload().splitlines()[0]
+            path = request_line.split(' ')[1]
+            status, body = self.handle_get(path)
+            reason = 'OK' if status == 200 else 'Not Found'
+            content_id = part['Content-ID'].replace('<', '<response-', 1)
+            chunks.append(
+                f'--{boundary}\r\n'
+                f'Content-Type: application/http\r\n'
+                f'Content-ID: {content_id}\r\n\r\n'
+                f'HTTP/1.1 {status} {reason}\r\n'
+                f'Content-Type: application/json; charset=UTF-8\r\n\r\n'
+                f'{body}\r\n'
+            )
+        chunks.append(f'--{boundary}--\r\n')
+        return boundary, ''.join(chunks)
+
+
+def build_fake_service(fake):
+    """Build a Gmail API resource that talks to the fake server"""
+    import httplib2
+    from googleapiclient.discovery import build
+
+    return build(
+        'gmail', 'v1',
+        http=httplib2.Http(),
+        static_discovery=True,
+        client_options={'api_endpoint': fake.base_url}
+    )
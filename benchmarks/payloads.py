@@ -0,0 +1,150 @@
+"""Gmail API message resources in the shapes real mailboxes produce.
+
+Structures follow messages recorded from users.messages.get(format='full'):
+relay-heavy header blocks, nested multipart/mixed > related > alternative
+trees, inline images and attachments referenced by attachmentId, and
+forwarded message/rfc822 parts. Bodies are synthetic.
+"""
+import base64
+
+
+def _encode(text):
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+
+def _headers(index, subject, relays=3):
+    headers = []
+    for hop in range(relays):
+        headers.append({'name': 'Received', 'value': (
+            f'from mail-relay{hop}.example.net (mail-relay{hop}.example.net. [203.0.113.{hop}]) '
+            f'by mx.google.com with ESMTPS id x{index}si{hop}.2025.06.21.22.09.00 '
+            f'for <me@example.com> (version=TLS1_3 cipher=TLS_AES_256_GCM_SHA384 bits=256/256); '
+            f'Sat, 21 Jun 2025 22:09:0{hop} -0700 (PDT)')})
+    headers += [
+        {'name': 'ARC-Seal', 'value': 'i=1; a=rsa-sha256; t=1750568940; cv=none; d=google.com; s=arc-20240605; b=' + 'A' * 340},
+        {'name': 'ARC-Message-Signature', 'value': 'i=1; a=rsa-sha256; c=relaxed/relaxed; d=google.com; bh=' + 'B' * 300},
+        {'name': 'ARC-Authentication-Results', 'value': 'i=1; mx.google.com; dkim=pass header.i=@example.com; spf=pass'},
+        {'name': 'Return-Path', 'value': f'<bounce-{index}@mailer.example.com>'},
+        {'name': 'Received-SPF', 'value': 'pass (google.com: domain of mailer.example.com designates 203.0.113.7 as permitted sender)'},
+        {'name': 'Authentication-Results', 'value': 'mx.google.com; dkim=pass header.i=@example.com; spf=pass; dmarc=pass'},
+        {'name': 'DKIM-Signature', 'value': 'v=1; a=rsa-sha256; c=relaxed/relaxed; d=example.com; s=s1; b=' + 'C' * 340},
+        {'name': 'MIME-Version', 'value': '1.0'},
+        {'name': 'Date', 'value': 'Sat, 21 Jun 2025 22:09:00 -0700 (PDT)'},
+        {'name': 'From', 'value': f'"Store Updates {index % 11}" <news{index % 11}@mailer.example.com>'},
+        {'name': 'To', 'value': 'me@example.com'},
+        {'name': 'Message-ID', 'value': f'<{index}.abcdef@mailer.example.com>'},
+        {'name': 'Subject', 'value': subject},
+        {'name': 'List-Unsubscribe', 'value': f'<https://mailer.example.com/u/{index}>'},
+        {'name': 'Content-Type', 'value': 'multipart/alternative; boundary="000000000000abcdef"'},
+    ]
+    return headers
+
+
+def _text(part_id, text):
+    return {'partId': part_id, 'mimeType': 'text/plain', 'filename': '',
+            'headers': [{'name': 'Content-Type', 'value': 'text/plain; charset="UTF-8"'}],
+            'body': {'size': len(text), 'data': _encode(text)}}
+
+
+def _html(part_id, html):
+    return {'partId': part_id, 'mimeType': 'text/html', 'filename': '',
+            'headers': [{'name': 'Content-Type', 'value': 'text/html; charset="UTF-8"'}],
+            'body': {'size': len(html), 'data': _encode(html)}}
+
+
+def _attachment(part_id, filename, mime_type, size):
+    return {'partId': part_id, 'mimeType': mime_type, 'filename': filename,
+            'headers': [{'name': 'Content-Disposition', 'value': f'attachment; filename="{filename}"'}],
+            'body': {'attachmentId': 'ANGjdJ' + 'x' * 120, 'size': size}}
+
+
+def _container(part_id, mime_type, parts):
+    return {'partId': part_id, 'mimeType': mime_type, 'filename': '', 'headers': [],
+            'body': {'size': 0}, 'parts': parts}
+
+
+def _message(index, subject, payload):
+    payload = dict(payload, headers=_headers(index, subject))
+    return {
+        'id': f'{index:016x}',
+        'threadId': f'{index:016x}',
+        'labelIds': ['INBOX', 'CATEGORY_PROMOTIONS'],
+        'snippet': f'Message {index} preview text',
+        'internalDate': str(1750568940000 - index * 60000),
+        'payload': payload,
+    }
+
+
+def _bodies(index, html_size):
+    plain = f'Hi there,\n\nYour weekly summary #{index} is ready.\n\nThanks,\nThe team'
+    rows = '<tr><td style="padding:8px">Item</td><td>$9.99</td></tr>' * (html_size // 55)
+    html = (f'<html><head><style>td {{ color: #333; }}</style></head><body>'
+            f'<p>Hi there,</p><p>Your weekly summary #{index} is ready.</p>'
+            f'<table>{rows}</table></body></html>')
+    return plain, html
+
+
+def plain_only(index):
+    plain, _ = _bodies(index, 0)
+    return _message(index, f'Plain note {index}', {'partId': '', 'mimeType': 'text/plain', 'filename': '',
+                                                   'body': {'size': len(plain), 'data': _encode(plain)}})
+
+
+def html_only(index):
+    _, html = _bodies(index, 8000)
+    return _message(index, f'Newsletter {index}', {'partId': '', 'mimeType': 'text/html', 'filename': '',
+                                                   'body': {'size': len(html), 'data': _encode(html)}})
+
+
+def alternative(index):
+    plain, html = _bodies(index, 8000)
+    return _message(index, f'Weekly update {index}', _container('', 'multipart/alternative', [
+        _text('0', plain), _html('1', html)]))
+
+
+def mixed_with_attachments(index):
+    plain, html = _bodies(index, 4000)
+    return _message(index, f'Invoice {index}', _container('', 'multipart/mixed', [
+        _container('0', 'multipart/alternative', [_text('0.0', plain), _html('0.1', html)]),
+        _attachment('1', f'invoice-{index}.pdf', 'application/pdf', 48213),
+        _attachment('2', 'terms.txt', 'text/plain', 2211),
+    ]))
+
+
+def related_inline_images(index):
+    plain, html = _bodies(index, 12000)
+    return _message(index, f'Order {index} shipped', _container('', 'multipart/mixed', [
+        _container('0', 'multipart/related', [
+            _container('0.0', 'multipart/alternative', [_text('0.0.0', plain), _html('0.0.1', html)]),
+            _attachment('0.1', 'logo.png', 'image/png', 9120),
+            _attachment('0.2', 'banner.jpg', 'image/jpeg', 38412),
+        ]),
+        _attachment('1', 'receipt.pdf', 'application/pdf', 61220),
+    ]))
+
+
+def forwarded(index):
+    plain, html = _bodies(index, 2000)
+    inner_plain, inner_html = _bodies(index + 1, 6000)
+    return _message(index, f'Fwd: Weekly update {index}', _container('', 'multipart/mixed', [
+        _container('0', 'multipart/alternative', [_text('0.0', plain), _html('0.1', html)]),
+        _container('1', 'message/rfc822', [
+            _container('1.0', 'multipart/alternative', [_text('1.0.0', inner_plain), _html('1.0.1', inner_html)]),
+            _attachment('1.1', 'slides.pptx', 'application/vnd.ms-powerpoint', 812334),
+        ]),
+    ]))
+
+
+SHAPES = {
+    'plain_only': plain_only,
+    'html_only': html_only,
+    'alternative': alternative,
+    'mixed_with_attachments': mixed_with_attachments,
+    'related_inline_images': related_inline_images,
+    'forwarded': forwarded,
+}
+
+
+def corpus(per_shape=50):
+    """A mixed list of messages, per_shape of each recorded shape"""
+    return [build(index) for index in range(per_shape) for build in SHAPES.values()]
@@ -0,0 +1,96 @@
+"""Offline stand-in for the Gemini model used by CategorizationEngine.
+
+Answers the categorization prompt in the format it asks for ("Heading ---
+Category" lines or a JSON object keyed by heading number), picking
+categories from subject keywords. Latency grows with the number of headings
+and has an occasional slow tail; an optional output-line limit mimics the
+model truncating long replies and drop_probability makes it skip headings.
+"""
+import json
+import random
+import re
+import threading
+import time
+
+KEYWORD_CATEGORIES = [
+    (('meeting', 'calendar', 'invite', 'schedule'), ['Meetings', 'Meeting']),
+    (('project', 'deadline', 'sprint', 'review'), ['Work', 'Work']),
+    (('newsletter', 'weekly', 'digest'), ['Newsletters', 'Newsletter']),
+    (('invoice', 'payment', 'statement', 'bank'), ['Finance', 'Finances']),
+    (('security', 'password', 'login', 'verify'), ['Security', 'Security Alerts']),
+    (('linkedin', 'twitter', 'friend', 'mentioned'), ['Social', 'Social Media']),
+    (('order', 'shipped', 'sale', 'cart'), ['Shopping', 'Shopping']),
+    (('flight', 'hotel', 'booking', 'trip'), ['Travel', 'Trips']),
+]
+
+HEADING_BLOCK_RE = re.compile(r'Email headings:\s*\n(.*?)\n\s*\n', re.S)
+HEADING_RE = re.compile(r'^\s*\d+\. (.*)$', re.M)
+VOCABULARY_RE = re.compile(r'Reuse them wherever they fit:\s*\n\s*(.*)')
+
+
+class StubModel:
+    def __init__(self, base_latency=0.3, per_line_latency=0.004, tail_probability=0.05, tail_multiplier=4.0,
+                 max_output_lines=None, drop_probability=0.0, seed=0):
+        self.base_latency = base_latency
+        self.per_line_latency = per_line_latency
+        self.tail_probability = tail_probability
+        self.tail_multiplier = tail_multiplier
+        self.max_output_lines = max_output_lines
+        self.drop_probability = drop_probability
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def pick_category(self, heading, vocabulary):
+        lowered = heading.lower()
+        for keywords, spellings in KEYWORD_CATEGORIES:
+            if any(keyword in lowered for keyword in keywords):
+                for spelling in spellings:
+                    if spelling in vocabulary:
+                        return spelling
+                # Without a shared vocabulary, chunks drift between spellings
+                with self.lock:
+                    return self.random.choice(spellings)
+        return 'Others'
+
+    def generate(self, prompt):
+        block = HEADING_BLOCK_RE.search(prompt)
+        headings = HEADING_RE.findall(block.group(1)) if block else []
+        match = VOCABULARY_RE.search(prompt)
+        vocabulary = {name.strip() for name in match.group(1).split(',')} if match else set()
+
+        with self.lock:
+            self.calls += 1
+            slow = self.random.random() < self.tail_probability
+        latency = self.base_latency + self.per_line_latency * len(headings)
+        time.sleep(latency * (self.tail_multiplier if slow else 1.0))
+
+        with self.lock:
+            kept = [(number, heading) for number, heading in enumerate(headings, 1)
+                    if self.random.random() >= self.drop_probability]
+        if self.max_output_lines is not None:
+            kept = kept[:self.max_output_lines]
+
+        if 'JSON object' in prompt:
+            return json.dumps({str(number): self.pick_category(heading, vocabulary) for number, heading in kept})
+        return '\n'.join(f'{heading} --- {self.pick_category(heading, vocabulary)}' for _, heading in kept)
+
+    def generate_stream(self, prompt, piece_size=16):
+        """The same reply, yielded in small pieces like a streamed response"""
+        text = self.generate(prompt)
+        for start in range(0, len(text), piece_size):
+            yield text[start:start + piece_size]
+
+
+SUBJECT_WORDS = [keyword for keywords, _ in KEYWORD_CATEGORIES for keyword in keywords] + ['hello', 'question', 'fyi']
+
+
+def make_emails(count, seed=1):
+    """Synthetic inbox of subjects for categorization benchmarks"""
+    rng = random.Random(seed)
+    return [
+        {'id': f'{i:016x}',
+         'subject': f'{rng.choice(SUBJECT_WORDS).title()} {rng.choice(SUBJECT_WORDS)} update #{i}',
+         'snippet': ''}
+        for i in range(count)
+    ]
@@ -1,30 +1,68 @@
-from flask import Flask, request, redirect, session, url_for, render_template, jsonify, Blueprint
+from flask import Flask, request, redirect, session, url_for, render_template, jsonify, Blueprint, g
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from google.auth.transport.requests import Request
 import os
 import threading
 import time
 import uuid
 from flask import jsonify
-import pickle
 import json
 from datetime import timedelta
 import base64
 from utils import EmailClient, gen_categories, QuerySaver, CategoryStorage
+from fetch_engine import FetchEngine
+from client_registry import ClientRegistry
+from service_cache import ServiceCache
+from job_runner import JobRunner, JobEvents
+from job_store import JobStore
 import random
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 
 # Create shared instances that will be used across blueprints
-email_client = EmailClient()
+fetch_engine = FetchEngine(max_workers=4)
+service_cache = ServiceCache()
+client_registry = ClientRegistry(
+    lambda: EmailClient(fetch_engine=fetch_engine, store_dir='message_store'),
+    max_clients=int(os.environ.get('MAX_EMAIL_CLIENTS', 50)),
+    max_memory_mb=int(os.environ.get('EMAIL_CLIENT_MEMORY_MB', 256)),
+    idle_timeout=int(os.environ.get('EMAIL_CLIENT_IDLE_SECONDS', 1800)),
+    service_cache=service_cache,
+    fetch_engine=fetch_engine
+)
+job_runner = JobRunner(
+    max_workers=int(os.environ.get('CATEGORIZE_JOB_WORKERS', 2)),
+    max_jobs_per_user=int(os.environ.get('CATEGORIZE_JOBS_PER_USER', 2))
+)
+job_events = JobEvents()
+job_store = JobStore(
+    ttl=int(os.environ.get('JOB_TTL_SECONDS', 3600)),
+    max_memory_mb=int(os.environ.get('JOB_STORE_MEMORY_MB', 64)),
+    spill_dir=os.environ.get('JOB_STORE_DIR', 'job_store'),
+    on_expire=job_events.discard
+)
 query = QuerySaver()
 
+def get_email_client():
+    """Get the signed-in user's EmailClient from the registry, pinned until the request ends"""
+    email_client = client_registry.get_session_client(session['credentials'])
+    g.setdefault('email_clients', []).append(email_client)
+    return email_client
+
+def release_email_clients(exc=None):
+    """teardown_request handler: unpin the clients get_email_client handed out"""
+    for email_client in g.pop('email_clients', []):
+        client_registry.release(email_client)
+
 def init_app(app):
     """Initialize all blueprints with the Flask app"""
     # Make shared instances available to the app
-    app.email_client = email_client
+    app.client_registry = client_registry
+    app.fetch_engine = fetch_engine
+    app.job_runner = job_runner
+    app.job_events = job_events
+    app.job_store = job_store
     app.query = query
+    app.teardown_request(release_email_clients)
     
     # Import and register blueprints (import here to avoid circular imports)
     from .email_functions.emails import emails_bp
@@ -34,4 +72,4 @@ def init_app(app):
     app.register_blueprint(categories_bp)
 
 # Export the function
-__all__ = ['init_app', 'email_client', 'query']
\ No newline at end of file
+__all__ = ['init_app', 'service_cache', 'client_registry', 'get_email_client', 'release_email_clients', 'fetch_engine', 'job_runner', 'job_events', 'job_store', 'query']
\ No newline at end of file
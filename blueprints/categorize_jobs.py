@@ -0,0 +1,243 @@
+from flask import request, session
+import json
+import time
+import uuid
+from blueprints import get_email_client, job_runner, job_events, job_store
+from utils import gen_categories, gen_categories_incremental
+
+# Categorization jobs shared by app.py and the categories blueprint. Status and
+# results live in the shared job_store, keyed by session ID.
+
+# Statuses after which a job produces no more events
+FINAL_STATUSES = ('completed', 'error', 'index_error')
+
+def wants_json():
+    """True for API requests (the Next.js frontend) rather than browser page loads"""
+    return request.headers.get('Accept', '').startswith('application/json') or \
+        'application/json' in request.headers.get('Content-Type', '')
+
+def categorize_emails_background(email_list, user_query, session_id, user_email, category_storage, incremental=True):
+    """Background function to categorize emails"""
+    try:
+        print(f"[DEBUG] Starting categorization for session {session_id}")
+        print(f"[DEBUG] Email count: {len(email_list)}")
+        print(f"[DEBUG] User query: '{user_query}'")
+        
+        # Update status to processing
+        update_status(session_id, {
+            'status': 'processing',
+            'stage': 'starting',
+            'progress': 10,
+            'message': 'Starting email categorization...'
+        })
+        
+        def on_progress(done, total, indexes, categories):
+            # Labels are provisional until the final merge into at most 7 categories
+            job_events.publish(session_id, 'partial', {
+                'emails': [{'id': email_list[i].get('id'), 'subject': email_list[i].get('subject', ''),
+                            'category': category} for i, category in zip(indexes, categories)]
+            })
+            update_status(session_id, {
+                'status': 'processing',
+                'stage': 'categorizing',
+                'progress': 20 + int(50 * done / total),
+                'message': f'Categorized {done} of {total} batches...'
+            })
+        
+        # Call the categorization function
+        update_status(session_id, {
+            'status': 'processing',
+            'stage': 'categorizing',
+            'progress': 20,
+            'message': 'Categorizing emails...'
+        })
+        if incremental:
+            print(f"[DEBUG] Calling gen_categories_incremental...")
+            categories, new_count = gen_categories_incremental(email_list, user_query=user_query,
+                                                               category_storage=category_storage,
+                                                               on_progress=on_progress)
+        else:
+            print(f"[DEBUG] Calling gen_categories...")
+            categories = gen_categories(email_list, user_query, on_progress=on_progress, user_email=user_email)
+            new_count = len(email_list)
+        print(f"[DEBUG] gen_categories returned: {categories}")
+        
+        # Update progress
+        update_status(session_id, {
+            'status': 'processing',
+            'stage': 'grouping',
+            'progress': 70,
+            'message': 'Organizing emails into categories...'
+        })
+        
+        # Group emails by category
+        print(f"[DEBUG] Grouping emails by category...")
+        categorized_emails = {}
+        
+        for i, email in enumerate(email_list):
+            if i < len(categories):
+                category = categories[i]
+            else:
+                category = 'Others'
+            
+            if category not in categorized_emails:
+                categorized_emails[category] = []
+            
+            categorized_emails[category].append(email)
+        
+        print(f"[DEBUG] Categorized emails: {list(categorized_emails.keys())}")
+        print(f"[DEBUG] Category counts: {[(k, len(v)) for k, v in categorized_emails.items()]}")
+        
+        # Store results
+        job_store.set_result(session_id, {
+            'categories': categorized_emails,
+            'user_email': user_email,
+            'total_emails': len(email_list),
+            'new_emails': new_count,
+            'query': user_query
+        })
+        
+        # Don't save automatically - let user choose when to save
+        # category_storage.save_categories(final_classification, user_query)
+        
+        # Update status to complete
+        update_status(session_id, {
+            'status': 'completed',
+            'stage': 'completed',
+            'progress': 100,
+            'message': 'Categorization completed successfully!'
+        })
+        
+        print(f"[DEBUG] Categorization completed successfully for session {session_id}")
+        
+    except IndexError as e:
+        print(f"[DEBUG] IndexError in categorization: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        
+        # Handle index error gracefully
+        update_status(session_id, {
+            'status': 'index_error',
+            'progress': 100,
+            'message': 'Index error detected - proceeding with fallback categorization',
+            'redirect': True
+        })
+        
+        # Create a fallback categorization with all emails in one category
+        job_store.set_result(session_id, {
+            'categories': {'All Emails': email_list},
+            'user_email': user_email,
+            'total_emails': len(email_list),
+            'query': user_query
+        })
+        
+    except Exception as e:
+        print(f"[DEBUG] Exception in categorization: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        
+        # Try simple categorization as fallback
+        try:
+            print(f"[DEBUG] Attempting fallback categorization...")
+            from utils import simple_categorize
+            categories = simple_categorize(email_list)
+            
+            # Group emails by category
+            categorized_emails = {}
+            for i, email in enumerate(email_list):
+                if i < len(categories):
+                    category = categories[i]
+                else:
+                    category = 'Others'
+                
+                if category not in categorized_emails:
+                    categorized_emails[category] = []
+                
+                categorized_emails[category].append(email)
+            
+            # Store fallback results
+            job_store.set_result(session_id, {
+                'categories': categorized_emails,
+                'user_email': user_email,
+                'total_emails': len(email_list)
+            })
+            
+            update_status(session_id, {
+                'status': 'completed',
+                'progress': 100,
+                'message': 'Categorization completed with fallback method'
+            })
+            
+            print(f"[DEBUG] Fallback categorization successful for session {session_id}")
+            
+        except Exception as fallback_error:
+            print(f"[DEBUG] Fallback categorization also failed: {str(fallback_error)}")
+            update_status(session_id, {
+                'status': 'error',
+                'progress': 0,
+                'message': f'Error: {str(e)}'
+            })
+
+def update_status(session_id, status, owner=None):
+    """Record a job's status and push it to anyone streaming that job"""
+    job_store.set_status(session_id, status, owner=owner)
+    job_events.publish(session_id, 'status', status)
+
+def submit_categorization(email_list, user_query, user_email, category_storage, incremental=True):
+    """Queue categorize_emails_background on the job pool; returns the session ID, or None if the user is at the cap"""
+    session_id = f"{user_email}_{int(time.time())}_{uuid.uuid4().hex[:8]}"
+    update_status(session_id, {
+        'status': 'queued',
+        'stage': 'queued',
+        'progress': 0,
+        'message': 'Waiting for a free worker...'
+    }, owner=user_email)
+    future = job_runner.submit(user_email, categorize_emails_background, email_list, user_query,
+                               session_id, user_email, category_storage, incremental)
+    if future is None:
+        # Status goes in first so a worker that starts at once can't be overwritten by 'queued';
+        # a rejected job never expires, so drop its event log here too
+        job_store.discard(session_id)
+        job_events.discard(session_id)
+        return None
+    print(f"[DEBUG] Queued categorization {session_id} ({len(email_list)} emails)")
+    return session_id
+
+def owns_job(session_id):
+    """True if session_id is a live job started by the signed-in user"""
+    if 'credentials' not in session:
+        return False
+    try:
+        user_email = get_email_client().profile.get('emailAddress')
+    except Exception as e:
+        print(f"[DEBUG] Could not identify the user asking for {session_id}: {e}")
+        return False
+    return user_email is not None and job_store.get_owner(session_id) == user_email
+
+def stream_job_events(session_id, last_id=-1):
+    """Server-Sent Events: status transitions and per-batch partial results until the job finishes"""
+    after = last_id
+    if after < 0:
+        # New client: the current status plus the partial results so far
+        events = job_events.wait(session_id, timeout=0)
+        after = events[-1][0] if events else -1
+        status = job_store.get_status(session_id) or {}
+        yield f"event: status\ndata: {json.dumps(status)}\n\n"
+        if status.get('status') in FINAL_STATUSES:
+            return
+        for event_id, event, data in events:
+            if event == 'partial':
+                yield f"id: {event_id}\nevent: partial\ndata: {json.dumps(data)}\n\n"
+    while True:
+        events = job_events.wait(session_id, after, timeout=15)
+        if not events:
+            # Comment line to keep proxies from closing an idle stream
+            yield ": keep-alive\n\n"
+            if not job_store.has_job(session_id):
+                return
+            continue
+        for event_id, event, data in events:
+            after = event_id
+            yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+            if event == 'status' and data.get('status') in FINAL_STATUSES:
+                return
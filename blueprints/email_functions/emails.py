@@ -1,11 +1,10 @@
-from flask import Blueprint, request, jsonify, session, g
-from googleapiclient.discovery import build
-import pickle
+from flask import Blueprint, request, jsonify, session
 import ssl
 from googleapiclient.errors import HttpError
 import time
 import random
-from utils import EmailClient
+from blueprints import get_email_client, service_cache
+from utils import INBOX_PAGE_SIZE
 
 # Create blueprint
 emails_bp = Blueprint('emails', __name__, url_prefix='/api')
@@ -55,23 +54,14 @@ def retry_on_ssl_error(max_retries=3, base_delay=1.0, max_delay=10.0):
     return decorator
 
 @retry_on_ssl_error(max_retries=3, base_delay=1.0)
-def _fetch_emails_with_retry(email_client, max_results, query):
-    """Helper function to fetch emails with retry logic"""
-    return email_client.get_messages(max_results=max_results, query=query)
-
-@retry_on_ssl_error(max_retries=2, base_delay=0.5)
-def _get_user_profile_with_retry(service):
-    """Helper function to get user profile with retry logic"""
-    return service.users().getProfile(userId='me').execute()
+def _fetch_page_with_retry(email_client, cursor, page_size, query):
+    """Helper function to fetch a page of emails with retry logic (first page via the history delta)"""
+    return email_client.get_page(cursor=cursor, page_size=page_size, query=query)
 
 @retry_on_ssl_error(max_retries=3, base_delay=1.0)
-def _fetch_email_with_retry(service, email_id):
-    """Helper function to fetch email with retry logic"""
-    return service.users().messages().get(
-        userId='me', 
-        id=email_id,
-        format='full'
-    ).execute()
+def _fetch_email_with_retry(email_client, email_id):
+    """Helper function to fetch a fully parsed email with retry logic (body loaded on first open)"""
+    return email_client.get_message(email_id)
 
 @retry_on_ssl_error(max_retries=2, base_delay=0.5)
 def _mark_email_read_with_retry(service, email_id):
@@ -94,26 +84,26 @@ def get_emails():
     
     try:
         print("[DEBUG] /api/emails - Loading credentials from session")
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
+        email_client = get_email_client()
         
-        # Get the email client from the g object
-        email_client = g.email_client
-        email_client.add_service(service)
-        
-        # Get query parameters
-        max_results = request.args.get('max_results', 100, type=int)
+        # Get query parameters (max_results is the older name of page_size)
+        page_size = request.args.get('page_size', request.args.get('max_results', INBOX_PAGE_SIZE, type=int), type=int)
         query = request.args.get('q', '')
+        cursor = request.args.get('cursor')
         
-        print(f"[DEBUG] /api/emails - Fetching {max_results} emails")
-        email_list = _fetch_emails_with_retry(email_client, max_results, query)
+        print(f"[DEBUG] /api/emails - Fetching a page of {page_size} emails")
+        try:
+            email_list, next_cursor = _fetch_page_with_retry(email_client, cursor, page_size, query)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Get user profile for email address
         profile = email_client.profile
         user_email = profile.get('emailAddress', 'Unknown') if profile else 'Unknown'
         
         print(f"[DEBUG] /api/emails - Successfully fetched {len(email_list)} emails for {user_email}")
-        return jsonify({'emails': email_list, 'total': len(email_list), 'user_email': user_email})
+        return jsonify({'emails': email_list, 'total': len(email_list), 'user_email': user_email,
+                        'next_cursor': next_cursor, 'has_more': next_cursor is not None})
         
     except Exception as e:
         print(f"[DEBUG] /api/emails - Error: {str(e)}")
@@ -133,25 +123,19 @@ def get_email_detail(email_id):
     
     try:
         print(f"[DEBUG] /api/email/{email_id} - Loading credentials from session")
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
-        
-        # Get the email client from the g object
-        email_client = g.email_client
-        email_client.add_service(service)
+        email_client = get_email_client()
+        service = email_client.service
         
         print(f"[DEBUG] /api/email/{email_id} - Fetching email details")
-        msg = _fetch_email_with_retry(service, email_id)
-        
-        print(f"[DEBUG] /api/email/{email_id} - Parsing email message")
-        email_data = email_client.parse_message(msg)
+        email_data = _fetch_email_with_retry(email_client, email_id)
         
         # Mark as read if it was unread
-        if 'UNREAD' in msg.get('labelIds', []):
+        if email_data.get('is_unread'):
             print(f"[DEBUG] /api/email/{email_id} - Marking email as read")
             try:
                 _mark_email_read_with_retry(service, email_id)
                 email_data['is_unread'] = False
+                email_data['labels'] = [label for label in email_data.get('labels', []) if label != 'UNREAD']
             except Exception as mark_read_error:
                 print(f"[WARNING] Failed to mark email as read: {str(mark_read_error)}")
                 # Don't fail the whole request if marking as read fails
@@ -173,12 +157,8 @@ def get_email_details(email_id):
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
-        
-        # Get the email client from the g object
-        email_client = g.email_client
-        email_client.add_service(service)
+        email_client = get_email_client()
+        service = email_client.service
         
         # Get the full email message
         msg = service.users().messages().get(
@@ -221,8 +201,7 @@ def mark_email_read(email_id):
     
     try:
         print(f"[DEBUG] /api/email/{email_id}/mark-read - Loading credentials from session")
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
+        service = service_cache.get_service(session['credentials'])
         
         print(f"[DEBUG] /api/email/{email_id}/mark-read - Marking email as read")
         # Remove the UNREAD label to mark as read
@@ -249,8 +228,7 @@ def mark_email_unread(email_id):
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
+        service = service_cache.get_service(session['credentials'])
         
         # Add the UNREAD label to mark as unread
         result = service.users().messages().modify(
@@ -276,8 +254,7 @@ def delete_email(email_id):
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
+        service = service_cache.get_service(session['credentials'])
         
         # Move email to trash (Gmail doesn't permanently delete via API by default)
         result = service.users().messages().trash(
@@ -302,8 +279,7 @@ def restore_email(email_id):
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
+        service = service_cache.get_service(session['credentials'])
         
         # Remove email from trash
         result = service.users().messages().untrash(
@@ -328,8 +304,7 @@ def star_email(email_id):
         return jsonify({'error': 'Not authenticated'}), 401
     
     try:
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
+        service = service_cache.get_service(session['credentials'])
         
         # Get current message to check if it's already starred
         msg = service.users().messages().get(userId='me', id=email_id).execute()
@@ -377,31 +352,29 @@ def load_inbox():
     
     try:
         print("[DEBUG] /api/load-inbox - Loading credentials from session")
-        creds = pickle.loads(session['credentials'])
-        service = build('gmail', 'v1', credentials=creds)
-        
-        # Get the email client from the g object
-        email_client = g.email_client
-        email_client.add_service(service)
+        email_client = get_email_client()
         
         # Get user profile info
         print("[DEBUG] /api/load-inbox - Getting user profile")
-        profile = _get_user_profile_with_retry(service)
+        profile = email_client.profile
         user_email = profile.get('emailAddress', 'Unknown')
         
         # Get emails
         print("[DEBUG] /api/load-inbox - Getting emails")
-        if email_client.has_service and email_client.email_list!=None:
-            email_list = email_client.email_list
-        else:
-            email_list = _fetch_emails_with_retry(email_client, 50, '')
+        page_size = request.args.get('page_size', INBOX_PAGE_SIZE, type=int)
+        try:
+            email_list, next_cursor = _fetch_page_with_retry(email_client, request.args.get('cursor'), page_size, '')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         print(f"[DEBUG] /api/load-inbox - Successfully loaded {len(email_list)} emails for {user_email}")
         return jsonify({
             'success': True,
             'user_email': user_email,
             'emails': email_list,
-            'total_emails': len(email_list)
+            'total_emails': len(email_list),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
         })
         
     except Exception as e:
@@ -438,11 +411,10 @@ def generate_reply():
         
         # Get user's name from email if available
         user_name = "there"  # Default
-        email_client = g.email_client
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', '')
-            if user_email and '@' in user_email:
-                user_name = user_email.split('@')[0].title()
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', '')
+        if user_email and '@' in user_email:
+            user_name = user_email.split('@')[0].title()
         
         # Create prompt for Gemini
         prompt = f"""You are an AI assistant helping to write email replies. Generate a {tone} reply to the following email:
@@ -512,16 +484,10 @@ def chat_with_mail():
             return jsonify({'error': 'No query provided'}), 400
         
         # Load user's actual emails
-        email_client = g.email_client
-        if email_client.has_service and email_client.email_list != None:
-            emails = email_client.email_list
-            user_email = email_client.profile.get('emailAddress', 'Unknown') if email_client.profile else 'Unknown'
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            emails = email_client.get_messages(max_results=100)
-            user_email = email_client.profile.get('emailAddress', 'Unknown') if email_client.profile else 'Unknown'
+        email_client = get_email_client()
+        # Brings the restored or cached mail set up to date (a history delta when the checkpoint is fresh)
+        emails = email_client.sync_messages(max_results=100)
+        user_email = email_client.profile.get('emailAddress', 'Unknown') if email_client.profile else 'Unknown'
         
         if not emails:
             return jsonify({'error': 'No emails found to analyze'}), 404
@@ -1,17 +1,12 @@
-from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for, g
-from googleapiclient.discovery import build
-import pickle
-import time
-import uuid
-from utils import EmailClient, gen_categories, CategoryStorage
+from flask import Blueprint, request, jsonify, session, render_template, redirect, url_for, Response
+from blueprints import get_email_client, job_store
+from blueprints.categorize_jobs import wants_json, submit_categorization, owns_job, stream_job_events
+from utils import CategoryStorage
+from change_log import validate_operation
 
 # Create blueprint
 categories_bp = Blueprint('categories', __name__)
 
-# Global dictionary to store categorization results (kept for API compatibility)
-categorization_results = {}
-categorization_status = {}
-
 @categories_bp.route('/categorize')
 def categorize():
     """Categorize emails and display results immediately"""
@@ -24,18 +19,11 @@ def categorize():
     recategorize = request.args.get('recategorize', 'false').lower() == 'true'
     
     try:
-        email_client = g.email_client
-        if email_client.has_service and email_client.email_list != None:
-            email_list = email_client.email_list
-            profile = email_client.profile
-            user_email = profile.get('emailAddress', 'Unknown') if profile else 'Unknown'
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            email_list = email_client.get_messages(max_results=100)
-            profile = email_client.profile
-            user_email = profile.get('emailAddress', 'Unknown') if profile else 'Unknown'
+        email_client = get_email_client()
+        # Brings the restored or cached mail set up to date (a history delta when the checkpoint is fresh)
+        email_list = email_client.sync_messages(max_results=100)
+        profile = email_client.profile
+        user_email = profile.get('emailAddress', 'Unknown') if profile else 'Unknown'
 
         # Validate email_list
         if not email_list or len(email_list) == 0:
@@ -47,7 +35,16 @@ def categorize():
         # Check if we have saved categories and user isn't forcing a new categorization
         # AND no new query is provided (if there's a new query, always generate new categories)
         if not force_new and not recategorize and not user_query and category_storage.has_saved_categories():
-            saved_data = category_storage.load_categories()
+            saved_data = category_storage.load_categories(message_store=email_client.message_store)
+            if saved_data and wants_json():
+                return jsonify({
+                    'categories': saved_data['categories'],
+                    'user_email': saved_data['user_email'],
+                    'total_emails': saved_data['email_count'],
+                    'query': saved_data.get('query', ''),
+                    'saved_at': saved_data.get('saved_at', ''),
+                    'is_saved': True
+                })
             if saved_data:
                 return render_template('categorize.html', 
                                      categories=saved_data['categories'],
@@ -57,242 +54,85 @@ def categorize():
                                      saved_at=saved_data.get('saved_at', ''),
                                      is_saved=True)
 
-        # Show loading page with immediate categorization
-        if request.args.get('loading') == 'true' or user_query or recategorize:
-            # This is the actual categorization request
-            print(f"[DEBUG] Starting categorization for {user_email}")
-            print(f"[DEBUG] Email count: {len(email_list)}")
-            print(f"[DEBUG] User query: '{user_query}'")
-            
-            # Call the categorization function directly
-            print(f"[DEBUG] Calling gen_categories...")
-            categories = gen_categories(email_list, user_query)
-            print(f"[DEBUG] gen_categories returned: {categories}")
-            
-            # Group emails by category
-            print(f"[DEBUG] Grouping emails by category...")
-            categorized_emails = {}
-            
-            for i, email in enumerate(email_list):
-                if i < len(categories):
-                    category = categories[i]
-                else:
-                    category = 'Others'
-                
-                if category not in categorized_emails:
-                    categorized_emails[category] = []
-                
-                categorized_emails[category].append(email)
-            
-            print(f"[DEBUG] Categorized emails: {list(categorized_emails.keys())}")
-            print(f"[DEBUG] Category counts: {[(k, len(v)) for k, v in categorized_emails.items()]}")
-            
-            # Render the categorize template with results
-            return render_template('categorize.html', 
-                                 categories=categorized_emails,
-                                 user_email=user_email,
-                                 total_emails=len(email_list),
-                                 query=user_query,
-                                 is_saved=False)
-        else:
-            # First request - show loading page
-            return render_template('categorize_loading.html',
-                                 user_email=user_email,
-                                 total_emails=len(email_list),
-                                 query=user_query)
+        # Categorize on the job pool; the loading page follows the job's progress
+        session_id = submit_categorization(email_list, user_query, user_email, category_storage,
+                                           incremental=not (force_new or recategorize))
+        if session_id is None:
+            message = 'Too many categorizations in progress for this account, please wait for them to finish.'
+            if wants_json():
+                return jsonify({'error': message}), 429
+            return f"{message} <a href='/inbox'>Go back</a>"
+        
+        if wants_json():
+            return jsonify({
+                'success': True,
+                'session_id': session_id,
+                'status': 'queued',
+                'user_email': user_email,
+                'total_emails': len(email_list),
+                'query': user_query
+            }), 202
+        return render_template('categorize_loading.html',
+                             session_id=session_id,
+                             user_email=user_email,
+                             total_emails=len(email_list),
+                             query=user_query)
 
     except Exception as e:
+        if wants_json():
+            return jsonify({'error': str(e)}), 500
         return f"Error during categorization: {str(e)} <a href='/inbox'>Go back</a>"
 
 @categories_bp.route('/api/categorize')
 def api_categorize():
-    """API endpoint to get categorized emails as JSON"""
+    """API endpoint to start a background categorization job"""
     if 'credentials' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
     user_query = request.args.get('query', '')
+    force_new = request.args.get('force_new', 'false').lower() == 'true'
     
     try:
-        email_client = g.email_client
-        if email_client.has_service and email_client.email_list != None:
-            email_list = email_client.email_list
-            profile = email_client.profile
-            user_email = profile.get('emailAddress', 'Unknown') if profile else 'Unknown'
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            email_list = email_client.get_messages(max_results=100)
-            profile = email_client.profile
-            user_email = profile.get('emailAddress', 'Unknown') if profile else 'Unknown'
+        email_client = get_email_client()
+        # Brings the restored or cached mail set up to date (a history delta when the checkpoint is fresh)
+        email_list = email_client.sync_messages(max_results=100)
+        profile = email_client.profile
+        user_email = profile.get('emailAddress', 'Unknown') if profile else 'Unknown'
 
         if not email_list:
             return jsonify({'error': 'No emails found'}), 404
 
-        # Call the categorization function
-        categories = gen_categories(email_list, user_query)
-        
-        # Group emails by category
-        categorized_emails = {}
-        for i, email in enumerate(email_list):
-            category = categories[i] if i < len(categories) else 'Others'
-            if category not in categorized_emails:
-                categorized_emails[category] = []
-            categorized_emails[category].append(email)
+        # Queue the categorization and return straight away; poll /categorize_status/<session_id>
+        session_id = submit_categorization(email_list, user_query, user_email, CategoryStorage(user_email),
+                                           incremental=not force_new)
+        if session_id is None:
+            return jsonify({'error': 'Too many categorizations in progress for this account'}), 429
         
         return jsonify({
             'success': True,
-            'categories': categorized_emails,
+            'session_id': session_id,
+            'status': 'queued',
             'user_email': user_email,
             'total_emails': len(email_list),
             'query': user_query
-        })
+        }), 202
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def categorize_emails_background(email_list, user_query, session_id, user_email, category_storage):
-    """Background function to categorize emails"""
-    try:
-        print(f"[DEBUG] Starting categorization for session {session_id}")
-        print(f"[DEBUG] Email count: {len(email_list)}")
-        print(f"[DEBUG] User query: '{user_query}'")
-        
-        # Update status to processing
-        categorization_status[session_id] = {
-            'status': 'processing',
-            'progress': 10,
-            'message': 'Starting email categorization...'
-        }
-        
-        # Call the categorization function
-        print(f"[DEBUG] Calling gen_categories...")
-        categories = gen_categories(email_list, user_query)
-        print(f"[DEBUG] gen_categories returned: {categories}")
-        
-        # Update progress
-        categorization_status[session_id] = {
-            'status': 'processing',
-            'progress': 70,
-            'message': 'Organizing emails into categories...'
-        }
-        
-        # Group emails by category
-        print(f"[DEBUG] Grouping emails by category...")
-        categorized_emails = {}
-        
-        for i, email in enumerate(email_list):
-            if i < len(categories):
-                category = categories[i]
-            else:
-                category = 'Others'
-            
-            if category not in categorized_emails:
-                categorized_emails[category] = []
-            
-            categorized_emails[category].append(email)
-        
-        print(f"[DEBUG] Categorized emails: {list(categorized_emails.keys())}")
-        print(f"[DEBUG] Category counts: {[(k, len(v)) for k, v in categorized_emails.items()]}")
-        
-        # Store results
-        categorization_results[session_id] = {
-            'categories': categorized_emails,
-            'user_email': user_email,
-            'total_emails': len(email_list),
-            'query': user_query
-        }
-        
-        # Don't save automatically - let user choose when to save
-        # category_storage.save_categories(final_classification, user_query)
-        
-        # Update status to complete
-        categorization_status[session_id] = {
-            'status': 'completed',
-            'progress': 100,
-            'message': 'Categorization completed successfully!'
-        }
-        
-        print(f"[DEBUG] Categorization completed successfully for session {session_id}")
-        
-    except IndexError as e:
-        print(f"[DEBUG] IndexError in categorization: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        
-        # Handle index error gracefully
-        categorization_status[session_id] = {
-            'status': 'index_error',
-            'progress': 100,
-            'message': 'Index error detected - proceeding with fallback categorization',
-            'redirect': True
-        }
-        
-        # Create a fallback categorization with all emails in one category
-        categorization_results[session_id] = {
-            'categories': {'All Emails': email_list},
-            'user_email': user_email,
-            'total_emails': len(email_list),
-            'query': user_query
-        }
-        
-    except Exception as e:
-        print(f"[DEBUG] Exception in categorization: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        
-        # Try simple categorization as fallback
-        try:
-            print(f"[DEBUG] Attempting fallback categorization...")
-            from utils import simple_categorize
-            categories = simple_categorize(email_list)
-            
-            # Group emails by category
-            categorized_emails = {}
-            for i, email in enumerate(email_list):
-                if i < len(categories):
-                    category = categories[i]
-                else:
-                    category = 'Others'
-                
-                if category not in categorized_emails:
-                    categorized_emails[category] = []
-                
-                categorized_emails[category].append(email)
-            
-            # Store fallback results
-            categorization_results[session_id] = {
-                'categories': categorized_emails,
-                'user_email': user_email,
-                'total_emails': len(email_list)
-            }
-            
-            categorization_status[session_id] = {
-                'status': 'completed',
-                'progress': 100,
-                'message': 'Categorization completed with fallback method'
-            }
-            
-            print(f"[DEBUG] Fallback categorization successful for session {session_id}")
-            
-        except Exception as fallback_error:
-            print(f"[DEBUG] Fallback categorization also failed: {str(fallback_error)}")
-            categorization_status[session_id] = {
-                'status': 'error',
-                'progress': 0,
-                'message': f'Error: {str(e)}'
-            }
-
 @categories_bp.route('/categorize_status/<session_id>')
 def categorize_status_check(session_id):
     """Check the status of categorization process"""
     try:
         print(f"[DEBUG] Status check for session: {session_id}")
-        status = categorization_status.get(session_id, {
-            'status': 'not_found',
-            'progress': 0,
-            'message': 'Session not found'
-        })
+        # Other users' jobs look the same as unknown ones
+        status = job_store.get_status(session_id) if owns_job(session_id) else None
+        if status is None:
+            return jsonify({
+                'status': 'not_found',
+                'progress': 0,
+                'message': 'Session not found'
+            }), 404
         print(f"[DEBUG] Status response: {status}")
         return jsonify(status)
     except Exception as e:
@@ -303,18 +143,30 @@ def categorize_status_check(session_id):
             'message': f'Status check error: {str(e)}'
         }), 500
 
+@categories_bp.route('/categorize_stream/<session_id>')
+def categorize_stream(session_id):
+    """Server-Sent Events: status transitions and per-batch partial results until the job finishes"""
+    if not owns_job(session_id):
+        return jsonify({'error': 'Session not found or expired'}), 404
+    
+    try:
+        last_id = int(request.headers.get('Last-Event-ID', -1))
+    except ValueError:
+        last_id = -1
+    
+    return Response(stream_job_events(session_id, last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @categories_bp.route('/categorize_results/<session_id>')
 def categorize_results(session_id):
     """Get categorization results"""
-    if session_id in categorization_results:
-        results = categorization_results[session_id]
-        
+    results = job_store.get_result(session_id) if owns_job(session_id) else None
+    if results is not None:
         # Don't clean up stored data immediately - let the frontend handle cleanup
         # This allows for multiple requests to the same session
         
         # Check if this is an API request (from Next.js) or direct browser request
-        if request.headers.get('Accept', '').startswith('application/json') or \
-           'application/json' in request.headers.get('Content-Type', ''):
+        if wants_json():
             # Return JSON for API requests
             return jsonify({
                 'categories': results['categories'],
@@ -334,38 +186,6 @@ def categorize_results(session_id):
     else:
         return jsonify({'error': 'Session not found or expired'}), 404
 
-def cleanup_old_sessions(user_email, max_age_seconds=3600):
-    """Clean up old sessions to prevent memory leaks"""
-    current_time = int(time.time())
-    sessions_to_remove = []
-    
-    print(f"[DEBUG] Cleanup: Checking sessions for {user_email}, max age: {max_age_seconds}s")
-    print(f"[DEBUG] Current sessions: {list(categorization_status.keys())}")
-    
-    # Find old sessions for this user
-    for session_id in list(categorization_status.keys()):
-        if session_id.startswith(user_email):
-            try:
-                # Extract timestamp from session_id
-                session_time = int(session_id.split('_')[1])
-                age = current_time - session_time
-                print(f"[DEBUG] Session {session_id} age: {age}s")
-                if age > max_age_seconds:
-                    sessions_to_remove.append(session_id)
-                    print(f"[DEBUG] Marking session {session_id} for removal (too old)")
-            except (IndexError, ValueError) as e:
-                # If we can't parse the timestamp, remove the session
-                print(f"[DEBUG] Cannot parse session {session_id}: {e}")
-                sessions_to_remove.append(session_id)
-    
-    # Remove old sessions
-    print(f"[DEBUG] Removing {len(sessions_to_remove)} old sessions")
-    for session_id in sessions_to_remove:
-        if session_id in categorization_status:
-            del categorization_status[session_id]
-        if session_id in categorization_results:
-            del categorization_results[session_id]
-
 @categories_bp.route('/api/save-categories', methods=['POST'])
 def save_categories():
     """Save current categories to local storage"""
@@ -374,14 +194,8 @@ def save_categories():
     
     try:
         # Get user email
-        email_client = g.email_client
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            user_email = email_client.profile.get('emailAddress', 'Unknown') if email_client.profile else 'Unknown'
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         # Get categories from request
         data = request.get_json()
@@ -415,14 +229,8 @@ def save_folders():
     
     try:
         # Get user email
-        email_client = g.email_client
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            user_email = email_client.profile.get('emailAddress', 'Unknown') if email_client.profile else 'Unknown'
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         # Get folders from request
         data = request.get_json()
@@ -456,14 +264,8 @@ def load_saved_categories():
     
     try:
         # Get user email
-        email_client = g.email_client
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            user_email = email_client.profile.get('emailAddress', 'Unknown') if email_client.profile else 'Unknown'
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         # Initialize category storage and load
         category_storage = CategoryStorage(user_email)
@@ -491,14 +293,8 @@ def load_saved_folders():
     
     try:
         # Get user email
-        email_client = g.email_client
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            user_email = email_client.profile.get('emailAddress', 'Unknown') if email_client.profile else 'Unknown'
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         # Initialize category storage and load
         category_storage = CategoryStorage(user_email)
@@ -518,6 +314,46 @@ def load_saved_folders():
     except Exception as e:
         return jsonify({'error': str(e), 'success': False}), 500
 
+def saved_changes(file_type):
+    """Append edits to the user's saved categories or folders, or list the logged ones"""
+    if 'credentials' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    try:
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
+        category_storage = CategoryStorage(user_email)
+        
+        if request.method == 'GET':
+            changes, snapshot_seq = category_storage.get_changes(file_type, since=request.args.get('since', 0, type=int))
+            # Edits at or below snapshot_seq were compacted and are only in the saved data
+            return jsonify({'success': True, 'changes': changes, 'snapshot_seq': snapshot_seq})
+        
+        data = request.get_json() or {}
+        operations = data.get('operations', [])
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': 'operations must be a non-empty list', 'success': False}), 400
+        for operation in operations:
+            error = validate_operation(operation)
+            if error:
+                return jsonify({'error': error, 'success': False}), 400
+        
+        entries = category_storage.append_changes(file_type, operations)
+        return jsonify({'success': True, 'changes': entries})
+            
+    except Exception as e:
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@categories_bp.route('/api/category-changes', methods=['GET', 'POST'])
+def category_changes():
+    """Log edits (move_message, create, rename, delete) to the saved categories"""
+    return saved_changes('categories')
+
+@categories_bp.route('/api/folder-changes', methods=['GET', 'POST'])
+def folder_changes():
+    """Log edits (move_message, create, rename, delete) to the saved folders"""
+    return saved_changes('folders')
+
 @categories_bp.route('/api/has-saved-data')
 def has_saved_data():
     """Check if user has saved categories or folders"""
@@ -526,14 +362,8 @@ def has_saved_data():
     
     try:
         # Get user email
-        email_client = g.email_client
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', 'Unknown')
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            user_email = email_client.profile.get('emailAddress', 'Unknown') if email_client.profile else 'Unknown'
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         # Initialize category storage and check
         category_storage = CategoryStorage(user_email)
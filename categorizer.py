@@ -0,0 +1,408 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Users never see more than this many folders, "Others" included
+MAX_CATEGORIES = 7
+
+# Bump whenever the prompt changes so cached categories are not reused
+PROMPT_VERSION = 2
+
+# Rough prompt-token budget per chunk (~4 characters per token) and a cap on
+# emails per chunk so the reply stays well inside the model's output limit
+DEFAULT_TOKEN_BUDGET = 1500
+DEFAULT_MAX_CHUNK_EMAILS = 50
+PROMPT_OVERHEAD_TOKENS = 350
+TOKENS_PER_LINE = 6
+
+CATEGORY_TEMPLATE = """
+                                    You are an email classifier. Your task is simple:
+
+                                    1. Read the email headings below
+                                    2. You MUST classify all headings using NO MORE THAN 7 UNIQUE CATEGORIES. If you use more than 7 unique categories, you will instantly fail.
+                                    3. Assign each email to exactly one category.
+                                    4. If you are unsure, use "Others" as the category.
+
+                                    Email headings:
+                                    {emails}
+{custom_instruction}{vocabulary}
+                                    Instructions:
+                                    - You are absolutely forbidden from using more than 7 unique category names in your entire output.
+                                    - Assign one category per email, in the same order as the email list.
+                                    - Use "Others" for any heading that does not clearly fit into one of your chosen categories.
+{output_format}                                """
+
+LINE_FORMAT = """                                    - Output ONLY in this format (do not number, do not add extra text):
+
+                                    Heading --- Category (NO MORE THAN 7 UNIQUE CATEGORIES)
+                                    Heading --- Category
+                                    Heading --- Category
+"""
+
+JSON_FORMAT = """                                    - Output ONLY a JSON object mapping each heading's number to its category, with no other text:
+
+                                    {"1": "Category", "2": "Category", "3": "Category"}
+"""
+
+CUSTOM_INSTRUCTION_TEMPLATE = """
+                                    THESE ARE THE USERS CUSTOM INSTRUCTIONS. PLEASE BE SURE TO TAKE THEM INTO ACCOUNT(if not you fail.):
+                                    {user_query}
+"""
+
+VOCABULARY_TEMPLATE = """
+                                    Other emails from this inbox were already sorted into these categories. Reuse them wherever they fit:
+                                    {categories}
+"""
+
+
+class GeminiModel:
+    def __init__(self, model_name='gemini-2.0-flash', api_key=None):
+        """Gemini text model, imported and configured on first use"""
+        self.model_name = model_name
+        self.api_key = api_key or os.environ.get('GEMINI_API_KEY', 'key goes here')
+        self.model = None
+        self.lock = threading.Lock()
+
+    def generate(self, prompt):
+        with self.lock:
+            if self.model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                self.model = genai.GenerativeModel(self.model_name)
+        response = self.model.generate_content(prompt)
+        return response.text if response else ''
+
+    def generate_stream(self, prompt):
+        """Yield the reply text as it arrives"""
+        with self.lock:
+            if self.model is None:
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                self.model = genai.GenerativeModel(self.model_name)
+        for chunk in self.model.generate_content(prompt, stream=True):
+            yield chunk.text
+
+
+REPLY_PREFIX_RE = re.compile(r'^\s*(?:(?:re|fwd?|aw|wg)\s*(?:\[\d+\])?\s*:\s*)+', re.I)
+DATE_RE = re.compile(
+    r'\b(?:\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}'
+    r'|(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.? \d{1,2}(?:st|nd|rd|th)?(?:,? \d{4})?'
+    r'|\d{1,2}(?:st|nd|rd|th)? (?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*(?:,? \d{4})?)\b',
+    re.I
+)
+# Any word containing a digit: order numbers, ticket IDs, hashes, times, counts
+ID_RE = re.compile(r'[#$]?\b[\w-]*\d[\w-]*\b')
+
+
+def subject_signature(subject):
+    """
+    Subject with Re:/Fwd: prefixes, dates, numbers and IDs removed, so that
+    "Re: Order #1234 shipped" and "Order #98 shipped" collapse to one key.
+    """
+    text = REPLY_PREFIX_RE.sub('', subject or '')
+    text = DATE_RE.sub(' ', text)
+    text = ID_RE.sub(' ', text)
+    signature = ' '.join(re.sub(r'[^\w\s]', ' ', text.lower()).split())
+    # Nothing left (an all-numeric subject): keep it to itself
+    return signature or (subject or '').strip().lower()
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + TOKENS_PER_LINE
+
+
+def normalize_category(category):
+    """Key used to merge spellings of one category across chunks ("Newsletter" / "newsletters")"""
+    key = re.sub(r'[^a-z0-9]+', '', category.lower())
+    if len(key) > 3 and key.endswith('s') and not key.endswith('ss'):
+        key = key[:-1]
+    return key
+
+
+def parse_category_lines(text):
+    """Categories from a "Heading --- Category" reply, one per non-empty line"""
+    output = []
+    for entry in text.strip().split('\n'):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        if ' --- ' in entry:
+            category = entry.split(' --- ')[-1]
+            category = category.replace('(NO MORE THAN 7 UNIQUE CATEGORIES)', '').strip()
+            output.append(category or 'Others')
+        else:
+            # If the format is unexpected, take the last word as the category
+            words = entry.split()
+            output.append(words[-1].strip() if words else 'Others')
+    return output
+
+
+class CategoryStreamParser:
+    PAIR_RE = re.compile(r'"(\d+)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+    def __init__(self, count):
+        """Incremental parser for a {"1": "Category", ...} reply of count entries"""
+        self.count = count
+        self.buffer = ''
+        self.categories = {}
+
+    def feed(self, text):
+        """Add reply text; returns the (number, category) pairs completed by it"""
+        self.buffer += text
+        pairs = []
+        end = 0
+        for match in self.PAIR_RE.finditer(self.buffer):
+            end = match.end()
+            number = int(match.group(1))
+            if 1 <= number <= self.count and number not in self.categories:
+                try:
+                    category = json.loads(f'"{match.group(2)}"').strip()
+                except ValueError:
+                    category = match.group(2).strip()
+                self.categories[number] = category or 'Others'
+                pairs.append((number, self.categories[number]))
+        # Only an unfinished pair can still be completed by later text
+        self.buffer = self.buffer[end:]
+        return pairs
+
+
+def merge_vocabularies(categories, vocabulary=None, max_categories=MAX_CATEGORIES):
+    """
+    Map every chunk's labels onto one vocabulary of at most max_categories
+    names, 'Others' included. Names in an existing vocabulary keep their
+    spelling and are kept ahead of new labels; if there are more of them
+    than fit, the most used ones stay.
+    """
+    counts = Counter()
+    names = {}
+    others = normalize_category('Others')
+    fixed = []
+    for name in vocabulary or []:
+        key = normalize_category(name)
+        if key and key != others and key not in names:
+            names[key] = name.strip()
+            fixed.append(key)
+
+    for category in categories:
+        key = normalize_category(category)
+        counts[key] += 1
+        names.setdefault(key, category.strip())
+
+    free = max(max_categories - 1, 0)
+    # sorted() is stable, so equally used names stay in vocabulary order
+    ranked = sorted(fixed, key=lambda key: -counts[key])
+    ranked += [key for key, _ in counts.most_common() if key and key != others and key not in fixed]
+    kept = set(ranked[:free])
+    return [names[normalize_category(c)] if normalize_category(c) in kept else 'Others' for c in categories]
+
+
+class CategorizationEngine:
+    def __init__(self, model=None, max_workers=4, token_budget=DEFAULT_TOKEN_BUDGET,
+                 max_chunk_emails=DEFAULT_MAX_CHUNK_EMAILS, max_categories=MAX_CATEGORIES,
+                 fallback=None, retries=1, dedupe=True, structured=True):
+        """Categorize emails in token-budgeted chunks on a bounded pool of model calls"""
+        self.model = model or GeminiModel()
+        self.max_workers = max_workers
+        self.token_budget = token_budget
+        self.max_chunk_emails = max_chunk_emails
+        self.max_categories = max_categories
+        self.fallback = fallback
+        self.retries = retries
+        self.dedupe = dedupe
+        self.structured = structured
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='categorize')
+        self.lock = threading.Lock()
+        self.last_run = None
+
+    def chunk_headings(self, headings):
+        """Split headings into chunks that fit the token budget, keeping order"""
+        budget = max(self.token_budget - PROMPT_OVERHEAD_TOKENS, TOKENS_PER_LINE)
+        chunks = []
+        current = []
+        used = 0
+        for index, heading in enumerate(headings):
+            cost = estimate_tokens(heading)
+            if current and (used + cost > budget or len(current) >= self.max_chunk_emails):
+                chunks.append(current)
+                current = []
+                used = 0
+            current.append(index)
+            used += cost
+        if current:
+            chunks.append(current)
+        return chunks
+
+    def build_prompt(self, headings, user_query='', vocabulary=None):
+        formatted_emails = '\n'.join(f'{i}. {heading}' for i, heading in enumerate(headings, 1))
+        custom_instruction = CUSTOM_INSTRUCTION_TEMPLATE.format(user_query=user_query) if user_query else ''
+        vocabulary = VOCABULARY_TEMPLATE.format(categories=', '.join(vocabulary)) if vocabulary else ''
+        return CATEGORY_TEMPLATE.format(emails=formatted_emails, custom_instruction=custom_instruction,
+                                        vocabulary=vocabulary,
+                                        output_format=JSON_FORMAT if self.structured else LINE_FORMAT)
+
+    def stream_reply(self, prompt):
+        stream = getattr(self.model, 'generate_stream', None)
+        if stream is not None:
+            return stream(prompt)
+        return [self.model.generate(prompt) or '']
+
+    def request_structured(self, headings, user_query='', vocabulary=None):
+        """
+        Categories by position, assigned as the JSON reply streams in. Only the
+        headings the reply left out are re-requested, in a smaller follow-up
+        prompt; any still missing after the retries are None.
+        """
+        categories = [None] * len(headings)
+        pending = list(range(len(headings)))
+        for attempt in range(self.retries + 1):
+            known = vocabulary or sorted(set(c for c in categories if c is not None))
+            parser = CategoryStreamParser(len(pending))
+            try:
+                for text in self.stream_reply(self.build_prompt([headings[i] for i in pending], user_query, known)):
+                    for number, category in parser.feed(text or ''):
+                        categories[pending[number - 1]] = category
+            except Exception as error:
+                print(f'Error in AI categorization chunk: {error}')
+
+            missing = [i for i in pending if categories[i] is None]
+            if not missing:
+                break
+            print(f'Warning: {len(missing)} of {len(pending)} categories missing from the reply, attempt {attempt + 1}')
+            pending = missing
+        return categories
+
+    def request_lines(self, headings, user_query='', vocabulary=None):
+        """Categories from a "Heading --- Category" reply, all None if the line count is off"""
+        prompt = self.build_prompt(headings, user_query, vocabulary)
+        for attempt in range(self.retries + 1):
+            try:
+                output = parse_category_lines(self.model.generate(prompt) or '')
+            except Exception as error:
+                print(f'Error in AI categorization chunk: {error}')
+                output = []
+            if len(output) == len(headings):
+                return output
+            print(f'Warning: Category count ({len(output)}) doesn\'t match chunk size ({len(headings)}), '
+                  f'attempt {attempt + 1}')
+        return [None] * len(headings)
+
+    def categorize_chunk(self, emails, headings, user_query='', vocabulary=None):
+        """
+        Categorize one chunk; returns (categories, latency, fallback positions).
+        Positions the model never answered get the fallback categorizer.
+        """
+        start = time.perf_counter()
+        if self.structured:
+            categories = self.request_structured(headings, user_query, vocabulary)
+        else:
+            categories = self.request_lines(headings, user_query, vocabulary)
+
+        missing = [i for i, category in enumerate(categories) if category is None]
+        if missing:
+            missing_emails = [emails[i] for i in missing]
+            fallback = self.fallback(missing_emails) if self.fallback else ['Others'] * len(missing)
+            for i, category in zip(missing, fallback):
+                categories[i] = category
+        return categories, time.perf_counter() - start, missing
+
+    def merge_vocabularies(self, categories, vocabulary=None):
+        return merge_vocabularies(categories, vocabulary, self.max_categories)
+
+    def group_duplicates(self, emails):
+        """Indexes of one representative email per subject signature, and each email's representative"""
+        representatives = []
+        members = {}
+        owner = []
+        for index, email in enumerate(emails):
+            key = subject_signature(email.get('subject', '')) if self.dedupe else index
+            if key not in members:
+                members[key] = len(representatives)
+                representatives.append(index)
+            owner.append(members[key])
+        return representatives, owner
+
+    def categorize(self, emails, user_query='', on_chunk=None, vocabulary=None, stats=None):
+        """
+        Categorize emails by subject, one category per email in input order.
+        Emails whose subjects only differ by numbers, IDs, dates or Re:/Fwd:
+        are sent once and share the answer. Without a known vocabulary the
+        first chunk runs alone to seed one, the rest run concurrently;
+        on_chunk(done, total, indexes, categories) reports progress. A stats
+        dict, if given, is filled with this run's figures; last_run holds the
+        latest run of any caller.
+        """
+        # The caller's names survive the merge; a vocabulary seeded below from the first chunk does not
+        known = vocabulary
+        representatives, owner = self.group_duplicates(emails)
+        fan_out = [[] for _ in representatives]
+        for index, group in enumerate(owner):
+            fan_out[group].append(index)
+
+        headings = [emails[i].get('subject', '') for i in representatives]
+        chunks = self.chunk_headings(headings)
+        results = [None] * len(representatives)
+        chunk_latencies = []
+        fallback_chunks = 0
+        fallback_indexes = []
+        prompt_tokens = 0
+        start = time.perf_counter()
+
+        def run(groups, vocabulary):
+            return self.categorize_chunk(
+                [emails[representatives[g]] for g in groups], [headings[g] for g in groups], user_query, vocabulary
+            )
+
+        def collect(done, groups, outcome):
+            nonlocal fallback_chunks
+            categories, latency, fell_back = outcome
+            chunk_latencies.append(latency)
+            indexes = [index for g in groups for index in fan_out[g]]
+            if fell_back:
+                fallback_chunks += 1
+                fallback_indexes.extend(index for position in fell_back for index in fan_out[groups[position]])
+            for g, category in zip(groups, categories):
+                results[g] = category
+            if on_chunk:
+                on_chunk(done, len(chunks), indexes, [results[owner[index]] for index in indexes])
+
+        for groups in chunks:
+            prompt_tokens += PROMPT_OVERHEAD_TOKENS + sum(estimate_tokens(headings[g]) for g in groups)
+
+        pending = chunks
+        if chunks and not vocabulary:
+            collect(1, chunks[0], run(chunks[0], None))
+            vocabulary = sorted(set(c for c in results if c is not None))
+            pending = chunks[1:]
+        futures = [(groups, self.executor.submit(run, groups, vocabulary)) for groups in pending]
+        for done, (groups, future) in enumerate(futures, len(chunks) - len(pending) + 1):
+            collect(done, groups, future.result())
+
+        merged = self.merge_vocabularies([results[group] for group in owner], known)
+        run_stats = {
+            'emails': len(emails),
+            'unique_subjects': len(representatives),
+            'duplicate_ratio': 1 - len(representatives) / len(emails) if emails else 0.0,
+            'prompt_tokens': prompt_tokens,
+            'chunks': len(chunks),
+            'fallback_chunks': fallback_chunks,
+            'fallback_indexes': fallback_indexes,
+            'chunk_latencies': chunk_latencies,
+            'wall_seconds': time.perf_counter() - start
+        }
+        if stats is not None:
+            stats.update(run_stats)
+        with self.lock:
+            self.last_run = run_stats
+        return merged
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.last_run) if self.last_run else None
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from categorizer import PROMPT_VERSION
+
+
+def normalize_subject(subject):
+    return ' '.join((subject or '').lower().split())
+
+
+class CategoryCache:
+    def __init__(self, max_entries=10000, storage_dir=None):
+        """LRU cache of assigned categories, with an optional SQLite tier on disk"""
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+        self.conn = None
+        if storage_dir:
+            if not os.path.exists(storage_dir):
+                os.makedirs(storage_dir)
+            self.conn = sqlite3.connect(os.path.join(storage_dir, 'categories.db'), check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS categories (key TEXT PRIMARY KEY, category TEXT NOT NULL)')
+
+    def make_key(self, email, user_query='', user_email='', vocabulary=None):
+        """
+        Hash of (normalized subject, sender, user query, prompt version, account,
+        category vocabulary). Accounts never share answers, and labels fitted to
+        one set of saved category names are not reused for another.
+        """
+        parts = [
+            str(PROMPT_VERSION),
+            normalize_subject(email.get('subject', '')),
+            (email.get('sender') or '').strip().lower(),
+            ' '.join(user_query.lower().split()),
+            (user_email or '').lower(),
+            '\x01'.join(sorted(vocabulary or []))
+        ]
+        return hashlib.sha1('\x00'.join(parts).encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        """Cached categories for the keys that have one"""
+        found = {}
+        missing = []
+        with self.lock:
+            for key in keys:
+                category = self.entries.get(key)
+                if category is not None:
+                    self.entries.move_to_end(key)
+                    found[key] = category
+                    self.stats['memory_hits'] += 1
+                else:
+                    missing.append(key)
+
+            if missing and self.conn is not None:
+                # Stay under SQLite's default bound-parameter limit
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    rows = self.conn.execute(
+                        f'SELECT key, category FROM categories WHERE key IN ({placeholders})', chunk
+                    ).fetchall()
+                    for key, category in rows:
+                        found[key] = category
+                        self._remember(key, category)
+                        self.stats['disk_hits'] += 1
+
+            self.stats['misses'] += sum(1 for key in missing if key not in found)
+        return found
+
+    def put_many(self, assignments):
+        """Store {key: category} in memory and, if enabled, on disk"""
+        with self.lock:
+            for key, category in assignments.items():
+                self._remember(key, category)
+            if self.conn is not None and assignments:
+                with self.conn:
+                    self.conn.executemany(
+                        'INSERT OR REPLACE INTO categories (key, category) VALUES (?, ?)', assignments.items()
+                    )
+
+    def _remember(self, key, category):
+        self.entries[key] = category
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, entries=len(self.entries), disk=self.conn is not None)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,85 @@
+import json
+
+# Edits to a saved grouping (categories or folders), applied in log order:
+#   {"op": "create", "name": "Receipts"}
+#   {"op": "rename", "name": "Receipts", "new_name": "Finance"}
+#   {"op": "delete", "name": "Finance", "to": "Others"}   # "to" is optional
+#   {"op": "move_message", "id": "18c2...", "to": "Finance"}
+REQUIRED_FIELDS = {
+    'create': ['name'],
+    'rename': ['name', 'new_name'],
+    'delete': ['name'],
+    'move_message': ['id', 'to'],
+}
+
+
+def validate_operation(operation):
+    """Error message for a malformed operation, or None if it can be logged"""
+    if not isinstance(operation, dict):
+        return 'operation must be an object'
+    fields = REQUIRED_FIELDS.get(operation.get('op'))
+    if fields is None:
+        return f"unknown op {operation.get('op')!r}"
+    for field in fields:
+        if not isinstance(operation.get(field), str) or not operation[field]:
+            return f"{operation['op']} needs a non-empty '{field}'"
+    return None
+
+
+def entry_id(entry):
+    """Message ID of a grouping entry: compact saves hold bare IDs, older ones email objects"""
+    return entry if isinstance(entry, str) else entry.get('id')
+
+
+def apply_operations(groups, operations):
+    """
+    Replay operations onto groups ({name: [entries]}) and return the result.
+    Lists are copied before their first change, so groups can be a shared
+    cached snapshot. Operations on groups or messages that no longer exist
+    are skipped.
+    """
+    groups = dict(groups)
+    owned = set()
+
+    def own(name):
+        if name not in owned:
+            groups[name] = list(groups.get(name, ()))
+            owned.add(name)
+        return groups[name]
+
+    for operation in operations:
+        op = operation['op']
+        if op == 'create':
+            if operation['name'] not in groups:
+                own(operation['name'])
+        elif op in ('rename', 'delete'):
+            name = operation['name']
+            target = operation.get('new_name' if op == 'rename' else 'to')
+            if name not in groups or name == target:
+                continue
+            entries = groups.pop(name)
+            owned.discard(name)
+            if target:
+                own(target).extend(entries)
+        elif op == 'move_message':
+            message_id, target = operation['id'], operation['to']
+            source = position = None
+            for name, entries in groups.items():
+                position = next((i for i, entry in enumerate(entries) if entry_id(entry) == message_id), None)
+                if position is not None:
+                    source = name
+                    break
+            if source is not None and source != target:
+                own(target).append(own(source).pop(position))
+    return groups
+
+
+def parse_log(f):
+    """Operations from an open log file of one JSON object per line; a torn last line is ignored"""
+    operations = []
+    for line in f:
+        try:
+            operations.append(json.loads(line))
+        except ValueError:
+            break
+    return operations
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+from service_cache import ServiceCache
+
+
+class ClientRegistry:
+    def __init__(self, client_factory, max_clients=50, max_memory_mb=256, idle_timeout=1800, sweep_interval=5,
+                 service_cache=None, fetch_engine=None):
+        """
+        Per-account EmailClients with LRU eviction of idle clients and a memory
+        cap. Evicting a client also drops its account's rate limiter in fetch_engine.
+        """
+        self.client_factory = client_factory
+        self.service_cache = service_cache or ServiceCache()
+        self.fetch_engine = fetch_engine
+        self.max_clients = max_clients
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.clients = OrderedDict()
+        self.lock = threading.Lock()
+        self.last_sweep = 0.0
+        self.evictions = 0
+
+    def get(self, user_email):
+        """
+        Get (or create) the client for an account, marking it most recently
+        used. The client is pinned against eviction until release() is called.
+        """
+        with self.lock:
+            client = self.clients.get(user_email)
+            if client is None:
+                client = self.client_factory()
+                client.pins = 0
+                self.clients[user_email] = client
+            else:
+                self.clients.move_to_end(user_email)
+            client.pins += 1
+            client.last_used = time.monotonic()
+
+        self.enforce_limits(keep=user_email)
+        return client
+
+    def release(self, client):
+        """Unpin a client returned by get(); it may be evicted once no request holds it"""
+        with self.lock:
+            client.pins -= 1
+            client.last_used = time.monotonic()
+
+    def get_session_client(self, credentials):
+        """Get (pinned) the client for a session's pickled credentials, binding the cached service to it"""
+        entry = self.service_cache.get(credentials)
+        client = self.get(entry.profile['emailAddress'])
+        if client.service is not entry.service:
+            # First use, or the account signed in again with new credentials
+            try:
+                with client.lock:
+                    client.add_service(entry.service, entry.profile)
+            except Exception:
+                self.release(client)
+                raise
+        return client
+
+    def enforce_limits(self, keep=None, force=False):
+        """Evict idle clients, then least recently used ones over the count/memory caps"""
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.last_sweep < self.sweep_interval and len(self.clients) <= self.max_clients:
+                return
+            self.last_sweep = now
+            candidates = [(key, client) for key, client in self.clients.items() if key != keep]
+            sizes = {key: client.estimate_memory() for key, client in self.clients.items()}
+
+        total_memory = sum(sizes.values())
+        count = len(sizes)
+        # Oldest first, so the LRU order decides who goes when over a cap
+        for key, client in candidates:
+            idle = now - (client.last_used or 0) > self.idle_timeout
+            over_cap = count > self.max_clients or total_memory > self.max_memory_bytes
+            if not idle and not over_cap:
+                continue
+            if self.evict(key, client):
+                count -= 1
+                total_memory -= sizes[key]
+
+    def evict(self, user_email, client):
+        """Close and drop a client unless a request holds it (pinned) or is using it right now"""
+        if not client.lock.acquire(blocking=False):
+            return False
+        try:
+            with self.lock:
+                # get() pins under this lock, so a client handed out can't be dropped here
+                if self.clients.get(user_email) is not client or client.pins > 0:
+                    return False
+                del self.clients[user_email]
+                self.evictions += 1
+            client.close()
+            if self.fetch_engine is not None:
+                self.fetch_engine.discard_limiter(user_email)
+            return True
+        finally:
+            client.lock.release()
+
+    def get_stats(self):
+        with self.lock:
+            clients = list(self.clients.values())
+            stats = {
+                'clients': len(clients),
+                'max_clients': self.max_clients,
+                'max_memory_mb': self.max_memory_bytes // (1024 * 1024),
+                'idle_timeout': self.idle_timeout,
+                'evictions': self.evictions
+            }
+        stats['memory_bytes'] = sum(client.estimate_memory() for client in clients)
+        return stats
@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Gmail allows 250 quota units per user per second; messages.get costs 5 units
+GMAIL_USER_QUOTA_PER_SECOND = 250
+MESSAGES_GET_COST = 5
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        """Token bucket refilling at `rate` tokens per second"""
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        """Block until `cost` tokens are available, return seconds spent waiting"""
+        # A request larger than the bucket could never be admitted otherwise
+        cost = min(cost, self.capacity)
+        start = time.monotonic()
+
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= cost:
+                    self.tokens -= cost
+                    return now - start
+
+                delay = (cost - self.tokens) / self.rate
+
+            time.sleep(delay)
+
+
+class FetchEngine:
+    def __init__(self, max_workers=4, quota_per_second=GMAIL_USER_QUOTA_PER_SECOND):
+        """Bounded worker pool shared across routes, rate limited per Gmail user"""
+        self.max_workers = max_workers
+        self.quota_per_second = quota_per_second
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gmail-fetch')
+        self.limiters = {}
+        self.lock = threading.Lock()
+        self.totals = {
+            'runs': 0,
+            'tasks': 0,
+            'limiter_wait_seconds': 0.0,
+            'io_seconds': 0.0,
+            'wall_seconds': 0.0
+        }
+        self.last_run = None
+
+    def get_limiter(self, user_key):
+        """Get (or create) the token bucket for a user"""
+        with self.lock:
+            limiter = self.limiters.get(user_key)
+            if limiter is None:
+                limiter = TokenBucket(self.quota_per_second)
+                self.limiters[user_key] = limiter
+            return limiter
+
+    def discard_limiter(self, user_key):
+        """Forget a user's token bucket; a later map() starts a full one"""
+        with self.lock:
+            self.limiters.pop(user_key, None)
+
+    def submit(self, func, *args, **kwargs):
+        """Run an arbitrary callable on the shared pool"""
+        return self.executor.submit(func, *args, **kwargs)
+
+    def map(self, func, items, user_key='default', cost=MESSAGES_GET_COST):
+        """
+        Run func(item) for every item on the pool, charging `cost` quota units
+        (or cost(item) if callable) to the user's limiter before each call.
+        Results come back in input order; a failed call yields its exception.
+        """
+        limiter = self.get_limiter(user_key)
+        run = {
+            'tasks': 0,
+            'limiter_wait_seconds': 0.0,
+            'io_seconds': 0.0,
+            'wall_seconds': 0.0
+        }
+
+        def task(item):
+            waited = limiter.acquire(cost(item) if callable(cost) else cost)
+            start = time.perf_counter()
+            try:
+                return func(item)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self.lock:
+                    run['tasks'] += 1
+                    run['limiter_wait_seconds'] += waited
+                    run['io_seconds'] += elapsed
+
+        start = time.perf_counter()
+        futures = [self.executor.submit(task, item) for item in items]
+
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as error:
+                results.append(error)
+
+        run['wall_seconds'] = time.perf_counter() - start
+
+        with self.lock:
+            self.totals['runs'] += 1
+            for key in ('tasks', 'limiter_wait_seconds', 'io_seconds', 'wall_seconds'):
+                self.totals[key] += run[key]
+            self.last_run = run
+
+        return results
+
+    def get_stats(self):
+        """Cumulative and last-run timings (wait and I/O are summed across workers)"""
+        with self.lock:
+            return {
+                'max_workers': self.max_workers,
+                'quota_per_second': self.quota_per_second,
+                'users': len(self.limiters),
+                'totals': dict(self.totals),
+                'last_run': dict(self.last_run) if self.last_run else None
+            }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,68 @@
+import re
+from html import unescape
+
+# Elements whose content is never rendered as text
+SKIPPED_TAGS = ['style', 'script', 'head', 'title', 'noscript', 'template', 'svg']
+
+# Elements that break a line when rendered, so their text must not run together
+BLOCK_TAGS = [
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'footer', 'form',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre',
+    'section', 'table', 'tbody', 'td', 'tfoot', 'th', 'thead', 'tr', 'ul'
+]
+
+_skipped = '|'.join(SKIPPED_TAGS)
+
+# One token per match: a whole non-visible element, a run of adjacent markup
+# (tags and comments), or a run of text
+TOKEN_RE = re.compile(
+    rf'(?P<skip><({_skipped})\b[^>]*>.*?(?:</\2\s*>|$))'
+    rf'|(?P<markup>(?:<!--.*?(?:-->|$)|<(?!(?:{_skipped})\b)[a-zA-Z/!?][^>]*>)+)'
+    r'|(?P<text>[^<]+|<)',
+    re.S | re.I
+)
+BLOCK_TAG_RE = re.compile(rf'</?(?:{"|".join(BLOCK_TAGS)})\b', re.I)
+
+
+def html_to_text(html_content, max_chars=None):
+    """
+    Extract visible text from HTML in a single pass: tags are dropped, entities
+    decoded and whitespace collapsed, and style/script/head content is skipped.
+    With max_chars, scanning stops as soon as that much text has been produced.
+    """
+    if not html_content:
+        return ''
+
+    pieces = []
+    length = 0
+    pending_space = False
+
+    for match in TOKEN_RE.finditer(html_content):
+        kind = match.lastgroup
+        if kind == 'markup':
+            if not pending_space and BLOCK_TAG_RE.search(match.group(0)):
+                pending_space = True
+            continue
+        if kind == 'skip':
+            continue
+
+        token = match.group(0)
+        if '&' in token:
+            token = unescape(token)
+        text = ' '.join(token.split())
+        if not text:
+            pending_space = True
+            continue
+        if length and (pending_space or token[0].isspace()):
+            pieces.append(' ')
+            length += 1
+        pieces.append(text)
+        length += len(text)
+        pending_space = token[-1].isspace()
+        if max_chars is not None and length >= max_chars:
+            break
+
+    text = ''.join(pieces)
+    if max_chars is not None:
+        text = text[:max_chars].rstrip()
+    return text
@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobRunner:
+    def __init__(self, max_workers=2, max_jobs_per_user=2):
+        """Bounded pool for background jobs, with a cap on each user's queued and running jobs"""
+        self.max_workers = max_workers
+        self.max_jobs_per_user = max_jobs_per_user
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self.active = {}
+        self.lock = threading.Lock()
+        self.stats = {'submitted': 0, 'rejected': 0, 'completed': 0, 'failed': 0, 'run_seconds': 0.0}
+
+    def submit(self, user_key, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) for user_key; returns its Future, or None if the user is at the cap"""
+        with self.lock:
+            if self.active.get(user_key, 0) >= self.max_jobs_per_user:
+                self.stats['rejected'] += 1
+                return None
+            self.active[user_key] = self.active.get(user_key, 0) + 1
+            self.stats['submitted'] += 1
+
+        def run():
+            start = time.perf_counter()
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                with self.lock:
+                    self.active[user_key] -= 1
+                    if not self.active[user_key]:
+                        del self.active[user_key]
+                    self.stats['failed' if failed else 'completed'] += 1
+                    self.stats['run_seconds'] += time.perf_counter() - start
+
+        try:
+            return self.executor.submit(run)
+        except RuntimeError:
+            # Executor already shut down
+            with self.lock:
+                self.active[user_key] -= 1
+                if not self.active[user_key]:
+                    del self.active[user_key]
+            raise
+
+    def active_jobs(self, user_key):
+        with self.lock:
+            return self.active.get(user_key, 0)
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, active=sum(self.active.values()), users=len(self.active),
+                        max_workers=self.max_workers, max_jobs_per_user=self.max_jobs_per_user)
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+class JobEvents:
+    def __init__(self, max_events_per_job=500):
+        """Per-job event log that streaming clients wait on instead of polling"""
+        self.max_events_per_job = max_events_per_job
+        self.events = {}
+        self.condition = threading.Condition()
+
+    def publish(self, job_id, event, data):
+        with self.condition:
+            log = self.events.setdefault(job_id, [])
+            # Keep ids increasing even if older events are dropped
+            event_id = log[-1][0] + 1 if log else 0
+            log.append((event_id, event, data))
+            if len(log) > self.max_events_per_job:
+                del log[0]
+            self.condition.notify_all()
+
+    def wait(self, job_id, after=-1, timeout=15):
+        """Events with an id above `after`, blocking up to timeout seconds for one to arrive"""
+        with self.condition:
+            self.condition.wait_for(
+                lambda: any(event_id > after for event_id, _, _ in self.events.get(job_id, ())[-1:]),
+                timeout=timeout
+            )
+            return [entry for entry in self.events.get(job_id, ()) if entry[0] > after]
+
+    def discard(self, job_id):
+        with self.condition:
+            self.events.pop(job_id, None)
+
+    def get_stats(self):
+        with self.condition:
+            return {'jobs': len(self.events), 'events': sum(len(log) for log in self.events.values())}
@@ -0,0 +1,219 @@
+import hashlib
+import heapq
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class JobStore:
+    def __init__(self, ttl=3600, max_memory_mb=64, spill_dir=None, on_expire=None):
+        """
+        Status and results of background jobs. Jobs expire ttl seconds after
+        their last update, in expiry order off a heap; results beyond the
+        memory budget are spilled to spill_dir least-recently-used first and
+        read back on demand.
+        """
+        self.ttl = ttl
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self.spill_dir = None
+        self.on_expire = on_expire
+        self.jobs = {}
+        # job_id -> size of its result held in memory, least recently used first
+        self.resident = OrderedDict()
+        self.memory_bytes = 0
+        self.expiry_heap = []
+        self.lock = threading.RLock()
+        self.stats = {'expired': 0, 'spilled': 0, 'dropped': 0, 'disk_reads': 0}
+
+        if spill_dir:
+            if not os.path.exists(spill_dir):
+                os.makedirs(spill_dir)
+            self.remove_stale_spills(spill_dir)
+            # Each process spills into a directory of its own, so other workers
+            # sharing spill_dir never see (or delete) its files
+            self.spill_dir = os.path.join(spill_dir, f"{os.getpid()}-{os.urandom(4).hex()}")
+            os.makedirs(self.spill_dir)
+
+    def remove_stale_spills(self, root):
+        """
+        Delete results spilled under root more than ttl seconds ago, and
+        directories left empty. Their jobs have expired in whichever process
+        spilled them, or that process has exited and can't look them up.
+        """
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(root):
+            try:
+                if entry.is_dir():
+                    # Removing files below updates the directory's own mtime
+                    idle = entry.stat().st_mtime < cutoff
+                    for spilled in os.scandir(entry.path):
+                        if spilled.stat().st_mtime < cutoff:
+                            os.remove(spilled.path)
+                    if idle:
+                        # Only succeeds once the directory is empty
+                        os.rmdir(entry.path)
+                elif entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def set_status(self, job_id, status, owner=None):
+        """Record a job's status; owner (the user who started it) is kept from the first update that gives it"""
+        with self.lock:
+            self.expire()
+            job = self.jobs.setdefault(job_id, {'status': None, 'result': None, 'spill_path': None, 'owner': None})
+            job['status'] = status
+            if owner is not None:
+                job['owner'] = owner
+            self.touch(job_id, job)
+
+    def get_status(self, job_id):
+        with self.lock:
+            self.expire()
+            job = self.jobs.get(job_id)
+            return job['status'] if job else None
+
+    def get_owner(self, job_id):
+        with self.lock:
+            self.expire()
+            job = self.jobs.get(job_id)
+            return job['owner'] if job else None
+
+    def set_result(self, job_id, result):
+        """Store a job's result; its size counts against the memory budget"""
+        size = len(json.dumps(result, default=str))
+        with self.lock:
+            self.expire()
+            job = self.jobs.setdefault(job_id, {'status': None, 'result': None, 'spill_path': None, 'owner': None})
+            self.release(job_id, job)
+            job['result'] = result
+            self.resident[job_id] = size
+            self.memory_bytes += size
+            self.touch(job_id, job)
+            self.enforce_budget(keep=job_id)
+
+    def get_result(self, job_id):
+        with self.lock:
+            self.expire()
+            job = self.jobs.get(job_id)
+            if not job:
+                return None
+            if job_id in self.resident:
+                self.resident.move_to_end(job_id)
+                return job['result']
+            if not job['spill_path']:
+                return None
+            path = job['spill_path']
+
+        # Read spilled results outside the lock; the file is never rewritten in place
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError as e:
+            print(f"Error reading spilled job result {job_id}: {e}")
+            return None
+        result = json.loads(text)
+
+        with self.lock:
+            self.stats['disk_reads'] += 1
+            job = self.jobs.get(job_id)
+            if job and job['spill_path'] == path and job_id not in self.resident:
+                job['result'] = result
+                self.resident[job_id] = len(text)
+                self.memory_bytes += len(text)
+                self.enforce_budget(keep=job_id)
+        return result
+
+    def has_job(self, job_id):
+        with self.lock:
+            self.expire()
+            return job_id in self.jobs
+
+    def discard(self, job_id):
+        with self.lock:
+            job = self.jobs.pop(job_id, None)
+            if job:
+                self.release(job_id, job)
+
+    def touch(self, job_id, job):
+        job['expires_at'] = time.time() + self.ttl
+        heapq.heappush(self.expiry_heap, (job['expires_at'], job_id))
+        # Every update leaves a stale entry behind; rebuild before they pile up
+        if len(self.expiry_heap) > 2 * len(self.jobs) + 64:
+            self.expiry_heap = [(entry['expires_at'], key) for key, entry in self.jobs.items()]
+            heapq.heapify(self.expiry_heap)
+
+    def expire(self, now=None):
+        """Drop every job whose TTL has passed, soonest first"""
+        now = now or time.time()
+        expired = []
+        with self.lock:
+            while self.expiry_heap and self.expiry_heap[0][0] <= now:
+                expires_at, job_id = heapq.heappop(self.expiry_heap)
+                job = self.jobs.get(job_id)
+                # Stale heap entry: the job was updated (or removed) since this was pushed
+                if not job or job['expires_at'] != expires_at:
+                    continue
+                self.discard(job_id)
+                self.stats['expired'] += 1
+                expired.append(job_id)
+        if self.on_expire:
+            for job_id in expired:
+                self.on_expire(job_id)
+        return expired
+
+    def release(self, job_id, job):
+        """Free a job's in-memory result and delete any spilled copy"""
+        size = self.resident.pop(job_id, None)
+        if size is not None:
+            self.memory_bytes -= size
+        job['result'] = None
+        if job['spill_path']:
+            try:
+                os.remove(job['spill_path'])
+            except OSError:
+                pass
+            job['spill_path'] = None
+
+    def enforce_budget(self, keep=None):
+        """Spill (or without a spill_dir, drop) least recently used results until under budget"""
+        while self.memory_bytes > self.max_memory_bytes and self.resident:
+            job_id = next(iter(self.resident))
+            if job_id == keep:
+                if len(self.resident) == 1:
+                    break
+                self.resident.move_to_end(job_id)
+                continue
+
+            job = self.jobs[job_id]
+            size = self.resident.pop(job_id)
+            self.memory_bytes -= size
+            if self.spill_dir and not job['spill_path']:
+                path = os.path.join(self.spill_dir, hashlib.sha1(job_id.encode('utf-8')).hexdigest() + '.json')
+                try:
+                    # Another process may have swept the directory while it was empty
+                    os.makedirs(self.spill_dir, exist_ok=True)
+                    with open(path, 'w', encoding='utf-8') as f:
+                        json.dump(job['result'], f, default=str)
+                    job['spill_path'] = path
+                    self.stats['spilled'] += 1
+                except OSError as e:
+                    print(f"Error spilling job result {job_id}: {e}")
+                    self.stats['dropped'] += 1
+            elif not job['spill_path']:
+                self.stats['dropped'] += 1
+            job['result'] = None
+
+    def get_stats(self):
+        with self.lock:
+            self.expire()
+            return dict(
+                self.stats,
+                jobs=len(self.jobs),
+                resident_results=len(self.resident),
+                spilled_results=sum(1 for job in self.jobs.values() if job['spill_path']),
+                memory_bytes=self.memory_bytes,
+                max_memory_bytes=self.max_memory_bytes
+            )
@@ -0,0 +1,117 @@
+import json
+import os
+import re
+
+# Checked in order; the first category that matches wins. Keywords match whole
+# words (or phrases); a trailing * matches any word that starts with the keyword
+# ("meeting*" also matches "meetings")
+DEFAULT_RULES = [
+    ('Meetings', ['meeting*', 'calendar*', 'appointment*', 'schedul*']),
+    ('Work', ['project*', 'task*', 'deadline*', 'work*', 'team*']),
+    ('Newsletters', ['newsletter*', 'news', 'update*', 'weekly', 'daily']),
+    ('Finance', ['bill', 'bills', 'billing', 'payment*', 'invoice*', 'bank*', 'statement*']),
+    ('Security', ['security', 'alert*', 'login*', 'password*', 'verification*']),
+    ('Social', ['social', 'facebook', 'twitter', 'linkedin', 'instagram']),
+]
+
+DEFAULT_FIELDS = ['subject', 'sender', 'snippet']
+
+
+WORD_RE = re.compile(r'\w+')
+
+
+def load_rules(path):
+    """Rules from a JSON file mapping category to keywords, in priority order"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return [(category, list(keywords)) for category, keywords in data.items()]
+
+
+class KeywordRuleEngine:
+    def __init__(self, rules=None, fields=None, default='Others'):
+        """
+        Keyword categorizer that compiles every rule into word and prefix
+        tables, so each field is tokenized once and matched in a single pass
+        whatever the number of rules. Fields are checked in order and the
+        first one with a match decides.
+
+        These tables stand in for an Aho-Corasick automaton or one compiled
+        alternation regex. Matching costs one dict lookup per (token, phrase
+        length), plus one per distinct prefix length, so it grows with the
+        text and with the longest phrase but not with the number of rules. A
+        compiled alternation is tried rule by rule at every word start by
+        Python's backtracking re. With the built-in rules it is a little
+        faster (~4 us/email against ~7 here), but with 200 extra rules it
+        takes ~250-330 us against ~8 (benchmarks/bench_keyword_rules.py
+        --rules 200). A pure-Python automaton would step per character
+        rather than per token.
+        """
+        self.rules = list(rules if rules is not None else DEFAULT_RULES)
+        self.fields = list(fields or DEFAULT_FIELDS)
+        self.default = default
+        self.categories = [category for category, _ in self.rules]
+
+        # Phrase (or phrase prefix) -> index of the highest-priority rule using it
+        self.words = {}
+        self.prefixes = {}
+        self.max_words = 1
+        for index, (_, keywords) in enumerate(self.rules):
+            for keyword in keywords:
+                keyword = keyword.strip().lower()
+                table = self.prefixes if keyword.endswith('*') else self.words
+                tokens = WORD_RE.findall(keyword)
+                if not tokens:
+                    continue
+                table.setdefault(' '.join(tokens), index)
+                self.max_words = max(self.max_words, len(tokens))
+        self.prefix_lengths = sorted({len(prefix) for prefix in self.prefixes})
+
+    def match_text(self, text):
+        """Index of the highest-priority rule matching text on word boundaries, or None"""
+        tokens = WORD_RE.findall(text.lower())
+        best = None
+        for start in range(len(tokens)):
+            phrase = ''
+            for end in range(start, min(start + self.max_words, len(tokens))):
+                last = tokens[end]
+                phrase = f'{phrase} {last}' if phrase else last
+                index = self.words.get(phrase)
+                if self.prefixes:
+                    # A prefix keyword has to end inside the phrase's last word
+                    shortest = len(phrase) - len(last) + 1
+                    for length in self.prefix_lengths:
+                        if length > len(phrase):
+                            break
+                        if length >= shortest:
+                            found = self.prefixes.get(phrase[:length])
+                            if found is not None and (index is None or found < index):
+                                index = found
+                if index is not None and (best is None or index < best):
+                    best = index
+                    if best == 0:
+                        return best
+        return best
+
+    def categorize_one(self, email):
+        for field in self.fields:
+            text = email.get(field)
+            if text:
+                index = self.match_text(text)
+                if index is not None:
+                    return self.categories[index]
+        return self.default
+
+    def categorize(self, emails):
+        return [self.categorize_one(email) for email in emails]
+
+
+def build_engine(path=None):
+    """Engine with the rules from path (or KEYWORD_RULES_FILE) ahead of the defaults"""
+    path = path or os.environ.get('KEYWORD_RULES_FILE')
+    rules = list(DEFAULT_RULES)
+    if path and os.path.exists(path):
+        try:
+            rules = load_rules(path) + rules
+        except Exception as e:
+            print(f"Error loading keyword rules from {path}: {e}")
+    return KeywordRuleEngine(rules)
@@ -0,0 +1,119 @@
+import math
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Snippets are long and mostly boilerplate past the first sentence or two
+MAX_SNIPPET_TOKENS = 30
+
+
+def extract_features(email):
+    """Subject, sender and snippet tokens, prefixed so the same word counts separately per field"""
+    features = []
+    for token in TOKEN_RE.findall((email.get('subject') or '').lower()):
+        if not token.isdigit():
+            features.append('s:' + token)
+
+    sender = (email.get('sender') or '').lower()
+    if '@' in sender:
+        features.append('d:' + sender.rsplit('@', 1)[-1].strip('> '))
+    for token in TOKEN_RE.findall(sender.split('<')[0]):
+        features.append('f:' + token)
+
+    snippet_tokens = TOKEN_RE.findall((email.get('snippet') or '').lower())[:MAX_SNIPPET_TOKENS]
+    for token in snippet_tokens:
+        if not token.isdigit():
+            features.append('n:' + token)
+    return features
+
+
+class LocalClassifier:
+    def __init__(self, n_features=2 ** 18, alpha=0.1, threshold=0.9, min_examples=20):
+        """Multinomial naive Bayes over hashed email features, trained on labels the model already assigned"""
+        self.n_features = n_features
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_examples = min_examples
+        self.labels = []
+        self.log_priors = []
+        self.log_likelihoods = []
+        self.log_unseen = []
+        self.known = set()
+        self.examples = 0
+        self.stats = {'classified': 0, 'confident': 0, 'train_seconds': 0.0}
+        self.lock = threading.Lock()
+
+    def hash_features(self, email):
+        return [zlib.crc32(feature.encode('utf-8')) % self.n_features for feature in extract_features(email)]
+
+    def fit(self, emails, labels):
+        """Train on (email, category) pairs; returns self"""
+        start = time.perf_counter()
+        label_counts = Counter(labels)
+        feature_counts = {label: Counter() for label in label_counts}
+        for email, label in zip(emails, labels):
+            feature_counts[label].update(self.hash_features(email))
+
+        self.labels = sorted(label_counts)
+        self.examples = sum(label_counts.values())
+        self.log_priors = [math.log(label_counts[label] / self.examples) for label in self.labels]
+        self.log_likelihoods = []
+        self.log_unseen = []
+        self.known = set()
+        for label in self.labels:
+            counts = feature_counts[label]
+            denominator = sum(counts.values()) + self.alpha * self.n_features
+            self.log_likelihoods.append(
+                {feature: math.log((count + self.alpha) / denominator) for feature, count in counts.items()}
+            )
+            self.log_unseen.append(math.log(self.alpha / denominator))
+            self.known.update(counts)
+        self.stats['train_seconds'] = time.perf_counter() - start
+        return self
+
+    @property
+    def ready(self):
+        return self.examples >= self.min_examples and len(self.labels) > 1
+
+    def predict_one(self, email):
+        """(category, confidence) for one email; confidence is 0 when none of its features were seen"""
+        features = [feature for feature in self.hash_features(email) if feature in self.known]
+        if not features or not self.labels:
+            return (self.labels[0] if self.labels else 'Others'), 0.0
+
+        scores = []
+        for prior, likelihoods, unseen in zip(self.log_priors, self.log_likelihoods, self.log_unseen):
+            scores.append(prior + sum(likelihoods.get(feature, unseen) for feature in features))
+        best = max(scores)
+        total = sum(math.exp(score - best) for score in scores)
+        index = scores.index(best)
+        return self.labels[index], 1.0 / total
+
+    def classify(self, emails):
+        """
+        Split emails into confident answers and the rest: returns
+        ({index: category}, [uncertain indexes]).
+        """
+        answered = {}
+        uncertain = []
+        if not self.ready:
+            return answered, list(range(len(emails)))
+
+        for index, email in enumerate(emails):
+            category, confidence = self.predict_one(email)
+            if confidence >= self.threshold:
+                answered[index] = category
+            else:
+                uncertain.append(index)
+        with self.lock:
+            self.stats['classified'] += len(emails)
+            self.stats['confident'] += len(answered)
+        return answered, uncertain
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, examples=self.examples, labels=len(self.labels))
@@ -1,7 +1,6 @@
 from flask import Flask, request, redirect, session, url_for, render_template, jsonify, g
 from flask_cors import CORS
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from google.auth.transport.requests import Request
 import os
 import threading
@@ -12,10 +11,9 @@ import pickle
 import json
 from datetime import timedelta
 import base64
-from utils import EmailClient, gen_categories, QuerySaver, CategoryStorage
+from utils import gen_categories, get_category_cache, QuerySaver, CategoryStorage
 import random
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 import ssl
 from googleapiclient.errors import HttpError
 import httplib2
@@ -23,11 +21,12 @@ import httplib2
 # Configure httplib2 for better SSL handling
 httplib2.Http.force_exception_to_status_code = True
 
-# Create a thread pool executor
-executor = ThreadPoolExecutor(max_workers=4)
+# Shared worker pool and per-user email clients, the same instances the blueprints use
+from blueprints import fetch_engine, service_cache, client_registry, job_runner, job_events, job_store, get_email_client, release_email_clients
 
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:5000"], supports_credentials=True)  # Enable CORS for static frontend
+app.teardown_request(release_email_clients)  # Unpin EmailClients once each request is done
 app.secret_key = 'your-secret-key-here-make-this-consistent'  # Use consistent secret key
 app.permanent_session_lifetime = timedelta(minutes=15)
 
@@ -50,8 +49,6 @@ CLIENT_SECRETS_FILE = 'credentials.json'
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly', 'https://www.googleapis.com/auth/gmail.modify']
 REDIRECT_URI = 'http://localhost:5000/login/google/authorized'  # Matches your credentials.json
 
-# Initialize email client
-email_client = EmailClient()
 query = QuerySaver()
 
 # Initialize the OAuth flow
@@ -68,7 +65,6 @@ def get_flow():
 @app.before_request
 def before_request():
     """Set up shared objects for each request"""
-    g.email_client = email_client
     g.query = query
 
 @app.route('/')
@@ -86,17 +82,11 @@ def inbox():
         return redirect(url_for('index'))
     
     try:
-        if email_client.has_service and email_client.email_list!=None:
-            email_list = email_client.email_list
-            profile = email_client.profile
-            user_email = profile.get('emailAddress', 'Unknown') if profile else 'Unknown'
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            email_list = email_client.get_messages(max_results=100)
-            profile = email_client.profile
-            user_email = profile.get('emailAddress', 'Unknown') if profile else 'Unknown'
+        email_client = get_email_client()
+        # Brings the restored or cached mail set up to date (a history delta when the checkpoint is fresh)
+        email_list = email_client.sync_messages(max_results=100)
+        profile = email_client.profile
+        user_email = profile.get('emailAddress', 'Unknown') if profile else 'Unknown'
         
         return render_template('inbox.html', 
                              emails=email_list, 
@@ -113,7 +103,14 @@ def health_check():
         'status': 'healthy',
         'message': 'Flask backend is running',
         'authenticated': 'credentials' in session,
-        'session_keys': list(session.keys())
+        'session_keys': list(session.keys()),
+        'fetch_engine': fetch_engine.get_stats(),
+        'email_clients': client_registry.get_stats(),
+        'service_cache': service_cache.get_stats(),
+        'category_cache': get_category_cache().get_stats(),
+        'categorize_jobs': job_runner.get_stats(),
+        'job_events': job_events.get_stats(),
+        'job_store': job_store.get_stats()
     })
 
 @app.route('/api/debug')
@@ -177,13 +174,8 @@ def chat_page():
         return redirect(url_for('login_page'))
     
     try:
-        if email_client.has_service and email_client.profile:
-            user_email = email_client.profile.get('emailAddress', 'Unknown') if email_client.profile else 'Unknown'
-        else:
-            creds = pickle.loads(session['credentials'])
-            service = build('gmail', 'v1', credentials=creds)
-            email_client.add_service(service)
-            user_email = email_client.profile.get('emailAddress', 'Unknown') if email_client.profile else 'Unknown'
+        email_client = get_email_client()
+        user_email = email_client.profile.get('emailAddress', 'Unknown')
         
         return render_template('chat.html', user_email=user_email)
     except Exception as e:
@@ -271,6 +263,7 @@ def authorized():
 
 @app.route('/logout')
 def logout():
+    session.pop('user_email', None)
     session.pop('credentials', None)
     session.pop('oauth_state', None)
     return redirect(url_for('login_page'))
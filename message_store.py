@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    timestamp REAL NOT NULL DEFAULT 0,
+    date TEXT NOT NULL DEFAULT '',
+    subject TEXT NOT NULL DEFAULT '',
+    sender TEXT NOT NULL DEFAULT '',
+    recipient TEXT NOT NULL DEFAULT '',
+    snippet TEXT NOT NULL DEFAULT '',
+    labels TEXT NOT NULL DEFAULT '[]',
+    is_unread INTEGER NOT NULL DEFAULT 0,
+    body TEXT,
+    html_body BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages (sender);
+
+CREATE TABLE IF NOT EXISTS message_labels (
+    message_id TEXT NOT NULL,
+    label TEXT NOT NULL,
+    PRIMARY KEY (message_id, label)
+);
+CREATE INDEX IF NOT EXISTS idx_message_labels_label ON message_labels (label);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+LIST_COLUMNS = 'id, timestamp, date, subject, sender, recipient, snippet, labels, is_unread'
+
+
+class MessageStore:
+    def __init__(self, user_email, storage_dir="message_store"):
+        """Per-user SQLite (WAL) store of parsed Gmail messages"""
+        self.user_email = user_email
+        self.storage_dir = storage_dir
+        self.ensure_storage_dir()
+
+        self.path = self.get_user_db_path()
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def ensure_storage_dir(self):
+        """Ensure the storage directory exists"""
+        if not os.path.exists(self.storage_dir):
+            os.makedirs(self.storage_dir)
+
+    def get_user_db_path(self):
+        """Get database path for user's message store"""
+        email_hash = hashlib.md5(self.user_email.encode()).hexdigest()
+        return os.path.join(self.storage_dir, f"{email_hash}_messages.db")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def row_to_email(self, row):
+        """Convert a list-columns row to the EmailClient.parse_message shape"""
+        labels = json.loads(row[7])
+        return {
+            'id': row[0],
+            'timestamp': row[1],
+            'subject': row[3],
+            'sender': row[4],
+            'date': row[2],
+            'to': row[5],
+            'body': '',
+            'content': '',
+            'is_unread': bool(row[8]),
+            'snippet': row[6],
+            'labels': labels,
+            'body_loaded': False
+        }
+
+    def upsert_messages(self, emails):
+        """Write parsed messages; bodies are only overwritten when loaded"""
+        with self.lock, self.conn:
+            for email in emails:
+                labels = email.get('labels', [])
+                self.conn.execute(
+                    """INSERT INTO messages (id, timestamp, date, subject, sender, recipient,
+                                             snippet, labels, is_unread)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                       ON CONFLICT(id) DO UPDATE SET
+                           timestamp = excluded.timestamp, date = excluded.date,
+                           subject = excluded.subject, sender = excluded.sender,
+                           recipient = excluded.recipient, snippet = excluded.snippet,
+                           labels = excluded.labels, is_unread = excluded.is_unread""",
+                    (email['id'], email.get('timestamp') or 0, email.get('date', ''),
+                     email.get('subject', ''), email.get('sender', ''), email.get('to', ''),
+                     email.get('snippet', ''), json.dumps(labels), int(email.get('is_unread', False)))
+                )
+                self.conn.execute('DELETE FROM message_labels WHERE message_id = ?', (email['id'],))
+                self.conn.executemany(
+                    'INSERT INTO message_labels (message_id, label) VALUES (?, ?)',
+                    [(email['id'], label) for label in labels]
+                )
+                if email.get('body_loaded'):
+                    self._save_body(email)
+
+    def _save_body(self, email):
+        html = email.get('html_body')
+        compressed = zlib.compress(html.encode('utf-8')) if html else None
+        self.conn.execute(
+            'UPDATE messages SET body = ?, html_body = ? WHERE id = ?',
+            (email.get('body', ''), compressed, email['id'])
+        )
+
+    def delete_messages(self, message_ids):
+        with self.lock, self.conn:
+            for message_id in message_ids:
+                self.conn.execute('DELETE FROM messages WHERE id = ?', (message_id,))
+                self.conn.execute('DELETE FROM message_labels WHERE message_id = ?', (message_id,))
+
+    def prune_messages(self, listed_ids, after=None, before=None):
+        """
+        Delete messages with after < timestamp < before (either bound
+        optional) that are not in listed_ids, a Gmail listing of that range.
+        Returns the IDs deleted.
+        """
+        clauses = []
+        params = []
+        if after is not None:
+            clauses.append('timestamp > ?')
+            params.append(after)
+        if before is not None:
+            clauses.append('timestamp < ?')
+            params.append(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        listed = set(listed_ids)
+        with self.lock, self.conn:
+            rows = self.conn.execute(f'SELECT id FROM messages {where}', params).fetchall()
+            stale = [(row[0],) for row in rows if row[0] not in listed]
+            self.conn.executemany('DELETE FROM messages WHERE id = ?', stale)
+            self.conn.executemany('DELETE FROM message_labels WHERE message_id = ?', stale)
+        return [row[0] for row in stale]
+
+    def get_messages(self, message_ids):
+        """Get list entries (no bodies) for the given IDs, in the given order"""
+        if not message_ids:
+            return []
+        found = {}
+        with self.lock:
+            # Stay under SQLite's default bound-parameter limit
+            for start in range(0, len(message_ids), 500):
+                chunk = message_ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.conn.execute(
+                    f'SELECT {LIST_COLUMNS} FROM messages WHERE id IN ({placeholders})', chunk
+                ).fetchall()
+                for row in rows:
+                    found[row[0]] = self.row_to_email(row)
+        return [found[message_id] for message_id in message_ids if message_id in found]
+
+    def get_full_message(self, message_id):
+        """Get a message with its stored body, or None if the body was never loaded"""
+        with self.lock:
+            row = self.conn.execute(
+                f'SELECT {LIST_COLUMNS}, body, html_body FROM messages WHERE id = ?', (message_id,)
+            ).fetchone()
+        if row is None or row[9] is None:
+            return None
+
+        email = self.row_to_email(row)
+        email['body'] = row[9]
+        email['content'] = row[9]
+        email['body_loaded'] = True
+        if row[10] is not None:
+            email['html_body'] = zlib.decompress(row[10]).decode('utf-8')
+        return email
+
+    def query_messages(self, label=None, sender=None, before=None, after=None, limit=50, before_id=None):
+        """
+        List entries newest first, filtered through the label/sender/date
+        indexes. With before_id, messages at exactly the before timestamp
+        with a smaller ID are included too, so (timestamp, id) of the last
+        entry of one page resumes the next without skipping ties.
+        """
+        clauses = []
+        params = []
+        if label:
+            clauses.append('id IN (SELECT message_id FROM message_labels WHERE label = ?)')
+            params.append(label)
+        if sender:
+            clauses.append('sender = ?')
+            params.append(sender)
+        if before is not None and before_id is not None:
+            clauses.append('(timestamp < ? OR (timestamp = ? AND id < ?))')
+            params.extend([before, before, before_id])
+        elif before is not None:
+            clauses.append('timestamp < ?')
+            params.append(before)
+        if after is not None:
+            clauses.append('timestamp >= ?')
+            params.append(after)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        with self.lock:
+            rows = self.conn.execute(
+                f'SELECT {LIST_COLUMNS} FROM messages {where} ORDER BY timestamp DESC, id DESC LIMIT ?',
+                params + [limit]
+            ).fetchall()
+        return [self.row_to_email(row) for row in rows]
+
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        with self.lock, self.conn:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value))
+            )
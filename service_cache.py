@@ -0,0 +1,136 @@
+import hashlib
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+import google_auth_httplib2
+from google.auth.transport.requests import Request
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import build_http
+
+# Refresh access tokens this long before they expire, off the request path
+TOKEN_REFRESH_MARGIN = timedelta(minutes=5)
+
+
+class ThreadLocalHttp(google_auth_httplib2.AuthorizedHttp):
+    """AuthorizedHttp giving each thread its own connection, as httplib2 is not thread-safe"""
+
+    def __init__(self, credentials):
+        super().__init__(credentials, http=build_http())
+        self.local = threading.local()
+
+    def request(self, *args, **kwargs):
+        http = getattr(self.local, 'http', None)
+        if http is None:
+            http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=build_http())
+            self.local.http = http
+        return http.request(*args, **kwargs)
+
+
+class CachedService:
+    def __init__(self, credentials, service, profile):
+        self.credentials = credentials
+        self.service = service
+        self.profile = profile
+        self.last_used = time.monotonic()
+
+
+class ServiceCache:
+    def __init__(self, max_entries=100, idle_timeout=3600, refresh_interval=60):
+        """Built Gmail services, decoded credentials and profiles keyed by credential identity"""
+        self.max_entries = max_entries
+        self.idle_timeout = idle_timeout
+        self.refresh_interval = refresh_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.build_lock = threading.Lock()
+        self.discovery_doc = None
+        self.refresher = None
+        self.stats = {'hits': 0, 'misses': 0, 'refreshes': 0, 'refresh_errors': 0}
+
+    def get_key(self, credentials):
+        """Identity of a pickled credential blob, so lookups skip unpickling"""
+        return hashlib.sha256(credentials).hexdigest()
+
+    def get_discovery_doc(self):
+        """Parse the bundled Gmail discovery document once per process"""
+        if self.discovery_doc is None:
+            self.discovery_doc = json.loads(get_static_doc('gmail', 'v1'))
+        return self.discovery_doc
+
+    def get(self, credentials):
+        """Get the cached entry for a session's pickled credentials, building it on a miss"""
+        key = self.get_key(credentials)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                entry.last_used = time.monotonic()
+                self.stats['hits'] += 1
+                return entry
+            self.stats['misses'] += 1
+
+        creds = pickle.loads(credentials)
+        with self.build_lock:
+            # build_from_document fills in defaults on the shared document
+            service = build_from_document(self.get_discovery_doc(), http=ThreadLocalHttp(creds))
+        profile = service.users().getProfile(userId='me').execute()
+        entry = CachedService(creds, service, profile)
+
+        with self.lock:
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.start_refresher()
+        return entry
+
+    def get_service(self, credentials):
+        return self.get(credentials).service
+
+    def start_refresher(self):
+        """Start the background token refresher on first use"""
+        with self.lock:
+            if self.refresher is not None:
+                return
+            self.refresher = threading.Thread(target=self.refresh_loop, name='token-refresher', daemon=True)
+        self.refresher.start()
+
+    def refresh_loop(self):
+        while True:
+            time.sleep(self.refresh_interval)
+            try:
+                self.refresh_expiring()
+            except Exception as error:
+                print(f'Token refresh sweep failed: {error}')
+
+    def refresh_expiring(self):
+        """Refresh tokens close to expiry and drop entries idle past the timeout"""
+        now = time.monotonic()
+        # google-auth keeps expiry as naive UTC
+        deadline = datetime.now(timezone.utc).replace(tzinfo=None) + TOKEN_REFRESH_MARGIN
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if now - entry.last_used > self.idle_timeout]:
+                del self.entries[key]
+            entries = list(self.entries.values())
+
+        for entry in entries:
+            creds = entry.credentials
+            if not getattr(creds, 'refresh_token', None) or creds.expiry is None or creds.expiry > deadline:
+                continue
+            try:
+                creds.refresh(Request())
+                with self.lock:
+                    self.stats['refreshes'] += 1
+            except Exception as error:
+                # The request path still refreshes on a 401
+                with self.lock:
+                    self.stats['refresh_errors'] += 1
+                print(f'Failed to refresh token: {error}')
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), max_entries=self.max_entries)
@@ -0,0 +1,120 @@
+import gzip
+import json
+import struct
+
+# Both are optional; without them snapshots use the json module and gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# File layout: MAGIC, then version and codec bytes, then the compressed
+# JSON body. Readers reject versions newer than VERSION.
+MAGIC = b'CSNP'
+VERSION = 1
+HEADER = struct.Struct('>4sBB')
+CODECS = {'none': 0, 'gzip': 1, 'zstd': 2}
+CODEC_NAMES = {number: name for name, number in CODECS.items()}
+
+# Long, repeated top-level keys are stored as single letters
+KEYS = {
+    'format_version': 'v',
+    'user_email': 'u',
+    'categories': 'c',
+    'folders': 'f',
+    'messages': 'm',
+    'query': 'q',
+    'saved_at': 's',
+    'saved_at_iso': 'i',
+    'email_count': 'n',
+    'log_seq': 'l',
+}
+SHORT_KEYS = {short: key for key, short in KEYS.items()}
+# Saved message projections are stored as arrays in this field order
+PROJECTION_FIELDS = ('subject', 'sender', 'date', 'snippet')
+
+
+def default_codec():
+    return 'zstd' if zstandard is not None else 'gzip'
+
+
+def encode_json(data):
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def decode_json(body):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def compress(body, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd snapshots need the zstandard package')
+        return zstandard.ZstdCompressor(level=3).compress(body)
+    if codec == 'gzip':
+        # Level 6 is most of level 9's ratio at a fraction of the time
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    return body
+
+
+def decompress(body, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError('zstd snapshots need the zstandard package')
+        return zstandard.ZstdDecompressor().decompress(body)
+    if codec == 'gzip':
+        return gzip.decompress(body)
+    return body
+
+
+def pack(data):
+    """Saved-file dict with short keys and projections as arrays"""
+    packed = {KEYS.get(key, key): value for key, value in data.items()}
+    if isinstance(data.get('messages'), dict):
+        packed['m'] = {
+            message_id: [projection.get(field, '') for field in PROJECTION_FIELDS]
+            for message_id, projection in data['messages'].items()
+        }
+    return packed
+
+
+def unpack(packed):
+    data = {SHORT_KEYS.get(key, key): value for key, value in packed.items()}
+    if isinstance(data.get('messages'), dict):
+        data['messages'] = {
+            message_id: dict(zip(PROJECTION_FIELDS, values))
+            for message_id, values in data['messages'].items()
+        }
+    return data
+
+
+def dumps(data, codec=None):
+    codec = codec or default_codec()
+    return HEADER.pack(MAGIC, VERSION, CODECS[codec]) + compress(encode_json(pack(data)), codec)
+
+
+def loads(blob):
+    magic, version, codec = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError('not a category snapshot')
+    if version > VERSION:
+        raise ValueError(f'snapshot version {version} is newer than this reader ({VERSION})')
+    if codec not in CODEC_NAMES:
+        raise ValueError(f'unknown snapshot codec {codec}')
+    return unpack(decode_json(decompress(blob[HEADER.size:], CODEC_NAMES[codec])))
+
+
+def dump(data, f, codec=None):
+    f.write(dumps(data, codec))
+
+
+def load(f):
+    return loads(f.read())
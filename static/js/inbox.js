@@ -41,20 +41,37 @@ async function showEmailPopup(emailItem) {
     document.getElementById('popupEmailSubject').textContent = 'Loading...';
     
     try {
-        // Get email data directly from the HTML dataset
-        const emailData = {
-            id: emailItem.dataset.emailId,
-            sender: emailItem.dataset.sender,
-            subject: emailItem.dataset.subject,
-            date: emailItem.dataset.date,
-            snippet: emailItem.dataset.snippet,
-            body: JSON.parse(emailItem.dataset.body) // Parse the JSON-encoded body
-        };
+        let emailData;
+        
+        if (emailItem.dataset.body !== undefined) {
+            // Get email data directly from the HTML dataset
+            emailData = {
+                id: emailItem.dataset.emailId,
+                sender: emailItem.dataset.sender,
+                subject: emailItem.dataset.subject,
+                date: emailItem.dataset.date,
+                snippet: emailItem.dataset.snippet,
+                body: JSON.parse(emailItem.dataset.body) // Parse the JSON-encoded body
+            };
+        } else {
+            // List entries only carry metadata; load the body on first open
+            const response = await fetch(`/api/email/${emailId}`);
+            
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            
+            emailData = await response.json();
+            
+            if (emailData.error) {
+                throw new Error(emailData.error);
+            }
+        }
         
         displayEmailPopup(emailData);
         
     } catch (error) {
-        console.error('Error loading email from dataset:', error);
+        console.error('Error loading email:', error);
         document.getElementById('popupEmailSubject').textContent = 'Error loading email';
         document.getElementById('popupEmailBody').innerHTML = '<p style="color: #d13438;">Failed to load email content. Please try again.</p>';
     }
@@ -0,0 +1,43 @@
+import { NextRequest } from 'next/server';
+
+const FLASK_API_URL = 'http://localhost:5000';
+
+export async function GET(
+  request: NextRequest,
+  { params }: { params: { sessionId: string } }
+) {
+  try {
+    const { sessionId } = await params;
+
+    // Forward the event stream from Flask without buffering it
+    const response = await fetch(`${FLASK_API_URL}/categorize_stream/${sessionId}`, {
+      method: 'GET',
+      headers: {
+        'Accept': 'text/event-stream',
+        'Cookie': request.headers.get('cookie') || '',
+        'Last-Event-ID': request.headers.get('last-event-id') || '',
+      },
+      credentials: 'include',
+      cache: 'no-store',
+    });
+
+    if (!response.ok || !response.body) {
+      throw new Error(`Flask API responded with status: ${response.status}`);
+    }
+
+    return new Response(response.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+      },
+    });
+
+  } catch (error) {
+    console.error('Error streaming categorization status:', error);
+    return new Response(JSON.stringify({ error: 'Failed to stream categorization status' }), {
+      status: 502,
+      headers: { 'Content-Type': 'application/json' },
+    });
+  }
+}
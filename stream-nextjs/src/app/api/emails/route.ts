@@ -5,15 +5,19 @@ const FLASK_API_URL = 'http://localhost:5000';
 export async function GET(request: NextRequest) {
   try {
     const { searchParams } = new URL(request.url);
-    const maxResults = searchParams.get('max_results') || '50';
+    const pageSize = searchParams.get('page_size') || searchParams.get('max_results') || '50';
     const query = searchParams.get('q') || '';
+    const cursor = searchParams.get('cursor');
 
     // Forward the request to Flask backend
     const flaskUrl = new URL('/api/emails', FLASK_API_URL);
-    flaskUrl.searchParams.set('max_results', maxResults);
+    flaskUrl.searchParams.set('page_size', pageSize);
     if (query) {
       flaskUrl.searchParams.set('q', query);
     }
+    if (cursor) {
+      flaskUrl.searchParams.set('cursor', cursor);
+    }
 
     const response = await fetch(flaskUrl.toString(), {
       method: 'GET',
@@ -7,8 +7,9 @@ export async function GET(request: NextRequest) {
     console.log('[DEBUG] Next.js /api/load-inbox - Request headers:', Object.fromEntries(request.headers.entries()));
     console.log('[DEBUG] Next.js /api/load-inbox - Request cookies:', request.headers.get('cookie'));
     
-    // Forward the request to Flask backend with all cookies
-    const response = await fetch(`${FLASK_API_URL}/api/load-inbox`, {
+    // Forward the request (and its cursor/page_size, if any) to Flask backend with all cookies
+    const { search } = new URL(request.url);
+    const response = await fetch(`${FLASK_API_URL}/api/load-inbox${search}`, {
       method: 'GET',
       headers: {
         'Content-Type': 'application/json',
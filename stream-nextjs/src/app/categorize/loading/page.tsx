@@ -9,6 +9,7 @@ export default function CategorizeLoadingPage() {
   const [progress, setProgress] = useState(0);
   const [message, setMessage] = useState('Analyzing emails...');
   const [error, setError] = useState<string | null>(null);
+  const [categorizedCount, setCategorizedCount] = useState(0);
   
   const sessionId = searchParams.get('session_id') || 'demo-session';
   const userEmail = searchParams.get('user_email') || 'user@example.com';
@@ -16,6 +17,7 @@ export default function CategorizeLoadingPage() {
 
   useEffect(() => {
     let checkInterval: NodeJS.Timeout;
+    let stream: EventSource | null = null;
     
     const checkStatus = async () => {
       try {
@@ -58,13 +60,46 @@ export default function CategorizeLoadingPage() {
       }
     };
 
-    // Start checking status every 2 seconds
-    checkInterval = setInterval(checkStatus, 2000);
-    
-    // Check status immediately
-    checkStatus();
+    const startPolling = () => {
+      // Check status immediately, then every 2 seconds
+      checkInterval = setInterval(checkStatus, 2000);
+      checkStatus();
+    };
+
+    // Prefer the pushed event stream; fall back to polling if it is unavailable
+    if (typeof EventSource !== 'undefined') {
+      stream = new EventSource(`/api/categorize-stream/${sessionId}`);
+      stream.addEventListener('status', (event) => {
+        const data = JSON.parse((event as MessageEvent).data);
+        if (['completed', 'complete', 'index_error'].includes(data.status)) {
+          stream?.close();
+          setProgress(100);
+          setMessage('Complete! Redirecting...');
+          setTimeout(() => {
+            router.push(`/categorize/results/${sessionId}`);
+          }, 1000);
+        } else if (data.status === 'error') {
+          stream?.close();
+          setError(data.message || 'An error occurred during categorization');
+        } else {
+          setProgress(data.progress || 0);
+          setMessage(data.message || 'Processing...');
+        }
+      });
+      stream.addEventListener('partial', (event) => {
+        const data = JSON.parse((event as MessageEvent).data);
+        setCategorizedCount((count) => count + (data.emails?.length || 0));
+      });
+      stream.onerror = () => {
+        stream?.close();
+        startPolling();
+      };
+    } else {
+      startPolling();
+    }
 
     return () => {
+      stream?.close();
       clearInterval(checkInterval);
     };
   }, [sessionId, router]);
@@ -121,6 +156,11 @@ export default function CategorizeLoadingPage() {
           <p className="text-sm opacity-80">
             <strong>Emails to process:</strong> {totalEmails}
           </p>
+          {categorizedCount > 0 && (
+            <p className="text-sm opacity-80 mt-2">
+              <strong>Categorized so far:</strong> {categorizedCount}
+            </p>
+          )}
         </div>
         
         {error && (
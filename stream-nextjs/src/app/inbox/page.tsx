@@ -33,6 +33,8 @@ export default function InboxPage() {
   const [userEmail, setUserEmail] = useState('user@example.com');
   const [loading, setLoading] = useState(true);
   const [searchQuery, setSearchQuery] = useState('');
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     loadEmails();
@@ -62,6 +64,7 @@ export default function InboxPage() {
       console.log('[DEBUG] Inbox - Success, received', data.emails?.length || 0, 'emails for', data.user_email);
       
       setEmails(data.emails || []);
+      setNextCursor(data.next_cursor || null);
       setUserEmail(data.user_email || 'user@example.com');
       setLoading(false);
     } catch (error) {
@@ -95,6 +98,33 @@ export default function InboxPage() {
     }
   };
 
+  const loadMoreEmails = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const response = await fetch(`http://localhost:5000/api/emails?cursor=${encodeURIComponent(nextCursor)}`, {
+        method: 'GET',
+        credentials: 'include',
+        headers: {
+          'Accept': 'application/json',
+          'Content-Type': 'application/json'
+        }
+      });
+      if (!response.ok) {
+        const errorData = await response.json();
+        throw new Error(errorData.error || `HTTP ${response.status}`);
+      }
+      const data = await response.json();
+      console.log('[DEBUG] Inbox - Loaded', data.emails?.length || 0, 'more emails');
+      setEmails(prev => [...prev, ...(data.emails || [])]);
+      setNextCursor(data.next_cursor || null);
+    } catch (error) {
+      console.error('Error loading more emails:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleEmailClick = (email: Email, element: HTMLElement) => {
     setCurrentPopupEmailId(email.id);
     setShowEmailPopup(true);
@@ -338,6 +368,15 @@ export default function InboxPage() {
                 </div>
               </div>
             ))}
+            {nextCursor && (
+              <button
+                className="w-full p-3 text-sm text-[#605e5c] font-medium hover:bg-[#f3f2f1] disabled:opacity-50"
+                onClick={loadMoreEmails}
+                disabled={loadingMore}
+              >
+                {loadingMore ? 'Loading...' : 'Load more emails'}
+              </button>
+            )}
           </div>
         </div>
 
@@ -0,0 +1,199 @@
+"""Shared fixtures: an in-memory mock of the Gmail API resource and EmailClients on it.
+
+Run with `python -m pytest tests` from the repository root.
+"""
+import base64
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import EmailClient  # noqa: E402
+
+# internalDate (epoch ms) of message 0; each later message is a minute newer
+BASE_INTERNAL_DATE = 1750000000000
+
+
+class HttpError(Exception):
+    """Stands in for googleapiclient.errors.HttpError (EmailClient only reads resp.status)"""
+
+    def __init__(self, status):
+        super().__init__(f'HTTP {status}')
+        self.resp = type('Response', (), {'status': status})()
+
+
+class Request:
+    def __init__(self, handler):
+        self.handler = handler
+
+    def execute(self, http=None):
+        return self.handler()
+
+
+def make_message(index, labels=('INBOX',)):
+    body = f'Hello,\n\nThis is message number {index}.'
+    return {
+        'id': f'{index:016x}',
+        'threadId': f'{index:016x}',
+        'labelIds': list(labels),
+        'snippet': f'This is message number {index}.',
+        'internalDate': str(BASE_INTERNAL_DATE + index * 60000),
+        'payload': {
+            'mimeType': 'text/plain',
+            'headers': [
+                {'name': 'Subject', 'value': f'Update #{index}'},
+                {'name': 'From', 'value': f'Sender {index % 7} <sender{index % 7}@example.com>'},
+                {'name': 'To', 'value': 'me@example.com'},
+                {'name': 'Date', 'value': 'Sat, 21 Jun 2025 22:09:00 -0700'},
+            ],
+            'body': {'data': base64.urlsafe_b64encode(body.encode()).decode()},
+        },
+    }
+
+
+class MockGmail:
+    """
+    Mailbox behind the subset of the Gmail resource EmailClient uses:
+    users().getProfile / messages().list / messages().get / history().list.
+    Changes made through deliver/delete/relabel are recorded in the history;
+    the *_silently variants model changes whose history has expired.
+    """
+
+    def __init__(self, count=0):
+        self.mailbox = {}
+        self.records = []
+        self.history_id = 100
+        self.history_expired = False
+        self.list_calls = []
+        self.next_index = 0
+        self.add(count)
+
+    def add(self, count):
+        """Messages already in the mailbox before the first sync (no history)"""
+        added = []
+        for _ in range(count):
+            message = make_message(self.next_index)
+            self.mailbox[message['id']] = message
+            self.next_index += 1
+            added.append(message['id'])
+        return added
+
+    def record(self, **change):
+        self.history_id += 1
+        self.records.append(dict(id=str(self.history_id), **change))
+
+    def deliver(self, count):
+        """New mail, newer than everything in the mailbox"""
+        added = self.add(count)
+        for message_id in added:
+            self.record(messagesAdded=[{'message': {'id': message_id, 'labelIds': ['INBOX']}}])
+        return added
+
+    def delete(self, message_id):
+        del self.mailbox[message_id]
+        self.record(messagesDeleted=[{'message': {'id': message_id}}])
+
+    def delete_silently(self, message_id):
+        del self.mailbox[message_id]
+        self.history_id += 1
+
+    def relabel(self, message_id, add=(), remove=()):
+        message = self.mailbox[message_id]
+        message['labelIds'] = [label for label in message['labelIds'] if label not in remove] + list(add)
+        item = {'id': message_id, 'labelIds': list(message['labelIds'])}
+        change = {}
+        if add:
+            change['labelsAdded'] = [{'message': item, 'labelIds': list(add)}]
+        if remove:
+            change['labelsRemoved'] = [{'message': item, 'labelIds': list(remove)}]
+        self.record(**change)
+
+    def listed(self):
+        """messages().list order: newest first, without spam and trash"""
+        visible = [m for m in self.mailbox.values() if not {'SPAM', 'TRASH'} & set(m['labelIds'])]
+        return sorted(visible, key=lambda m: int(m['internalDate']), reverse=True)
+
+    def ids(self):
+        return [message['id'] for message in self.listed()]
+
+    # Gmail resource surface
+
+    def users(self):
+        return self
+
+    def getProfile(self, userId):
+        return Request(lambda: {'emailAddress': 'me@example.com', 'historyId': str(self.history_id)})
+
+    def messages(self):
+        return MessagesResource(self)
+
+    def history(self):
+        return HistoryResource(self)
+
+
+class MessagesResource:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId, maxResults=100, q='', pageToken=None):
+        def handler():
+            self.gmail.list_calls.append({'q': q, 'pageToken': pageToken})
+            matching = self.gmail.listed()
+            # Only the before:<epoch seconds> search operator is understood
+            for term in (q or '').split():
+                if term.startswith('before:'):
+                    before_ms = int(term[len('before:'):]) * 1000
+                    matching = [m for m in matching if int(m['internalDate']) < before_ms]
+            offset = int(pageToken or 0)
+            page = matching[offset:offset + maxResults]
+            response = {'messages': [{'id': m['id'], 'threadId': m['threadId']} for m in page]}
+            if offset + maxResults < len(matching):
+                response['nextPageToken'] = str(offset + maxResults)
+            return response
+        return Request(handler)
+
+    def get(self, userId, id, format='full', metadataHeaders=None):
+        def handler():
+            message = self.gmail.mailbox.get(id)
+            if message is None:
+                raise HttpError(404)
+            if format == 'metadata':
+                payload = {'mimeType': message['payload']['mimeType'], 'headers': message['payload']['headers']}
+                return dict(message, payload=payload)
+            return message
+        return Request(handler)
+
+
+class HistoryResource:
+    def __init__(self, gmail):
+        self.gmail = gmail
+
+    def list(self, userId, startHistoryId, historyTypes=None, pageToken=None):
+        def handler():
+            if self.gmail.history_expired:
+                raise HttpError(404)
+            records = [record for record in self.gmail.records if int(record['id']) > int(startHistoryId)]
+            return {'history': records, 'historyId': str(self.gmail.history_id)}
+        return Request(handler)
+
+
+@pytest.fixture
+def gmail():
+    return MockGmail(count=0)
+
+
+def make_client(gmail, store_dir=None):
+    client = EmailClient(store_dir=store_dir)
+    # The mock has no batch endpoint, so fetch one message per request
+    client.use_batch = False
+    client.add_service(gmail)
+    return client
+
+
+@pytest.fixture
+def client(gmail, tmp_path):
+    client = make_client(gmail, store_dir=str(tmp_path / 'message_store'))
+    yield client
+    client.close()
@@ -0,0 +1,71 @@
+import importlib
+import uuid
+
+import pytest
+
+flask = pytest.importorskip('flask')
+
+import blueprints  # noqa: E402
+from blueprints import categorize_jobs  # noqa: E402
+
+OWNER = 'owner@example.com'
+
+
+class StubClient:
+    def __init__(self, user_email):
+        self.profile = {'emailAddress': user_email}
+
+
+@pytest.fixture(params=['app', 'main'])
+def http(request, monkeypatch):
+    """Test client of app.py's routes or of the blueprints' (as registered by main.py)"""
+    module = importlib.import_module(request.param)
+    signed_in = {'user': OWNER}
+    monkeypatch.setattr(categorize_jobs, 'get_email_client', lambda: StubClient(signed_in['user']))
+    client = module.app.test_client()
+    with client.session_transaction() as session:
+        session['credentials'] = {'token': 'test'}
+    client.signed_in = signed_in
+    return client
+
+
+@pytest.fixture
+def job():
+    session_id = f"{OWNER}_0_{uuid.uuid4().hex[:8]}"
+    categorize_jobs.update_status(session_id, {'status': 'completed', 'progress': 100}, owner=OWNER)
+    blueprints.job_store.set_result(session_id, {'categories': {'Work': []}, 'user_email': OWNER,
+                                                 'total_emails': 0, 'query': ''})
+    yield session_id
+    blueprints.job_store.discard(session_id)
+    blueprints.job_events.discard(session_id)
+
+
+def test_owner_can_read_job(http, job):
+    headers = {'Accept': 'application/json'}
+    assert http.get(f'/categorize_status/{job}', headers=headers).get_json()['status'] == 'completed'
+    assert http.get(f'/categorize_results/{job}', headers=headers).get_json()['categories'] == {'Work': []}
+    stream = http.get(f'/categorize_stream/{job}')
+    assert stream.status_code == 200
+    assert b'"completed"' in stream.get_data()
+
+
+def test_other_users_get_404(http, job):
+    http.signed_in['user'] = 'someone.else@example.com'
+    headers = {'Accept': 'application/json'}
+    assert http.get(f'/categorize_status/{job}', headers=headers).status_code == 404
+    assert http.get(f'/categorize_results/{job}', headers=headers).status_code == 404
+    assert http.get(f'/categorize_stream/{job}').status_code == 404
+
+
+def test_signed_out_gets_404(http, job):
+    with http.session_transaction() as session:
+        session.clear()
+    assert http.get(f'/categorize_status/{job}').status_code == 404
+    assert http.get(f'/categorize_stream/{job}').status_code == 404
+
+
+def test_rejected_submit_leaves_nothing_behind(monkeypatch):
+    monkeypatch.setattr(blueprints.job_runner, 'submit', lambda *args, **kwargs: None)
+    jobs_before = blueprints.job_events.get_stats()['jobs']
+    assert categorize_jobs.submit_categorization([{'id': 'a'}], '', OWNER, None) is None
+    assert blueprints.job_events.get_stats()['jobs'] == jobs_before
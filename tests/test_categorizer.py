@@ -0,0 +1,98 @@
+import json
+import re
+
+from categorizer import CategorizationEngine, MAX_CATEGORIES, subject_signature
+from utils import gen_categories
+
+HEADING_BLOCK_RE = re.compile(r'Email headings:\s*\n(.*?)\n\s*\n', re.S)
+HEADING_RE = re.compile(r'^\s*\d+\. (.*)$', re.M)
+
+
+class FirstWordModel:
+    """Labels each heading with its first word, and records the headings it was sent"""
+
+    def __init__(self):
+        self.headings = []
+
+    def generate(self, prompt):
+        headings = HEADING_RE.findall(HEADING_BLOCK_RE.search(prompt).group(1))
+        self.headings.extend(headings)
+        return json.dumps({str(number): heading.split()[0].capitalize()
+                           for number, heading in enumerate(headings, 1)})
+
+
+def make_engine(model, **kwargs):
+    return CategorizationEngine(model=model, max_workers=2, **kwargs)
+
+
+def emails(*subjects):
+    return [{'subject': subject} for subject in subjects]
+
+
+def test_near_identical_subjects_are_sent_once():
+    model = FirstWordModel()
+    engine = make_engine(model)
+    stats = {}
+    result = engine.categorize(emails('Order #1 shipped', 'Re: Order #22 shipped', 'Fwd: Order 333 shipped',
+                                      'Invoice for June'), stats=stats)
+
+    assert result == ['Order', 'Order', 'Order', 'Invoice']
+    assert model.headings == ['Order #1 shipped', 'Invoice for June']
+    assert stats['unique_subjects'] == 2
+
+
+def test_without_dedupe_every_subject_is_sent():
+    model = FirstWordModel()
+    make_engine(model, dedupe=False).categorize(emails('Order #1 shipped', 'Order #2 shipped'))
+    assert len(model.headings) == 2
+
+
+def test_subject_signature_ignores_numbers_dates_and_prefixes():
+    assert subject_signature('Re: Order #1234 shipped') == subject_signature('Order #98 shipped')
+    assert subject_signature('Statement for 2025-06-01') == subject_signature('Statement for 2025-07-01')
+    assert subject_signature('Order shipped') != subject_signature('Order cancelled')
+    assert subject_signature('12345') == '12345'
+
+
+def test_at_most_seven_categories():
+    # Word i appears i + 1 times, so the six most used keep their names
+    words = ['Alpha', 'Bravo', 'Charlie', 'Delta', 'Echo', 'Foxtrot', 'Golf', 'Hotel', 'India', 'Juliet']
+    subjects = [f'{word} note {"x" * n}' for i, word in enumerate(words) for n in range(i + 1)]
+    result = make_engine(FirstWordModel(), dedupe=False).categorize(emails(*subjects))
+
+    assert len(set(result)) == MAX_CATEGORIES
+    assert set(result) == {'Others', 'Juliet', 'India', 'Hotel', 'Golf', 'Foxtrot', 'Echo'}
+
+
+def test_large_saved_vocabulary_is_capped():
+    engine = make_engine(FirstWordModel())
+    vocabulary = ['Alpha', 'Bravo', 'Charlie', 'Delta', 'Echo', 'Foxtrot', 'Golf', 'Hotel', 'India']
+    categories = ['alpha', 'India', 'India'] + vocabulary + ['New'] * 5
+
+    merged = engine.merge_vocabularies(categories, vocabulary)
+    assert len(set(merged)) == MAX_CATEGORIES
+    # Saved names are kept ahead of new labels, most used first, with their saved spelling
+    assert merged[:3] == ['Alpha', 'India', 'India']
+    assert 'New' not in merged
+
+
+class BrokenEngine:
+    def categorize(self, *args, **kwargs):
+        raise RuntimeError('model unavailable')
+
+
+class EmptyCache:
+    def make_key(self, email, *args):
+        return email['subject']
+
+    def get_many(self, keys):
+        return {}
+
+
+def test_fallback_keeps_to_saved_names():
+    vocabulary = ['Finance', 'Friends']
+    subjects = ['Your invoice is ready', 'Payment received', 'Security alert: new sign-in', 'Lunch tomorrow?']
+    result = gen_categories(emails(*subjects), engine=BrokenEngine(), cache=EmptyCache(), vocabulary=vocabulary)
+
+    assert len(result) == len(subjects)
+    assert set(result) <= {'Finance', 'Friends', 'Others'}
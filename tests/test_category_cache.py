@@ -0,0 +1,38 @@
+from category_cache import CategoryCache
+from utils import gen_categories
+
+EMAIL = {'subject': 'Invoice #12', 'sender': 'billing@example.com'}
+
+
+class CountingEngine:
+    """Labels every email 'Finance' and counts the emails sent to it"""
+
+    def __init__(self):
+        self.sent = 0
+
+    def categorize(self, emails, user_query, vocabulary=None, on_chunk=None, stats=None):
+        self.sent += len(emails)
+        stats.update(emails=len(emails), unique_subjects=len(emails), chunks=1, fallback_chunks=0,
+                     wall_seconds=0.0, fallback_indexes=[])
+        return ['Finance'] * len(emails)
+
+    def merge_vocabularies(self, categories, vocabulary):
+        return categories
+
+
+def test_keys_are_per_account_and_vocabulary():
+    cache = CategoryCache()
+    key = cache.make_key(EMAIL, '', 'a@example.com', ['Work', 'Bills'])
+    assert key == cache.make_key(EMAIL, '', 'A@example.com', ['Bills', 'Work'])
+    assert key != cache.make_key(EMAIL, '', 'b@example.com', ['Work', 'Bills'])
+    assert key != cache.make_key(EMAIL, '', 'a@example.com', ['Work'])
+
+
+def test_accounts_do_not_share_cached_answers():
+    engine, cache = CountingEngine(), CategoryCache()
+    gen_categories([EMAIL], engine=engine, cache=cache, user_email='a@example.com')
+    gen_categories([EMAIL], engine=engine, cache=cache, user_email='a@example.com')
+    assert engine.sent == 1
+
+    gen_categories([EMAIL], engine=engine, cache=cache, user_email='b@example.com')
+    assert engine.sent == 2
@@ -0,0 +1,162 @@
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+import utils
+from change_log import apply_operations
+from utils import CategoryStorage
+
+USER = 'me@example.com'
+
+
+@pytest.fixture(autouse=True)
+def storage_dir(tmp_path, monkeypatch):
+    # CategoryStorage writes to ./saved_categories
+    monkeypatch.chdir(tmp_path)
+    utils._storage_cache.clear()
+    yield tmp_path / 'saved_categories'
+    utils._storage_cache.clear()
+
+
+def email(message_id, subject='Hello'):
+    return {'id': message_id, 'subject': subject, 'sender': 'a@example.com', 'date': '06/21/2025 10:09 PM',
+            'snippet': f'Snippet of {message_id}', 'content': f'Body of {message_id}'}
+
+
+def saved_ids(storage, file_type='categories'):
+    data = storage.load_snapshot(file_type)
+    return {name: list(entries) for name, entries in data[file_type].items()}
+
+
+def test_save_keeps_ids_and_projection(storage_dir):
+    storage = CategoryStorage(USER)
+    assert storage.save_categories({'Work': [email('a'), email('b')], 'Others': [email('c')]}, query='q')
+
+    data = storage.load_categories()
+    assert data['query'] == 'q'
+    assert data['email_count'] == 3
+    assert [e['id'] for e in data['categories']['Work']] == ['a', 'b']
+    assert data['categories']['Others'][0]['snippet'] == 'Snippet of c'
+
+
+def test_logged_operations_replay_on_load(storage_dir):
+    storage = CategoryStorage(USER)
+    storage.save_categories({'Work': [email('a'), email('b')], 'Others': [email('c')]})
+    snapshot_path = storage.get_snapshot_path('categories')
+    saved = os.path.getmtime(snapshot_path), os.path.getsize(snapshot_path)
+
+    entries = storage.append_changes('categories', [
+        {'op': 'create', 'name': 'Finance'},
+        {'op': 'move_message', 'id': 'b', 'to': 'Finance'},
+        {'op': 'rename', 'name': 'Others', 'new_name': 'Misc'},
+    ])
+    assert [entry['seq'] for entry in entries] == [1, 2, 3]
+    # Appending leaves the saved file alone
+    assert (os.path.getmtime(snapshot_path), os.path.getsize(snapshot_path)) == saved
+
+    assert saved_ids(storage) == {'Work': ['a'], 'Finance': ['b'], 'Misc': ['c']}
+    data = storage.load_categories()
+    assert data['email_count'] == 3
+    assert data['categories']['Finance'][0]['subject'] == 'Hello'
+
+
+def test_get_changes_since(storage_dir):
+    storage = CategoryStorage(USER)
+    storage.save_folders({'Work': [email('a')]})
+    storage.append_changes('folders', [{'op': 'create', 'name': 'A'}, {'op': 'create', 'name': 'B'}])
+
+    changes, snapshot_seq = storage.get_changes('folders', since=1)
+    assert [change['name'] for change in changes] == ['B']
+    assert snapshot_seq == 0
+
+
+def test_save_supersedes_logged_operations(storage_dir):
+    storage = CategoryStorage(USER)
+    storage.save_categories({'Work': [email('a')]})
+    storage.append_changes('categories', [{'op': 'delete', 'name': 'Work'}])
+
+    storage.save_categories({'Work': [email('a')], 'New': [email('b')]})
+    assert saved_ids(storage) == {'Work': ['a'], 'New': ['b']}
+    # Sequence numbers continue past the superseded edits
+    assert storage.append_changes('categories', [{'op': 'create', 'name': 'X'}])[0]['seq'] == 2
+
+
+def test_torn_last_line_is_ignored(storage_dir):
+    storage = CategoryStorage(USER)
+    storage.save_categories({'Work': [email('a')], 'Others': []})
+    storage.append_changes('categories', [{'op': 'move_message', 'id': 'a', 'to': 'Others'}])
+    with open(storage.get_change_log_path('categories'), 'a') as f:
+        f.write('{"op": "delete", "na')
+
+    assert saved_ids(storage) == {'Work': [], 'Others': ['a']}
+
+
+def test_compaction_folds_log_into_snapshot(storage_dir):
+    storage = CategoryStorage(USER)
+    storage.save_categories({'Work': [email('a'), email('b')], 'Old': [email('c')]})
+    storage.append_changes('categories', [
+        {'op': 'move_message', 'id': 'a', 'to': 'Done'},
+        {'op': 'delete', 'name': 'Old'},
+    ])
+    before = saved_ids(storage)
+
+    storage.compact('categories')
+    assert os.path.getsize(storage.get_change_log_path('categories')) == 0
+    utils._storage_cache.clear()
+    assert saved_ids(storage) == before
+    snapshot = storage.read_snapshot('categories')
+    assert snapshot['log_seq'] == 2
+    # The deleted category's message is dropped from the projections
+    assert set(snapshot['messages']) == {'a', 'b'}
+    assert storage.append_changes('categories', [{'op': 'create', 'name': 'X'}])[0]['seq'] == 3
+
+
+def test_log_past_threshold_compacts_in_background(storage_dir, monkeypatch):
+    monkeypatch.setattr(utils, 'CHANGE_LOG_MAX_BYTES', 200)
+    storage = CategoryStorage(USER)
+    storage.save_categories({'Work': [email('a')], 'Others': []})
+    for i in range(6):
+        storage.append_changes('categories', [{'op': 'move_message', 'id': 'a', 'to': 'Others' if i % 2 else 'Work'}])
+
+    for thread in [t for t in threading.enumerate() if t.name == 'change-log-compaction']:
+        thread.join(5)
+    assert not utils._compacting
+    assert storage.read_snapshot('categories')['log_seq'] > 0
+    assert saved_ids(storage) == {'Work': [], 'Others': ['a']}
+
+
+def test_apply_operations_leaves_input_untouched():
+    groups = {'Work': ['a', 'b'], 'Others': ['c']}
+    result = apply_operations(groups, [
+        {'op': 'move_message', 'id': 'a', 'to': 'Others'},
+        {'op': 'delete', 'name': 'Work', 'to': 'Others'},
+        {'op': 'move_message', 'id': 'missing', 'to': 'Work'},
+    ])
+    assert result == {'Others': ['c', 'a', 'b']}
+    assert groups == {'Work': ['a', 'b'], 'Others': ['c']}
+
+
+def append_from_process(directory, count):
+    os.chdir(directory)
+    storage = CategoryStorage(USER)
+    for i in range(count):
+        storage.append_changes('folders', [{'op': 'create', 'name': f'{os.getpid()}-{i}'}])
+
+
+@pytest.mark.skipif(utils.fcntl is None, reason='cross-process locking needs fcntl')
+def test_appends_from_several_processes_get_distinct_seqs(storage_dir, tmp_path):
+    CategoryStorage(USER).save_folders({})
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=append_from_process, args=(str(tmp_path), 50)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    utils._storage_cache.clear()
+    changes, _ = CategoryStorage(USER).get_changes('folders')
+    assert len(changes) == 200
+    assert [change['seq'] for change in changes] == list(range(1, 201))
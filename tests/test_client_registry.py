@@ -0,0 +1,53 @@
+import threading
+
+from client_registry import ClientRegistry
+from fetch_engine import FetchEngine
+
+
+class FakeClient:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.last_used = None
+        self.closed = False
+
+    def estimate_memory(self):
+        return 0
+
+    def close(self):
+        self.closed = True
+
+
+def test_client_held_by_a_request_is_not_evicted():
+    registry = ClientRegistry(FakeClient, max_clients=1, idle_timeout=0, sweep_interval=0)
+    held = registry.get('a@example.com')
+
+    # Over the cap and idle, but handed out and not yet locked by its request
+    registry.get('b@example.com')
+    registry.enforce_limits(force=True)
+    assert not held.closed
+    assert registry.get_stats()['clients'] == 2
+
+    registry.release(held)
+    registry.enforce_limits(keep='b@example.com', force=True)
+    assert held.closed
+    assert registry.get_stats()['clients'] == 1
+
+
+def test_released_client_is_reused():
+    registry = ClientRegistry(FakeClient)
+    client = registry.get('a@example.com')
+    registry.release(client)
+    assert registry.get('a@example.com') is client
+    assert client.pins == 1
+
+
+def test_eviction_drops_the_accounts_rate_limiter():
+    fetch_engine = FetchEngine(max_workers=1)
+    registry = ClientRegistry(FakeClient, idle_timeout=0, sweep_interval=0, fetch_engine=fetch_engine)
+    client = registry.get('a@example.com')
+    fetch_engine.map(lambda item: item, [1], user_key='a@example.com')
+    registry.release(client)
+
+    registry.enforce_limits(force=True)
+    assert fetch_engine.get_stats()['users'] == 0
+    fetch_engine.shutdown()
@@ -0,0 +1,75 @@
+def sync(client, count=50):
+    return [email['id'] for email in client.sync_messages(max_results=count)]
+
+
+def test_new_mail_comes_from_history(gmail, client):
+    gmail.add(20)
+    sync(client)
+    gmail.list_calls.clear()
+
+    new = gmail.deliver(3)
+    assert sync(client) == gmail.ids()
+    assert sync(client)[:3] == list(reversed(new))
+    # Patched from history, without listing the mailbox again
+    assert gmail.list_calls == []
+
+
+def test_deleted_mail_leaves_the_set_and_the_store(gmail, client):
+    gmail.add(20)
+    sync(client)
+
+    gone = gmail.ids()[4]
+    gmail.delete(gone)
+    assert sync(client) == gmail.ids()
+    assert client.message_store.get_messages([gone]) == []
+
+
+def test_label_changes_update_unread_state(gmail, client):
+    gmail.add(5)
+    sync(client)
+    message_id = gmail.ids()[0]
+
+    gmail.relabel(message_id, add=['UNREAD'])
+    email = next(email for email in client.sync_messages(max_results=50) if email['id'] == message_id)
+    assert email['is_unread']
+    assert 'UNREAD' in email['labels']
+
+    gmail.relabel(message_id, remove=['UNREAD'])
+    email = next(email for email in client.sync_messages(max_results=50) if email['id'] == message_id)
+    assert not email['is_unread']
+
+
+def test_trashed_mail_leaves_and_untrashed_mail_returns(gmail, client):
+    gmail.add(10)
+    sync(client)
+    gmail.list_calls.clear()
+    message_id = gmail.ids()[3]
+
+    gmail.relabel(message_id, add=['TRASH'])
+    assert message_id not in sync(client)
+
+    gmail.relabel(message_id, remove=['TRASH'])
+    assert sync(client) == gmail.ids()
+    assert gmail.list_calls == []
+
+
+def test_deletion_from_a_full_page_refills_with_a_full_sync(gmail, client):
+    gmail.add(60)
+    sync(client, 50)
+    gmail.list_calls.clear()
+
+    gmail.delete(gmail.ids()[0])
+    assert sync(client, 50) == gmail.ids()[:50]
+    # The page would be one short from history alone, so Gmail was listed again
+    assert len(gmail.list_calls) == 1
+
+
+def test_expired_history_falls_back_to_a_full_sync(gmail, client):
+    gmail.add(10)
+    sync(client)
+    gmail.list_calls.clear()
+
+    gmail.history_expired = True
+    gmail.deliver(2)
+    assert sync(client) == gmail.ids()
+    assert len(gmail.list_calls) == 1
@@ -0,0 +1,35 @@
+import os
+import time
+
+from job_store import JobStore
+
+
+def spill(store, job_id):
+    """Store job_id's result, then push it out of memory with another"""
+    for key in (job_id, job_id + '-next'):
+        store.set_status(key, {'status': 'completed'})
+        store.set_result(key, {'categories': {'Work': ['x' * 1000]}})
+
+
+def test_new_store_leaves_other_processes_spills_alone(tmp_path):
+    spill_dir = str(tmp_path / 'spill')
+    first = JobStore(ttl=60, max_memory_mb=0, spill_dir=spill_dir)
+    spill(first, 'job')
+    assert first.stats['spilled'] == 1
+
+    second = JobStore(ttl=60, max_memory_mb=0, spill_dir=spill_dir)
+    assert second.spill_dir != first.spill_dir
+    assert first.get_result('job') == {'categories': {'Work': ['x' * 1000]}}
+
+
+def test_spills_older_than_ttl_are_removed(tmp_path):
+    spill_dir = str(tmp_path / 'spill')
+    old = JobStore(ttl=60, max_memory_mb=0, spill_dir=spill_dir)
+    spill(old, 'job')
+    path = old.jobs['job']['spill_path']
+    long_ago = time.time() - 120
+    os.utime(path, (long_ago, long_ago))
+    os.utime(old.spill_dir, (long_ago, long_ago))
+
+    JobStore(ttl=60, max_memory_mb=0, spill_dir=spill_dir)
+    assert not os.path.exists(old.spill_dir)
@@ -0,0 +1,124 @@
+from datetime import datetime
+
+import pytest
+
+from utils import HISTORY_CHECKPOINT_TTL, encode_cursor
+
+
+def page_all(client, page_size, query=''):
+    """IDs of every page from the first cursor to the last"""
+    ids = []
+    emails, cursor = client.get_page(page_size=page_size, query=query)
+    ids.extend(email['id'] for email in emails)
+    while cursor:
+        emails, cursor = client.get_page(cursor, page_size=page_size, query=query)
+        ids.extend(email['id'] for email in emails)
+    return ids
+
+
+def expire_checkpoint(client):
+    client.synced_at = datetime.now() - HISTORY_CHECKPOINT_TTL - HISTORY_CHECKPOINT_TTL / 7
+
+
+def test_pages_cover_mailbox_once_in_order(gmail, client):
+    gmail.add(230)
+    assert page_all(client, 40) == gmail.ids()
+
+
+def test_second_listing_pages_from_store(gmail, client):
+    gmail.add(230)
+    page_all(client, 40)
+    gmail.list_calls.clear()
+
+    assert page_all(client, 40) == gmail.ids()
+    # Only the first page's sync lists Gmail; the rest come from the store
+    assert all(call['pageToken'] is None and 'before:' not in call['q'] for call in gmail.list_calls)
+
+
+def test_expired_checkpoint_does_not_skip_mail_between_syncs(gmail, client):
+    gmail.add(130)
+    assert page_all(client, 40) == gmail.ids()
+
+    expire_checkpoint(client)
+    gmail.deliver(100)
+
+    ids = page_all(client, 40)
+    assert len(ids) == 230
+    assert ids == gmail.ids()
+
+
+def test_expired_history_does_not_skip_mail_between_syncs(gmail, client):
+    gmail.add(130)
+    page_all(client, 40)
+
+    gmail.history_expired = True
+    gmail.deliver(100)
+
+    assert page_all(client, 40) == gmail.ids()
+
+
+def test_cursor_from_before_a_resync_pages_from_gmail(gmail, client):
+    gmail.add(130)
+    emails, cursor = client.get_page(page_size=40)
+
+    expire_checkpoint(client)
+    gmail.deliver(100)
+    client.get_page(page_size=40)
+
+    # The old cursor is below the restarted covered range, so the store must not serve it
+    ids = [email['id'] for email in emails]
+    while cursor:
+        emails, cursor = client.get_page(cursor, page_size=40)
+        ids.extend(email['id'] for email in emails)
+    assert ids == gmail.ids()[100:]
+
+
+def test_filtered_listing_pages_through_gmail(gmail, client):
+    gmail.add(95)
+    assert page_all(client, 40, query='in:inbox') == gmail.ids()
+
+
+def test_pages_without_store(gmail):
+    from conftest import make_client
+    client = make_client(gmail)
+    gmail.add(95)
+    assert page_all(client, 40) == gmail.ids()
+
+
+def test_rejects_foreign_cursors(client):
+    with pytest.raises(ValueError):
+        client.get_page('not-a-cursor')
+    with pytest.raises(ValueError):
+        client.get_page(encode_cursor({'src': 'gmail', 'q': 'from:me'}), query='')
+
+
+def test_resync_drops_mail_deleted_while_history_expired(gmail, client):
+    gmail.add(130)
+    page_all(client, 40)
+
+    expire_checkpoint(client)
+    ids = gmail.ids()
+    # One in the resynced page, two below it
+    deleted = [ids[5], ids[60], ids[120]]
+    for message_id in deleted:
+        gmail.delete_silently(message_id)
+    gmail.deliver(10)
+
+    assert page_all(client, 40) == gmail.ids()
+    assert client.message_store.get_messages(deleted) == []
+    # The second listing comes from the store, which must not bring them back
+    assert page_all(client, 40) == gmail.ids()
+
+
+def test_complete_resync_drops_everything_unlisted(gmail, client):
+    gmail.add(30)
+    client.get_page(page_size=40)
+
+    expire_checkpoint(client)
+    gone = gmail.ids()[-1]
+    gmail.delete_silently(gone)
+
+    emails, cursor = client.get_page(page_size=40)
+    assert [email['id'] for email in emails] == gmail.ids()
+    assert cursor is None
+    assert client.message_store.get_messages([gone]) == []
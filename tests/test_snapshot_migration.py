@@ -0,0 +1,95 @@
+import json
+import os
+
+import pytest
+
+import snapshot_format
+import utils
+from utils import CategoryStorage
+
+USER = 'me@example.com'
+
+
+@pytest.fixture(autouse=True)
+def storage_dir(tmp_path, monkeypatch):
+    # CategoryStorage writes to ./saved_categories
+    monkeypatch.chdir(tmp_path)
+    utils._storage_cache.clear()
+    yield tmp_path / 'saved_categories'
+    utils._storage_cache.clear()
+
+
+def email(message_id, subject='Hello'):
+    return {'id': message_id, 'subject': subject, 'sender': 'a@example.com', 'date': '06/21/2025 10:09 PM',
+            'snippet': f'Snippet of {message_id}', 'content': f'Body of {message_id}'}
+
+
+def reopen(snapshot_format_name):
+    """A storage in the given format that can't reuse parses cached by the previous one"""
+    utils._storage_cache.clear()
+    return CategoryStorage(USER, snapshot_format=snapshot_format_name)
+
+
+def test_json_save_migrates_to_compact_and_back():
+    CategoryStorage(USER, snapshot_format='json').save_categories({'Work': [email('a')], 'Others': [email('b')]},
+                                                                  query='q')
+    storage = reopen('compact')
+    json_path, snap_path = storage.get_snapshot_path('categories', False), storage.get_snapshot_path('categories')
+
+    data = storage.load_categories()
+    assert [e['id'] for e in data['categories']['Work']] == ['a']
+    assert data['query'] == 'q'
+    assert os.path.exists(snap_path) and not os.path.exists(json_path)
+    with open(snap_path, 'rb') as f:
+        assert f.read(4) == snapshot_format.MAGIC
+
+    storage = reopen('json')
+    assert storage.load_categories()['categories']['Others'][0]['snippet'] == 'Snippet of b'
+    assert os.path.exists(json_path) and not os.path.exists(snap_path)
+
+
+def test_full_email_save_is_converted_while_migrating(storage_dir):
+    storage_dir.mkdir()
+    legacy = {'user_email': USER, 'query': '', 'saved_at': '', 'email_count': 2,
+              'categories': {'Work': [email('a', 'Sprint review')], 'Others': [dict(email('b'), id='')]}}
+    with open(CategoryStorage(USER).get_snapshot_path('categories', False), 'w') as f:
+        json.dump(legacy, f)
+
+    storage = reopen('compact')
+    snapshot = storage.read_snapshot('categories')
+    assert snapshot['format_version'] == utils.CATEGORIES_FORMAT_VERSION
+    assert snapshot['messages']['a'] == {'subject': 'Sprint review', 'sender': 'a@example.com',
+                                         'date': '06/21/2025 10:09 PM', 'snippet': 'Snippet of a'}
+    assert 'content' not in snapshot['messages']['a']
+
+    categories = storage.load_categories()['categories']
+    assert categories['Work'][0]['subject'] == 'Sprint review'
+    # Emails saved without an ID come back without one
+    assert categories['Others'][0]['id'] == ''
+
+
+def test_logged_edits_survive_migration():
+    storage = CategoryStorage(USER, snapshot_format='json')
+    storage.save_folders({'Work': [email('a')], 'Old': []})
+    storage.append_changes('folders', [{'op': 'rename', 'name': 'Old', 'new_name': 'Archive'}])
+
+    storage = reopen('compact')
+    assert set(storage.load_folders()['folders']) == {'Work', 'Archive'}
+    assert storage.append_changes('folders', [{'op': 'create', 'name': 'X'}])[0]['seq'] == 2
+
+
+@pytest.mark.parametrize('codec', ['none', 'gzip'])
+def test_snapshot_round_trip(codec):
+    data = {'format_version': 2, 'categories': {'Work': ['a']},
+            'messages': {'a': {'subject': 'Hi', 'sender': 'x', 'date': '', 'snippet': 'é'}}}
+    assert snapshot_format.loads(snapshot_format.dumps(data, codec)) == data
+
+
+def test_snapshot_rejects_other_files_and_newer_versions():
+    blob = snapshot_format.dumps({'categories': {}}, 'none')
+    with pytest.raises(ValueError):
+        snapshot_format.loads(b'JSON' + blob[4:])
+    newer = snapshot_format.HEADER.pack(snapshot_format.MAGIC, snapshot_format.VERSION + 1, 0) + \
+        blob[snapshot_format.HEADER.size:]
+    with pytest.raises(ValueError):
+        snapshot_format.loads(newer)
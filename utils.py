@@ -1,74 +1,706 @@
 import base64
 from datetime import timedelta, datetime
 import re
-from html import unescape
 import json
 import os
 import hashlib
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_tz, mktime_tz
+
+from fetch_engine import MESSAGES_GET_COST
+from message_store import MessageStore
+from html_text import html_to_text
+from categorizer import CategorizationEngine, merge_vocabularies, normalize_category
+from category_cache import CategoryCache
+from local_classifier import LocalClassifier
+from keyword_rules import build_engine as build_keyword_engine
+from change_log import apply_operations, parse_log
+import snapshot_format
+
+# Unix only; without it change logs are only serialized within one process
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 #from langchain_ollama.llms import OllamaLLM
 #from langchain_core.prompts import ChatPromptTemplate
 
 
+# Gmail rejects batch requests with more than 100 calls and recommends
+# keeping batches at 50 or fewer to avoid per-user rate limiting.
+GMAIL_BATCH_LIMIT = 100
+DEFAULT_BATCH_SIZE = 50
+
+# Gmail keeps mailbox history for at least a week; older checkpoints are
+# treated as expired and trigger a full sync
+HISTORY_CHECKPOINT_TTL = timedelta(days=7)
+HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+
+# messages().list skips these by default, so the local mail set does too
+EXCLUDED_LABELS = {'SPAM', 'TRASH'}
+
+# List views only need these headers; bodies are loaded on first open
+LIST_METADATA_HEADERS = ['Subject', 'From', 'Date', 'To']
+
+DISPLAY_DATE_FORMAT = '%m/%d/%Y %I:%M %p'
+
+# Default and maximum page size of cursor-paged mailbox listings (Gmail caps maxResults at 500)
+INBOX_PAGE_SIZE = int(os.environ.get('INBOX_PAGE_SIZE', 50))
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(state):
+    """Opaque page cursor for a small dict of paging state"""
+    raw = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Paging state from encode_cursor; raises ValueError for a cursor this server did not issue"""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(state, dict) or state.get('src') not in ('gmail', 'store'):
+        raise ValueError('Invalid cursor')
+    return state
+
+
 class EmailClient:
-    def __init__(self):
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, batch_uri=None, fetch_engine=None, store_dir=None):
         self.service = None
         self.has_service = False
         self.email_list = None
         self.profile = None
         
-    def add_service(self, service):
+        # Batched fetch settings (batch_uri overrides the discovery batch path,
+        # e.g. to point at a local fake Gmail endpoint)
+        self.use_batch = True
+        self.list_format = 'metadata'
+        self.batch_size = max(1, min(batch_size, GMAIL_BATCH_LIMIT))
+        self.batch_uri = batch_uri
+        self.request_count = 0
+        
+        # Optional shared FetchEngine used to run fetches in parallel
+        self.fetch_engine = fetch_engine
+        self._local = threading.local()
+        
+        # Incremental sync checkpoint (mailbox historyId of the last sync)
+        self.history_id = None
+        self.synced_at = None
+        self.sync_query = None
+        self.sync_max_results = 0
+        
+        # Optional on-disk MessageStore, opened per account in add_service
+        self.store_dir = store_dir
+        self.message_store = None
+        
+        # Serializes syncs of this mailbox across concurrent requests
+        self.lock = threading.RLock()
+        self.last_used = None
+        
+    def add_service(self, service, profile=None):
         """Initialize Gmail service with credentials"""
         self.has_service = True
         self.service = service
-        self.profile = service.users().getProfile(userId='me').execute()
+        self.profile = profile or service.users().getProfile(userId='me').execute()
+        
+        if self.store_dir:
+            self.open_store(self.profile.get('emailAddress', 'Unknown'))
+    
+    def close(self):
+        """Release the service handle and close the message store"""
+        with self.lock:
+            if self.message_store is not None:
+                self.message_store.close()
+                self.message_store = None
+            self.service = None
+            self.has_service = False
+            self.email_list = None
+    
+    def estimate_memory(self):
+        """Rough size in bytes of the cached mail set"""
+        total = 0
+        for email in self.email_list or []:
+            # Per-dict overhead plus the text it holds
+            total += 500
+            for value in email.values():
+                if isinstance(value, str):
+                    total += len(value)
+        return total
+    
+    def open_store(self, user_email):
+        """Open the account's message store and restore the mail set from it"""
+        if self.message_store is not None:
+            if self.message_store.user_email == user_email:
+                return
+            # Another account signed in: don't serve the previous one's mail
+            self.message_store.close()
+            self.email_list = None
+            self.history_id = None
+            self.synced_at = None
+        
+        try:
+            self.message_store = MessageStore(user_email, self.store_dir)
+            state = self.message_store.get_meta('mail_set')
+        except Exception as error:
+            print(f'Failed to open message store: {error}')
+            self.message_store = None
+            return
+        
+        if state and self.email_list is None:
+            self.email_list = self.message_store.get_messages(state['ids'])
+            self.history_id = state['history_id']
+            self.synced_at = datetime.fromisoformat(state['synced_at'])
+            self.sync_query = state['query']
+            self.sync_max_results = state['max_results']
+    
+    def save_to_store(self, changed=None, deleted=()):
+        """Write changed messages and the sync checkpoint through to the store"""
+        if self.message_store is None:
+            return
+        
+        try:
+            self.message_store.upsert_messages(self.email_list if changed is None else changed)
+            if deleted:
+                self.message_store.delete_messages(deleted)
+            if self.email_list is None or self.synced_at is None:
+                return
+            self.message_store.set_meta('mail_set', {
+                'ids': [email['id'] for email in self.email_list],
+                'history_id': self.history_id,
+                'synced_at': self.synced_at.isoformat(),
+                'query': self.sync_query,
+                'max_results': self.sync_max_results
+            })
+        except Exception as error:
+            print(f'Failed to write message store: {error}')
         
     def get_messages(self, max_results=50, query=''):
         """Fetch email messages"""
+        with self.lock:
+            return self._get_messages(max_results, query)
+    
+    def _get_messages(self, max_results, query):
         try:
+            # Taken before listing so changes made during the sync are replayed
+            # by the next delta instead of being missed; the profile is re-read
+            # since the client (and its service) outlive a single request
+            self.profile = self.service.users().getProfile(userId='me').execute()
+            self.request_count += 1
+            start_history_id = self.profile.get('historyId')
+            
             results = self.service.users().messages().list(
                 userId='me', 
                 maxResults=max_results,
                 q=query
             ).execute()
+            self.request_count += 1
             messages = results.get('messages', [])
+            message_ids = [message['id'] for message in messages]
             
-            email_list = []
-            for message in messages:
-                msg = self.service.users().messages().get(
-                    userId='me', 
-                    id=message['id'],
-                    format='full'
-                ).execute()
-                
-                email_data = self.parse_message(msg)
-                email_list.append(email_data)
+            email_list = self.fetch_messages(message_ids)
 
             self.email_list = email_list
+            self.history_id = start_history_id
+            self.synced_at = datetime.now()
+            self.sync_query = query
+            self.sync_max_results = max_results
+            self.save_to_store()
+            self.reset_store_coverage(query, message_ids, email_list, complete='nextPageToken' not in results)
 
             return email_list
         except Exception as error:
             print(f'An error occurred: {error}')
             return []
     
-    def parse_message(self, message, include_html=False):
-        """Parse Gmail message into readable format"""
-        headers = message['payload'].get('headers', [])
+    def get_store_coverage(self):
+        """
+        The range of the unfiltered mailbox the store holds in full:
+        {'bottom': ts, 'complete': False} when every message newer than
+        bottom is stored, {'bottom': None, 'complete': True} when all of
+        them are, or None when nothing is known
+        """
+        if self.message_store is None:
+            return None
+        try:
+            return self.message_store.get_meta('coverage')
+        except Exception as error:
+            print(f'Failed to read message store: {error}')
+            return None
+    
+    def set_store_coverage(self, coverage):
+        try:
+            self.message_store.set_meta('coverage', coverage)
+        except Exception as error:
+            print(f'Failed to write message store: {error}')
+    
+    def reset_store_coverage(self, query, listed_ids, email_list, complete):
+        """
+        Restart the covered range from a full sync's listing. Stored mail in
+        the listed range that Gmail no longer lists is dropped; older mail
+        may have changed while no history was applied, so it is only trusted
+        again once Gmail has been paged over it.
+        """
+        if self.message_store is None:
+            return
+        bottom = min((email['timestamp'] or 0 for email in email_list), default=None)
+        if not query and (complete or bottom is not None):
+            try:
+                self.message_store.prune_messages(listed_ids, after=None if complete else bottom)
+            except Exception as error:
+                print(f'Failed to write message store: {error}')
+        
+        coverage = None
+        # A filtered listing or a failed fetch leaves holes in the range
+        if not query and len(email_list) == len(listed_ids):
+            if complete:
+                coverage = {'bottom': None, 'complete': True}
+            elif email_list:
+                coverage = {'bottom': bottom, 'complete': False}
+        self.set_store_coverage(coverage)
+    
+    def has_fresh_checkpoint(self, max_results=50, query=''):
+        """Check if the local mail set can be brought up to date from history"""
+        if query or self.sync_query != '' or self.email_list is None:
+            return False
+        if not self.history_id or not self.synced_at:
+            return False
+        if max_results > self.sync_max_results:
+            return False
+        return datetime.now() - self.synced_at < HISTORY_CHECKPOINT_TTL
+    
+    def sync_messages(self, max_results=50, query=''):
+        """Return the mail set, patched from Gmail history when possible"""
+        with self.lock:
+            return self._sync_messages(max_results, query)
+    
+    def _sync_messages(self, max_results, query):
+        if not self.has_fresh_checkpoint(max_results, query):
+            return self.get_messages(max_results=max_results, query=query)
+        
+        try:
+            if self.apply_history():
+                return self.email_list[:max_results]
+        except Exception as error:
+            status = getattr(getattr(error, 'resp', None), 'status', None)
+            if status == 404:
+                print('History checkpoint expired, running full sync')
+            else:
+                print(f'Incremental sync failed, running full sync: {error}')
+        
+        return self.get_messages(max_results=max_results, query=query)
+    
+    def apply_history(self):
+        """Patch email_list in place with changes since history_id"""
+        added = []
+        deleted = set()
+        relabeled = {}
+        restored = set()
+        latest_history_id = self.history_id
+        page_token = None
+        
+        while True:
+            response = self.service.users().history().list(
+                userId='me',
+                startHistoryId=self.history_id,
+                historyTypes=HISTORY_TYPES,
+                pageToken=page_token
+            ).execute()
+            self.request_count += 1
+            
+            for record in response.get('history', []):
+                for item in record.get('messagesAdded', []):
+                    message = item['message']
+                    if not EXCLUDED_LABELS.intersection(message.get('labelIds', [])):
+                        added.append(message['id'])
+                for item in record.get('messagesDeleted', []):
+                    deleted.add(item['message']['id'])
+                for item in record.get('labelsAdded', []) + record.get('labelsRemoved', []):
+                    message = item['message']
+                    relabeled[message['id']] = message.get('labelIds', [])
+                for item in record.get('labelsRemoved', []):
+                    # Untrashed / unspammed messages re-enter the mail set
+                    if EXCLUDED_LABELS.intersection(item.get('labelIds', [])):
+                        restored.add(item['message']['id'])
+            
+            latest_history_id = response.get('historyId', latest_history_id)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        
+        # Trashed or spammed messages leave the mail set like deleted ones
+        for message_id, labels in relabeled.items():
+            if EXCLUDED_LABELS.intersection(labels):
+                deleted.add(message_id)
+        
+        email_list = [email for email in self.email_list if email['id'] not in deleted]
+        # Only a page that was full before can be missing older messages now
+        was_full = len(self.email_list) >= self.sync_max_results
+        removed = len(email_list) < len(self.email_list)
+        
+        changed = []
+        for email in email_list:
+            labels = relabeled.get(email['id'])
+            if labels is not None:
+                email['labels'] = labels
+                email['is_unread'] = 'UNREAD' in labels
+                changed.append(email)
+        
+        known_ids = {email['id'] for email in email_list}
+        new_ids = []
+        for message_id in reversed(added + list(restored)):
+            if message_id not in known_ids and message_id not in deleted:
+                known_ids.add(message_id)
+                new_ids.append(message_id)
+        
+        if new_ids:
+            # History is oldest-first, the list is newest-first
+            new_emails = self.fetch_messages(new_ids)
+            changed.extend(new_emails)
+            # Keep the mail set newest-first by its epoch timestamp
+            email_list = sorted(new_emails + email_list, key=lambda email: email.get('timestamp') or 0, reverse=True)
+        
+        # Deletions can leave us short of a full page; let a full sync refill it
+        if was_full and removed and len(email_list) < self.sync_max_results:
+            return False
+        
+        self.email_list = email_list[:self.sync_max_results]
+        self.history_id = latest_history_id
+        self.synced_at = datetime.now()
+        self.save_to_store(changed=changed, deleted=deleted)
+        return True
+    
+    def fetch_messages(self, message_ids, format=None):
+        """Fetch and parse messages using the configured fetch mode"""
+        format = format or self.list_format
+        if self.use_batch:
+            return self.fetch_messages_batched(message_ids, format)
+        if self.fetch_engine is not None:
+            return self.fetch_messages_concurrent(message_ids, format)
+        return self.fetch_messages_sequential(message_ids, format)
+    
+    def message_request(self, message_id, format='full'):
+        """Build a messages().get request ('metadata' asks only for list headers)"""
+        if format == 'metadata':
+            return self.service.users().messages().get(
+                userId='me',
+                id=message_id,
+                format='metadata',
+                metadataHeaders=LIST_METADATA_HEADERS
+            )
+        return self.service.users().messages().get(
+            userId='me',
+            id=message_id,
+            format=format
+        )
+    
+    def find_cached(self, message_id):
+        """Find a message in the local mail set"""
+        for email in self.email_list or []:
+            if email['id'] == message_id:
+                return email
+        return None
+    
+    def get_messages_in_range(self, after=None, before=None, limit=50, before_id=None):
+        """
+        Messages with after <= timestamp < before (epoch seconds), newest
+        first; with before_id, messages at exactly before with a smaller ID
+        are included too (see MessageStore.query_messages)
+        """
+        if self.message_store is not None:
+            return self.message_store.query_messages(before=before, after=after, limit=limit, before_id=before_id)
+        
+        def in_range(email):
+            timestamp = email['timestamp'] or 0
+            if after is not None and timestamp < after:
+                return False
+            if before is None or timestamp < before:
+                return True
+            return before_id is not None and timestamp == before and email['id'] < before_id
+        
+        emails = sorted(filter(in_range, self.email_list or []),
+                        key=lambda email: (email['timestamp'] or 0, email['id']), reverse=True)
+        return emails[:limit]
+    
+    def get_page(self, cursor=None, page_size=INBOX_PAGE_SIZE, query=''):
+        """
+        One page of the mailbox, newest first, and the cursor of the next page
+        (None after the last). The first page of an unfiltered mailbox comes
+        from the regular sync; later pages are read off the message store's
+        date index while they are inside the range the store holds in full
+        (get_store_coverage), then from Gmail list pages older than the last
+        message served. Filtered listings page through Gmail's pageToken
+        directly.
+        """
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+        if cursor:
+            state = decode_cursor(cursor)
+            if state.get('q', '') != query:
+                raise ValueError('Cursor belongs to a different query')
+        elif query or self.message_store is None:
+            state = {'src': 'gmail', 'q': query}
+        else:
+            emails = self.sync_messages(max_results=page_size, query=query)
+            if len(emails) < page_size:
+                return emails, None
+            last = emails[-1]
+            return emails, encode_cursor({'src': 'store', 'q': query, 'ts': last['timestamp'] or 0, 'id': last['id']})
+        
+        if state['src'] == 'store':
+            return self.get_store_page(state, page_size)
+        return self.get_gmail_page(state, page_size)
+    
+    def get_store_page(self, state, page_size):
+        """A page of stored messages below the cursor, handing over to Gmail where the covered range ends"""
+        query = state.get('q', '')
+        position = {'ts': state['ts'], 'id': state['id']}
+        coverage = self.get_store_coverage()
+        if coverage is None or not (coverage['complete'] or state['ts'] >= coverage['bottom']):
+            # A full sync restarted the covered range above this cursor
+            return self.get_gmail_page(dict(position, src='gmail', q=query), page_size)
+        
+        emails = self.get_messages_in_range(before=state['ts'], before_id=state['id'], limit=page_size)
+        if not coverage['complete']:
+            emails = [email for email in emails if (email['timestamp'] or 0) > coverage['bottom']]
+        if emails:
+            position = {'ts': emails[-1]['timestamp'] or 0, 'id': emails[-1]['id']}
+        if len(emails) == page_size:
+            return emails, encode_cursor(dict(state, **position))
+        if coverage['complete']:
+            return emails, None
+        
+        # Older mail is not known to be stored; carry on from Gmail, which grows the range
+        state = dict(position, src='gmail', q=query, bottom=coverage['bottom'])
+        if emails:
+            return emails, encode_cursor(state)
+        return self.get_gmail_page(state, page_size)
+    
+    def get_gmail_page(self, state, page_size):
+        """
+        A page of Gmail's list for the cursor state, with the cursor of the
+        next one. With a position (ts, id) only older messages are returned,
+        and the page is written to the store; with bottom as well, the page
+        continues the store's covered range and extends it.
+        """
+        query = state.get('q', '')
+        if state.get('ts') is not None:
+            # Gmail's before: has whole-second resolution, so ask from the next second
+            # and drop the messages that were already served
+            query = f"{query} before:{int(state['ts']) + 1}".strip()
+        request_args = {'userId': 'me', 'maxResults': page_size, 'q': query}
+        if state.get('token'):
+            request_args['pageToken'] = state['token']
+        results = self.service.users().messages().list(**request_args).execute()
+        self.request_count += 1
+        
+        message_ids = [message['id'] for message in results.get('messages', [])]
+        emails = self.fetch_messages(message_ids)
+        token = results.get('nextPageToken')
+        
+        next_state = dict(state, token=token)
+        if state.get('ts') is not None:
+            coverage = self.extend_store(state, message_ids, emails, complete=not token)
+            next_state.pop('bottom', None)
+            if coverage is not None:
+                next_state['bottom'] = coverage['bottom']
+            position = (state['ts'], state['id'])
+            emails = [email for email in emails if (email['timestamp'] or 0, email['id']) < position]
+        return emails, encode_cursor(next_state) if token else None
+    
+    def extend_store(self, state, listed_ids, emails, complete):
+        """
+        Write a Gmail page older than the cursor to the store and, if it
+        starts where the covered range ends, extend the range over it and
+        drop stored mail in it that the page does not list.
+        Returns the new coverage, or None if the range was not extended.
+        """
+        if self.message_store is None:
+            return None
+        with self.lock:
+            try:
+                self.message_store.upsert_messages(emails)
+            except Exception as error:
+                print(f'Failed to write message store: {error}')
+                return None
+            
+            bottom = state.get('bottom')
+            # The range may have been restarted by a full sync since the cursor was issued
+            if bottom is None or self.get_store_coverage() != {'bottom': bottom, 'complete': False}:
+                return None
+            if len(emails) < len(listed_ids):
+                return None
+            if complete:
+                coverage = {'bottom': None, 'complete': True}
+            elif emails:
+                coverage = {'bottom': min([bottom] + [email['timestamp'] or 0 for email in emails]), 'complete': False}
+            else:
+                return None
+            try:
+                # Stored mail in the newly covered range that Gmail no longer lists is stale
+                self.message_store.prune_messages(listed_ids, after=coverage['bottom'], before=bottom)
+            except Exception as error:
+                print(f'Failed to write message store: {error}')
+                return None
+            self.set_store_coverage(coverage)
+            return coverage
+    
+    def get_message(self, message_id):
+        """Get a fully parsed message, loading its body on first access"""
+        with self.lock:
+            return self._get_message(message_id)
+    
+    def _get_message(self, message_id):
+        cached = self.find_cached(message_id)
+        if cached is not None and cached.get('body_loaded'):
+            return cached
+        
+        email_data = self.message_store.get_full_message(message_id) if self.message_store else None
+        if email_data is None:
+            msg = self.message_request(message_id, 'full').execute()
+            self.request_count += 1
+            email_data = self.parse_message(msg)
+            self.save_to_store(changed=[email_data])
+        
+        if cached is not None:
+            cached.update(email_data)
+            return cached
+        return email_data
+    
+    def get_user_key(self):
+        """Key used to rate limit this mailbox in the fetch engine"""
+        if self.profile:
+            return self.profile.get('emailAddress', 'default')
+        return 'default'
+    
+    def get_thread_http(self):
+        """Per-thread Http for worker threads, as httplib2 is not thread-safe"""
+        if getattr(self._local, 'service', None) is not self.service:
+            import httplib2
+            import google_auth_httplib2
+            service_http = self.service._http
+            if isinstance(service_http, google_auth_httplib2.AuthorizedHttp):
+                http = google_auth_httplib2.AuthorizedHttp(service_http.credentials, http=httplib2.Http())
+            else:
+                http = httplib2.Http()
+            self._local.service = self.service
+            self._local.http = http
+        return self._local.http
+    
+    def fetch_messages_concurrent(self, message_ids, format='full'):
+        """Fetch and parse messages one per request on the shared fetch engine"""
+        def fetch_one(message_id):
+            msg = self.message_request(message_id, format).execute(http=self.get_thread_http())
+            return self.parse_message(msg, headers_only=format != 'full')
+        
+        results = self.fetch_engine.map(fetch_one, message_ids, user_key=self.get_user_key())
+        self.request_count += len(message_ids)
+        
+        email_list = []
+        for message_id, result in zip(message_ids, results):
+            if isinstance(result, Exception):
+                print(f'Failed to fetch message {message_id}: {result}')
+            else:
+                email_list.append(result)
+        return email_list
+    
+    def fetch_messages_sequential(self, message_ids, format='full'):
+        """Fetch and parse messages one request at a time"""
+        email_list = []
+        for message_id in message_ids:
+            msg = self.message_request(message_id, format).execute()
+            self.request_count += 1
+            
+            email_data = self.parse_message(msg, headers_only=format != 'full')
+            email_list.append(email_data)
+        
+        return email_list
+    
+    def new_batch_request(self, callback):
+        """Create a Gmail batch request, honouring a custom batch endpoint"""
+        if self.batch_uri:
+            from googleapiclient.http import BatchHttpRequest
+            return BatchHttpRequest(callback=callback, batch_uri=self.batch_uri)
+        return self.service.new_batch_http_request(callback=callback)
+    
+    def fetch_messages_batched(self, message_ids, format='full'):
+        """Fetch and parse messages in Gmail batch requests of batch_size calls"""
+        parsed = {}
+        failed = []
+        
+        def handle_response(request_id, response, exception):
+            # Parse each message as soon as its part of the batch comes back
+            if exception is not None:
+                failed.append(request_id)
+                return
+            parsed[request_id] = self.parse_message(response, headers_only=format != 'full')
+        
+        def execute_chunk(chunk):
+            batch = self.new_batch_request(handle_response)
+            for message_id in chunk:
+                batch.add(self.message_request(message_id, format), request_id=message_id)
+            if self.fetch_engine is not None:
+                batch.execute(http=self.get_thread_http())
+            else:
+                batch.execute()
+        
+        chunks = [message_ids[start:start + self.batch_size]
+                  for start in range(0, len(message_ids), self.batch_size)]
+        
+        if self.fetch_engine is not None:
+            # Run batches in parallel, charging each call in a batch to the quota
+            results = self.fetch_engine.map(
+                execute_chunk,
+                chunks,
+                user_key=self.get_user_key(),
+                cost=lambda chunk: len(chunk) * MESSAGES_GET_COST
+            )
+            for chunk, result in zip(chunks, results):
+                if isinstance(result, Exception):
+                    print(f'Batch request failed: {result}')
+                    failed.extend(chunk)
+        else:
+            for chunk in chunks:
+                execute_chunk(chunk)
+        self.request_count += len(chunks)
+        
+        # Individual calls inside a batch can fail (e.g. 429s) even when the
+        # batch itself succeeds, so retry those one at a time
+        if failed:
+            print(f'Retrying {len(failed)} messages that failed in batch')
+            for message_id in failed:
+                try:
+                    parsed[message_id] = self.fetch_messages_sequential([message_id], format)[0]
+                except Exception as error:
+                    print(f'Failed to fetch message {message_id}: {error}')
+        
+        # Keep the order returned by messages().list
+        return [parsed[message_id] for message_id in message_ids if message_id in parsed]
+    
+    def parse_message(self, message, include_html=False, headers_only=False):
+        """Parse Gmail message into readable format (headers_only for format='metadata')"""
+        headers = self.get_headers(message['payload'].get('headers', []))
         
         # Extract headers
-        subject = self.get_header(headers, 'Subject') or '(No Subject)'
-        sender = self.get_header(headers, 'From') or 'Unknown Sender'
-        date = self.get_header(headers, 'Date') or ''
-        to = self.get_header(headers, 'To') or ''
+        subject = headers.get('subject') or '(No Subject)'
+        sender = headers.get('from') or 'Unknown Sender'
+        date = headers.get('date') or ''
+        to = headers.get('to') or ''
         
         # Clean up sender name and email
         sender = self.clean_sender(sender)
         
-        # Parse date
-        formatted_date = self.parse_date(date)
+        # Gmail's internalDate (epoch ms) is the reliable sort key; the Date
+        # header is only a fallback
+        internal_date = message.get('internalDate')
+        timestamp = int(internal_date) / 1000 if internal_date else self.get_date_timestamp(date)
+        formatted_date = self.parse_date(date, timestamp)
         
         # Extract both HTML and plain text body
-        body_data = self.get_body_content(message['payload'])
+        if headers_only:
+            body_data = {'plain_text': '', 'html_content': None}
+        else:
+            body_data = self.get_body_content(message['payload'])
         
         # Check if read/unread
         labels = message.get('labelIds', [])
@@ -76,6 +708,8 @@ class EmailClient:
         
         # Clean snippet
         snippet = message.get('snippet', '')
+        if not snippet and body_data['html_content']:
+            snippet = self.strip_html(body_data['html_content'], max_chars=100)
         snippet = self.clean_snippet(snippet)
         
         result = {
@@ -88,7 +722,9 @@ class EmailClient:
             'content': body_data['plain_text'],  # Alias for compatibility
             'is_unread': is_unread,
             'snippet': snippet,
-            'labels': labels
+            'labels': labels,
+            'timestamp': timestamp,
+            'body_loaded': not headers_only
         }
         
         # Add HTML body if available
@@ -104,6 +740,13 @@ class EmailClient:
                 return header['value']
         return None
     
+    def get_headers(self, headers):
+        """Map lowercased header names to values in one pass (first occurrence wins)"""
+        header_map = {}
+        for header in headers:
+            header_map.setdefault(header['name'].lower(), header['value'])
+        return header_map
+    
     def clean_sender(self, sender):
         """Clean up sender name and email format"""
         if not sender:
@@ -117,11 +760,27 @@ class EmailClient:
             return name if name else email
         
         return sender
-    def parse_date(self, date_str):
-        """Parse and format date string"""
+    def parse_date(self, date_str, timestamp=None):
+        """Parse and format date string (RFC 2822 fast path, then the epoch timestamp)"""
+        if date_str:
+            parsed = parsedate_tz(date_str)
+            if parsed is not None:
+                try:
+                    # Sender's wall-clock time, as the header states it
+                    return datetime(*parsed[:6]).strftime(DISPLAY_DATE_FORMAT)
+                except ValueError:
+                    pass
+        
+        if timestamp:
+            return datetime.fromtimestamp(timestamp).strftime(DISPLAY_DATE_FORMAT)
+        
         if not date_str:
             return 'Unknown Date'
         
+        return self.parse_date_formats(date_str)
+    
+    def parse_date_formats(self, date_str):
+        """Slow path for Date headers that aren't RFC 2822"""
         try:
             # Remove timezone info in parentheses for easier parsing
             date_clean = re.sub(r'\s*\([^)]+\)$', '', date_str)
@@ -139,7 +798,7 @@ class EmailClient:
             for fmt in formats:
                 try:
                     parsed_date = datetime.strptime(date_clean.strip(), fmt)
-                    return parsed_date.strftime('%m/%d/%Y %I:%M %p')
+                    return parsed_date.strftime(DISPLAY_DATE_FORMAT)
                 except ValueError:
                     continue
             
@@ -148,6 +807,16 @@ class EmailClient:
         except Exception:
             return date_str
     
+    def get_date_timestamp(self, date_str):
+        """Epoch seconds from a Date header, or 0 if it can't be parsed"""
+        parsed = parsedate_tz(date_str) if date_str else None
+        if parsed is None:
+            return 0
+        try:
+            return float(mktime_tz(parsed))
+        except (OverflowError, ValueError):
+            return 0
+    
     def clean_snippet(self, snippet):
         """Clean up email snippet"""
         if not snippet:
@@ -205,65 +874,46 @@ class EmailClient:
         
         return body.strip()
     
-    def strip_html(self, html_content):
-        """Strip HTML tags and return plain text"""
-        if not html_content:
-            return ''
-        
-        # Remove HTML tags
-        clean = re.compile('<.*?>')
-        text = re.sub(clean, '', html_content)
-        
-        # Decode HTML entities
-        text = unescape(text)
-        
-        # Clean up whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        return text
+    def strip_html(self, html_content, max_chars=None):
+        """Strip HTML tags and return plain text (only the first max_chars if given)"""
+        return html_to_text(html_content, max_chars)
+    
+    def decode_part_data(self, data):
+        """Decode a base64url Gmail body"""
+        return base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+    
+    def is_attachment(self, part):
+        """Attachments carry a filename or an attachmentId instead of inline data"""
+        return bool(part.get('filename')) or 'attachmentId' in part.get('body', {})
     
     def get_body_content(self, payload):
         """Extract both HTML and plain text body from payload"""
         plain_text = ""
         html_content = ""
         
-        def extract_content_from_part(part):
-            """Recursively extract both plain text and HTML from email parts"""
-            plain = ""
-            html = ""
-            
-            if part.get('mimeType') == 'text/plain':
-                if 'data' in part.get('body', {}):
-                    data = part['body']['data']
-                    plain = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-            elif part.get('mimeType') == 'text/html':
-                if 'data' in part.get('body', {}):
-                    data = part['body']['data']
-                    html = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-            elif 'parts' in part:
-                # Recursively check parts
-                for subpart in part['parts']:
-                    sub_plain, sub_html = extract_content_from_part(subpart)
-                    if sub_plain and not plain:
-                        plain = sub_plain
-                    if sub_html and not html:
-                        html = sub_html
-            
-            return plain, html
-        
         if 'parts' in payload:
-            # Multi-part message
-            for part in payload['parts']:
-                part_plain, part_html = extract_content_from_part(part)
-                if part_plain and not plain_text:
-                    plain_text = part_plain
-                if part_html and not html_content:
-                    html_content = part_html
+            # Depth-first, in document order, until both bodies are found
+            stack = list(reversed(payload['parts']))
+            while stack and not (plain_text and html_content):
+                part = stack.pop()
+                if 'parts' in part:
+                    stack.extend(reversed(part['parts']))
+                    continue
+                if self.is_attachment(part):
+                    continue
+                
+                data = part.get('body', {}).get('data')
+                if not data:
+                    continue
+                mime_type = part.get('mimeType')
+                if mime_type == 'text/plain' and not plain_text:
+                    plain_text = self.decode_part_data(data)
+                elif mime_type == 'text/html' and not html_content:
+                    html_content = self.decode_part_data(data)
         else:
             # Single-part message
             if payload.get('body', {}).get('data'):
-                data = payload['body']['data']
-                content = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+                content = self.decode_part_data(payload['body']['data'])
                 
                 if payload.get('mimeType') == 'text/html':
                     html_content = content
@@ -294,170 +944,298 @@ class QuerySaver():
         self.query = additional_query.strip()
 
 
+_keyword_engine = None
+_keyword_engine_lock = threading.Lock()
+
+def get_keyword_engine():
+    """Shared KeywordRuleEngine with any rules from KEYWORD_RULES_FILE, created on first use"""
+    global _keyword_engine
+    with _keyword_engine_lock:
+        if _keyword_engine is None:
+            _keyword_engine = build_keyword_engine()
+        return _keyword_engine
+
 def simple_categorize(emails):
     """Simple categorization without AI - fallback function"""
-    categories = []
-    
-    for email in emails:
-        subject = email.get("subject", "").lower()
-        
-        if any(word in subject for word in ["meeting", "calendar", "appointment", "schedule"]):
-            categories.append("Meetings")
-        elif any(word in subject for word in ["project", "task", "deadline", "work", "team"]):
-            categories.append("Work")
-        elif any(word in subject for word in ["newsletter", "news", "update", "weekly", "daily"]):
-            categories.append("Newsletters")
-        elif any(word in subject for word in ["bill", "payment", "invoice", "bank", "statement"]):
-            categories.append("Finance")
-        elif any(word in subject for word in ["security", "alert", "login", "password", "verification"]):
-            categories.append("Security")
-        elif any(word in subject for word in ["social", "facebook", "twitter", "linkedin", "instagram"]):
-            categories.append("Social")
-        else:
-            categories.append("Others")
-    
-    return categories
+    return get_keyword_engine().categorize(emails)
 
 
 # Test the fixed code
-def gen_categories(unformated_emails, user_query=""):
-    emails = []
-    for email in unformated_emails:
-        emails.append([email["subject"]])
-
-    # Try AI categorization first, fallback to simple categorization
-    try:
-        if user_query == "":
-            category_init_template = """
-                                    You are an email classifier. Your task is simple:
-
-                                    1. Read the email headings below
-                                    2. You MUST classify all headings using NO MORE THAN 7 UNIQUE CATEGORIES. If you use more than 7 unique categories, you will instantly fail.
-                                    3. Assign each email to exactly one category.
-                                    4. If you are unsure, use "Others" as the category.
-
-                                    Email headings:
-                                    {emails}
-
-                                    Instructions:
-                                    - You are absolutely forbidden from using more than 7 unique category names in your entire output.
-                                    - Assign one category per email, in the same order as the email list.
-                                    - Use "Others" for any heading that does not clearly fit into one of your chosen categories.
-                                    - Output ONLY in this format (do not number, do not add extra text):
-
-                                    Heading --- Category (NO MORE THAN 7 UNIQUE CATEGORIES)
-                                    Heading --- Category
-                                    Heading --- Category
-                                """
-        else:
-            category_init_template = """
-                                    You are an email classifier. Your task is simple:
-
-                                    1. Read the email headings below
-                                    2. You MUST classify all headings using NO MORE THAN 7 UNIQUE CATEGORIES. If you use more than 7 unique categories, you will instantly fail.
-                                    3. Assign each email to exactly one category.
-                                    4. If you are unsure, use "Others" as the category.
-
-                                    Email headings:
-                                    {emails}
-
-                                    THESE ARE THE USERS CUSTOM INSTRUCTIONS. PLEASE BE SURE TO TAKE THEM INTO ACCOUNT(if not you fail.):
-                                    {custom_instruction}
-
-                                    Instructions:
-                                    - You are absolutely forbidden from using more than 7 unique category names in your entire output.
-                                    - Assign one category per email, in the same order as the email list.
-                                    - Use "Others" for any heading that does not clearly fit into one of your chosen categories.
-                                    - Output ONLY in this format (do not number, do not add extra text):
-
-                                    Heading --- Category (NO MORE THAN 7 UNIQUE CATEGORIES)
-                                    Heading --- Category
-                                    Heading --- Category
-                                """
-            
-        email_headings = []
-        for i, email in enumerate(emails, 1):
-            # Extract the heading from the nested list structure
-            heading = email[0] if isinstance(email, list) and len(email) > 0 else str(email)
-            email_headings.append(f"{i}. {heading}")
-        
-        formatted_emails = "\n".join(email_headings)
-
-        if user_query == "":
-            category_init_template = category_init_template.format(emails=formatted_emails)
-        else:
-            category_init_template = category_init_template.format(emails=formatted_emails, custom_instruction=user_query)
+_categorization_engine = None
+_category_cache = None
+_categorization_engine_lock = threading.Lock()
 
-        gemini_input = category_init_template
+def get_categorization_engine():
+    """Shared CategorizationEngine (Gemini), created on first use"""
+    global _categorization_engine
+    with _categorization_engine_lock:
+        if _categorization_engine is None:
+            _categorization_engine = CategorizationEngine(
+                max_workers=int(os.environ.get('CATEGORIZE_WORKERS', 4)),
+                fallback=simple_categorize
+            )
+        return _categorization_engine
 
-        api_key="key goes here"
+def get_category_cache():
+    """Shared CategoryCache with its disk tier in category_cache/, created on first use"""
+    global _category_cache
+    with _categorization_engine_lock:
+        if _category_cache is None:
+            _category_cache = CategoryCache(storage_dir=os.environ.get('CATEGORY_CACHE_DIR', 'category_cache'))
+        return _category_cache
 
-        import google.generativeai as genai
+_local_classifiers = {}
+MAX_LOCAL_CLASSIFIERS = 100
 
-        print("[DEBUG] Attempting AI categorization with Gemini...")
-        
-        # Configure with your API key
-        genai.configure(api_key=api_key)
+def get_local_classifier(user_email, saved_data):
+    """Per-user LocalClassifier trained on the saved categories, retrained when they are saved again"""
+    version = (saved_data.get('saved_at_iso'), saved_data.get('log_seq', 0))
+    with _categorization_engine_lock:
+        entry = _local_classifiers.get(user_email)
+        if entry and entry[0] == version:
+            return entry[1]
+    
+    emails = []
+    labels = []
+    for category, category_emails in saved_data.get('categories', {}).items():
+        for email in category_emails:
+            emails.append(email)
+            labels.append(category)
+    classifier = LocalClassifier(threshold=float(os.environ.get('LOCAL_CLASSIFIER_CONFIDENCE', 0.9)))
+    classifier.fit(emails, labels)
+    
+    with _categorization_engine_lock:
+        _local_classifiers.pop(user_email, None)
+        _local_classifiers[user_email] = (version, classifier)
+        while len(_local_classifiers) > MAX_LOCAL_CLASSIFIERS:
+            _local_classifiers.pop(next(iter(_local_classifiers)))
+    return classifier
 
-        # Use Gemini Flash instead of Pro
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        response = model.generate_content(gemini_input)
-        
-        if not response or not response.text:
-            print("Warning: Empty response from Gemini, using simple categorization")
-            return simple_categorize(unformated_emails)
-        
-        print(f"[DEBUG] Gemini response: {response.text[:200]}...")
+def gen_categories(unformated_emails, user_query="", engine=None, cache=None, vocabulary=None, on_progress=None,
+                   user_email=''):
+    # Try AI categorization first, fallback to simple categorization
+    # With a vocabulary, labels are fitted to those existing category names first;
+    # cached answers are kept per user_email (the account the emails belong to);
+    # on_progress(done, total, indexes, categories) is called as each model chunk finishes
+    try:
+        engine = engine or get_categorization_engine()
+        cache = cache or get_category_cache()
         
-        output = []
-        entries = response.text.strip().split("\n")
+        # Only emails the cache hasn't seen go to the model
+        keys = [cache.make_key(email, user_query, user_email, vocabulary) for email in unformated_emails]
+        cached = cache.get_many(keys)
+        output = [cached.get(key) for key in keys]
+        misses = [i for i, category in enumerate(output) if category is None]
         
-        for entry in entries:
-            entry = entry.strip()
-            if entry == "" or not entry:
-                continue
+        if misses:
+            print("[DEBUG] Attempting AI categorization with Gemini...")
+            known = sorted(set(cached.values()) | set(vocabulary or []))
+            def on_chunk(done, total, indexes, categories):
+                # Chunk indexes are positions in misses; report them as positions in unformated_emails
+                on_progress(done, total, [misses[i] for i in indexes], categories)
+            # Stats of this call only; the engine's last_run may belong to a concurrent job
+            stats = {}
+            fresh = engine.categorize([unformated_emails[i] for i in misses], user_query, vocabulary=known,
+                                      on_chunk=on_chunk if on_progress else None, stats=stats)
+            for i, category in zip(misses, fresh):
+                output[i] = category
             
-            # Try to extract category from the response
-            if " --- " in entry:
-                parts = entry.split(" --- ")
-                if len(parts) >= 2:
-                    category = parts[1].strip()
-                    # Clean up category name
-                    category = category.replace("(NO MORE THAN 7 UNIQUE CATEGORIES)", "").strip()
-                    output.append(category)
-                else:
-                    output.append('Others')
-            else:
-                # If the format is unexpected, try to extract the last word as category
-                words = entry.split()
-                if len(words) > 0:
-                    output.append(words[-1].strip())
-                else:
-                    output.append('Others')
-        
-        # Ensure we have the same number of categories as emails
-        if len(output) != len(unformated_emails):
-            print(f"Warning: Category count ({len(output)}) doesn't match email count ({len(unformated_emails)})")
-            # Pad with 'Others' if we have fewer categories
-            while len(output) < len(unformated_emails):
-                output.append('Others')
-            # Truncate if we have more categories
-            output = output[:len(unformated_emails)]
-        
-        print(f"[DEBUG] AI categorization successful: {output}")
+            print(f"[DEBUG] AI categorization successful: {stats['emails']} emails "
+                  f"({stats['unique_subjects']} unique subjects) in {stats['chunks']} chunks "
+                  f"({stats['fallback_chunks']} fell back) in {stats['wall_seconds']:.2f}s")
+            fell_back = {misses[i] for i in stats['fallback_indexes']}
+        else:
+            fell_back = set()
+        
+        output = engine.merge_vocabularies(output, vocabulary)
+        # Keyword fallbacks are not model answers, so they are not cached
+        cache.put_many({keys[i]: output[i] for i in misses if i not in fell_back})
         return output
         
     except Exception as e:
         print(f"Error in AI categorization: {str(e)}")
         print("[DEBUG] Falling back to simple categorization")
         # Return fallback categories using simple logic
-        return simple_categorize(unformated_emails)
+        output = simple_categorize(unformated_emails)
+        if vocabulary:
+            # Stay within the saved category names; keyword labels matching none of them go to Others
+            saved = {normalize_category(name) for name in vocabulary}
+            output = [category if normalize_category(category) in saved else 'Others' for category in output]
+            output = merge_vocabularies(output, vocabulary)
+        return output
+    
+
+def gen_categories_incremental(email_list, category_storage, user_query="", on_progress=None):
+    """
+    Categorize email_list reusing the assignments in the user's saved categories.
+    Emails whose message ID is not in the saved grouping are classified locally
+    when a classifier trained on that grouping is confident, and otherwise go to
+    gen_categories against the saved category names. Returns (categories, new_count).
+    """
+    saved_data = category_storage.load_categories()
+    if not saved_data or saved_data.get('query', '') != user_query or not saved_data.get('categories'):
+        return gen_categories(email_list, user_query, on_progress=on_progress,
+                              user_email=category_storage.user_email), len(email_list)
+    
+    # Older saves have no message IDs, so fall back to subject and sender for those
+    known = {}
+    for category, emails in saved_data['categories'].items():
+        for email in emails:
+            if email.get('id'):
+                known[email['id']] = category
+            else:
+                known.setdefault((email.get('subject', ''), email.get('sender', '')), category)
+    
+    categories = []
+    new_indexes = []
+    for i, email in enumerate(email_list):
+        category = known.get(email.get('id')) or known.get((email.get('subject', ''), email.get('sender', '')))
+        if category is None:
+            new_indexes.append(i)
+        categories.append(category)
+    print(f"[DEBUG] Incremental categorization: {len(email_list) - len(new_indexes)} saved, {len(new_indexes)} new")
+    
+    if new_indexes:
+        # Emails the local classifier is confident about skip the model entirely
+        classifier = get_local_classifier(category_storage.user_email, saved_data)
+        answered, uncertain = classifier.classify([email_list[i] for i in new_indexes])
+        for position, category in answered.items():
+            categories[new_indexes[position]] = category
+        print(f"[DEBUG] Local classifier: {len(answered)} confident, {len(uncertain)} sent to the model")
+        
+        remaining = [new_indexes[position] for position in uncertain]
+        if remaining:
+            vocabulary = list(saved_data['categories'].keys())
+            def on_chunk(done, total, indexes, categories):
+                on_progress(done, total, [remaining[i] for i in indexes], categories)
+            fresh = gen_categories([email_list[i] for i in remaining], user_query, vocabulary=vocabulary,
+                                   on_progress=on_chunk if on_progress else None,
+                                   user_email=category_storage.user_email)
+            for i, category in zip(remaining, fresh):
+                categories[i] = category
+    
+    return categories, len(new_indexes)
+    
+    
+# Saved groupings keep message IDs and this much of each snippet; bodies stay in the message store
+CATEGORIES_FORMAT_VERSION = 2
+SAVED_SNIPPET_LENGTH = 200
+
+# Parsed saved files shared by every CategoryStorage in the process:
+# path -> (mtime_ns, size, data), least recently used first
+_storage_cache = {}
+_storage_cache_lock = threading.Lock()
+MAX_CACHED_STORAGE_FILES = 200
+_user_hashes = {}
+
+def user_email_hash(user_email):
+    """MD5 of the email used in saved file names, computed once per account"""
+    email_hash = _user_hashes.get(user_email)
+    if email_hash is None:
+        email_hash = hashlib.md5(user_email.encode()).hexdigest()
+        with _storage_cache_lock:
+            if len(_user_hashes) >= MAX_CACHED_STORAGE_FILES:
+                _user_hashes.clear()
+            _user_hashes[user_email] = email_hash
+    return email_hash
+
+def read_json_cached(file_path, load=json.load, binary=False):
+    """
+    Parsed contents of a saved JSON file (or whatever load reads from it),
+    or None if it does not exist. The parse is reused until the file's mtime
+    or size changes, so a file rewritten by another worker process is picked
+    up on the next read.
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        with _storage_cache_lock:
+            _storage_cache.pop(file_path, None)
+        return None
     
+    with _storage_cache_lock:
+        entry = _storage_cache.pop(file_path, None)
+        if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            _storage_cache[file_path] = entry
+            return entry[2]
     
+    with (open(file_path, 'rb') if binary else open(file_path, 'r', encoding='utf-8')) as f:
+        data = load(f)
+    cache_json(file_path, stat, data)
+    return data
+
+def cache_json(file_path, stat, data):
+    with _storage_cache_lock:
+        _storage_cache.pop(file_path, None)
+        _storage_cache[file_path] = (stat.st_mtime_ns, stat.st_size, data)
+        while len(_storage_cache) > MAX_CACHED_STORAGE_FILES:
+            _storage_cache.pop(next(iter(_storage_cache)))
+
+def write_json_atomic(file_path, data, dump=None, binary=False, **dump_kwargs):
+    """
+    Write data to a temp file next to file_path and rename it over, so
+    readers never see a partial file. dump(data, f) replaces json.dump.
+    """
+    temp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with (open(temp_path, 'wb') if binary else open(temp_path, 'w', encoding='utf-8')) as f:
+            if dump:
+                dump(data, f)
+            else:
+                json.dump(data, f, **dump_kwargs)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    # What was just written is what the next load would parse
+    cache_json(file_path, os.stat(file_path), data)
+
+def dump_log(operations, f):
+    for operation in operations:
+        f.write(json.dumps(operation, ensure_ascii=False) + '\n')
+
+# Change logs past this size are folded into their snapshot in the background
+CHANGE_LOG_MAX_BYTES = int(os.environ.get('CHANGE_LOG_MAX_BYTES', 256 * 1024))
+# Serializes appends, snapshot saves and compactions of change logs between
+# threads; an flock on a per-file lock file does the same between processes
+_change_log_lock = threading.RLock()
+_held_file_locks = {}
+_compacting = set()
+
+@contextmanager
+def change_log_lock(lock_path):
+    """Hold the lock of one saved file and its log; re-entrant for the thread holding it"""
+    with _change_log_lock:
+        if fcntl is None or lock_path in _held_file_locks:
+            yield
+            return
+        with open(lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            _held_file_locks[lock_path] = f
+            try:
+                yield
+            finally:
+                # Closing the file releases the flock
+                del _held_file_locks[lock_path]
+
+# How each saved JSON file is written; categories are compact, folders stay readable
+SNAPSHOT_DUMP_OPTIONS = {
+    'categories': {'ensure_ascii': False, 'separators': (',', ':')},
+    'folders': {'indent': 2, 'ensure_ascii': False},
+}
+# 'json' or 'compact' (snapshot_format: short keys, compressed); saves in the
+# other format are migrated the first time they are read
+CATEGORY_SNAPSHOT_FORMAT = os.environ.get('CATEGORY_SNAPSHOT_FORMAT', 'json')
+CATEGORY_SNAPSHOT_CODEC = os.environ.get('CATEGORY_SNAPSHOT_CODEC') or snapshot_format.default_codec()
+
 class CategoryStorage:
-    def __init__(self, user_email):
+    def __init__(self, user_email, snapshot_format=None):
         self.user_email = user_email
         self.storage_dir = "saved_categories"
+        self.use_compact_format = (snapshot_format or CATEGORY_SNAPSHOT_FORMAT) == 'compact'
         self.ensure_storage_dir()
     
     def ensure_storage_dir(self):
@@ -467,43 +1245,138 @@ class CategoryStorage:
     
     def get_user_file_path(self, file_type):
         """Get file path for user's saved data"""
-        # Create a hash of the email to use as filename
-        email_hash = hashlib.md5(self.user_email.encode()).hexdigest()
-        return os.path.join(self.storage_dir, f"{email_hash}_{file_type}.json")
+        # Named after a hash of the email
+        return os.path.join(self.storage_dir, f"{user_email_hash(self.user_email)}_{file_type}.json")
+    
+    def get_snapshot_path(self, file_type, compact=None):
+        """Path of the saved file in the compact format if compact (default: the configured one), else JSON"""
+        compact = self.use_compact_format if compact is None else compact
+        if compact:
+            return os.path.join(self.storage_dir, f"{user_email_hash(self.user_email)}_{file_type}.snap")
+        return self.get_user_file_path(file_type)
+    
+    def read_snapshot_file(self, file_type, compact):
+        if compact:
+            return read_json_cached(self.get_snapshot_path(file_type, True), load=snapshot_format.load, binary=True)
+        return read_json_cached(self.get_snapshot_path(file_type, False))
+    
+    def write_snapshot_file(self, file_type, data):
+        if self.use_compact_format:
+            write_json_atomic(self.get_snapshot_path(file_type), data, binary=True,
+                              dump=lambda data, f: snapshot_format.dump(data, f, CATEGORY_SNAPSHOT_CODEC))
+        else:
+            write_json_atomic(self.get_snapshot_path(file_type), data, **SNAPSHOT_DUMP_OPTIONS[file_type])
+        # A save in the other format is now out of date
+        other_path = self.get_snapshot_path(file_type, not self.use_compact_format)
+        if os.path.exists(other_path):
+            os.remove(other_path)
+    
+    def read_snapshot(self, file_type):
+        """The saved file in the configured format, migrating a save found in the other one"""
+        snapshot = self.read_snapshot_file(file_type, self.use_compact_format)
+        if snapshot is not None:
+            return snapshot
+        with self.lock_changes(file_type):
+            snapshot = self.read_snapshot_file(file_type, not self.use_compact_format)
+            if snapshot is None or self.read_snapshot_file(file_type, self.use_compact_format) is not None:
+                return self.read_snapshot_file(file_type, self.use_compact_format)
+            
+            data = dict(snapshot)
+            if file_type == "categories" and data.get('format_version', 1) < CATEGORIES_FORMAT_VERSION:
+                # Saves from before message IDs were kept are converted along the way
+                data['categories'], data['messages'] = self.compact_categories(data.get('categories', {}))
+                data['format_version'] = CATEGORIES_FORMAT_VERSION
+            self.write_snapshot_file(file_type, data)
+            print(f"[DEBUG] Migrated saved {file_type} for {self.user_email} to the "
+                  f"{'compact' if self.use_compact_format else 'JSON'} format")
+            return data
     
     def save_categories(self, categories, query=""):
-        """Save categories to local file"""
+        """Save categories to local file as category -> message IDs plus a small projection of each message"""
         try:
-            file_path = self.get_user_file_path("categories")
             current_time = datetime.now()
             formatted_time = current_time.strftime("%Y-%m-%d %I:%M %p")
             
+            grouping, messages = self.compact_categories(categories)
             data = {
+                "format_version": CATEGORIES_FORMAT_VERSION,
                 "user_email": self.user_email,
-                "categories": categories,
+                "categories": grouping,
+                "messages": messages,
                 "query": query,
                 "saved_at": formatted_time,
                 "saved_at_iso": current_time.isoformat(),
-                "email_count": sum(len(emails) for emails in categories.values())
+                "email_count": sum(len(ids) for ids in grouping.values())
             }
             
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            self.write_snapshot("categories", data)
             
             return True
         except Exception as e:
             print(f"Error saving categories: {e}")
             return False
     
-    def load_categories(self):
-        """Load categories from local file"""
+    def compact_categories(self, categories):
+        """Split {category: [emails]} into {category: [ids]} and {id: projection}"""
+        grouping = {}
+        messages = {}
+        for category, emails in categories.items():
+            ids = []
+            for email in emails:
+                # Emails saved without a message ID still need a key of their own
+                message_id = email.get('id') or f"local-{len(messages)}"
+                if message_id not in messages:
+                    snippet = email.get('snippet') or email.get('content') or ''
+                    messages[message_id] = {
+                        'subject': email.get('subject', ''),
+                        'sender': email.get('sender', ''),
+                        'date': email.get('date', ''),
+                        'snippet': snippet[:SAVED_SNIPPET_LENGTH]
+                    }
+                ids.append(message_id)
+            grouping[category] = ids
+        return grouping, messages
+    
+    def expand_categories(self, data, message_store=None):
+        """
+        Rebuild {category: [emails]} from a compact save. Messages found in
+        message_store come back as its current list entries (with the saved
+        projection filling any empty fields); the rest are built from the
+        projection alone.
+        """
+        messages = data.get('messages', {})
+        stored = {}
+        if message_store is not None:
+            ids = [message_id for message_id in messages if not message_id.startswith('local-')]
+            stored = {email['id']: email for email in message_store.get_messages(ids)}
+        
+        categories = {}
+        for category, ids in data.get('categories', {}).items():
+            emails = []
+            for message_id in ids:
+                projection = messages.get(message_id, {})
+                email = stored.get(message_id)
+                if email is None:
+                    email = dict(projection)
+                    email['id'] = '' if message_id.startswith('local-') else message_id
+                else:
+                    for field, value in projection.items():
+                        email[field] = email.get(field) or value
+                emails.append(email)
+            categories[category] = emails
+        return categories
+    
+    def load_categories(self, message_store=None):
+        """Load categories from local file, rehydrating messages from message_store when given"""
         try:
-            file_path = self.get_user_file_path("categories")
-            if not os.path.exists(file_path):
+            data = self.load_snapshot("categories")
+            if data is None:
                 return None
             
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            # Older saves hold full email objects and are returned as they are
+            if data.get('format_version', 1) >= CATEGORIES_FORMAT_VERSION:
+                data['categories'] = self.expand_categories(data, message_store)
+                del data['messages']
             
             return data
         except Exception as e:
@@ -513,7 +1386,6 @@ class CategoryStorage:
     def save_folders(self, folders):
         """Save folder structure to local file"""
         try:
-            file_path = self.get_user_file_path("folders")
             current_time = datetime.now()
             formatted_time = current_time.strftime("%Y-%m-%d %I:%M %p")
             
@@ -524,8 +1396,7 @@ class CategoryStorage:
                 "saved_at_iso": current_time.isoformat()
             }
             
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            self.write_snapshot("folders", data)
             
             return True
         except Exception as e:
@@ -535,25 +1406,124 @@ class CategoryStorage:
     def load_folders(self):
         """Load folder structure from local file"""
         try:
-            file_path = self.get_user_file_path("folders")
-            if not os.path.exists(file_path):
-                return None
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            return data
+            return self.load_snapshot("folders")
         except Exception as e:
             print(f"Error loading folders: {e}")
             return None
     
+    def has_saved_file(self, file_type):
+        file_path = self.get_snapshot_path(file_type)
+        # Saved files are only replaced (or migrated to this path), so a cached parse means the file exists
+        with _storage_cache_lock:
+            if file_path in _storage_cache:
+                return True
+        other_path = self.get_snapshot_path(file_type, not self.use_compact_format)
+        return os.path.exists(file_path) or os.path.exists(other_path) \
+            or os.path.exists(self.get_change_log_path(file_type))
+    
     def has_saved_categories(self):
         """Check if user has saved categories"""
-        file_path = self.get_user_file_path("categories")
-        return os.path.exists(file_path)
+        return self.has_saved_file("categories")
     
     def has_saved_folders(self):
         """Check if user has saved folders"""
-        file_path = self.get_user_file_path("folders")
-        return os.path.exists(file_path)
-    
\ No newline at end of file
+        return self.has_saved_file("folders")
+    
+    def get_change_log_path(self, file_type):
+        """Path of the append-only log of edits made since the user's last snapshot"""
+        return os.path.join(self.storage_dir, f"{user_email_hash(self.user_email)}_{file_type}.log")
+    
+    def lock_changes(self, file_type):
+        """Lock the saved file and change log of file_type against other threads and worker processes"""
+        return change_log_lock(os.path.join(self.storage_dir, f"{user_email_hash(self.user_email)}_{file_type}.lock"))
+    
+    def read_log_state(self, file_type):
+        """(snapshot, operations not yet in it, last sequence number) straight from disk (or cache)"""
+        snapshot = self.read_snapshot(file_type)
+        operations = read_json_cached(self.get_change_log_path(file_type), load=parse_log) or []
+        snapshot_seq = snapshot.get('log_seq', 0) if snapshot else 0
+        pending = [operation for operation in operations if operation['seq'] > snapshot_seq]
+        last_seq = pending[-1]['seq'] if pending else snapshot_seq
+        return snapshot, pending, last_seq
+    
+    def empty_snapshot(self, file_type):
+        data = {"user_email": self.user_email, file_type: {}, "saved_at": "", "saved_at_iso": ""}
+        if file_type == "categories":
+            data.update({"format_version": CATEGORIES_FORMAT_VERSION, "messages": {}, "query": "", "email_count": 0})
+        return data
+    
+    def load_snapshot(self, file_type):
+        """The saved file with any logged edits replayed onto it, as a copy the caller may change"""
+        snapshot, pending, last_seq = self.read_log_state(file_type)
+        if snapshot is None and not pending:
+            return None
+        
+        # The parsed file is shared, so callers get their own top-level copy
+        data = dict(snapshot or self.empty_snapshot(file_type))
+        if pending:
+            data[file_type] = apply_operations(data.get(file_type, {}), pending)
+            data['log_seq'] = last_seq
+            if file_type == "categories":
+                data['email_count'] = sum(len(entries) for entries in data['categories'].values())
+        return data
+    
+    def write_snapshot(self, file_type, data):
+        """Replace the saved file; it supersedes every edit logged so far"""
+        with self.lock_changes(file_type):
+            _, _, last_seq = self.read_log_state(file_type)
+            data['log_seq'] = last_seq
+            self.write_snapshot_file(file_type, data)
+            log_path = self.get_change_log_path(file_type)
+            if os.path.exists(log_path):
+                write_json_atomic(log_path, [], dump=dump_log)
+    
+    def append_changes(self, file_type, operations):
+        """
+        Append validated operations to the user's change log and return them
+        with their sequence numbers. Only the new lines are written; once the
+        log passes CHANGE_LOG_MAX_BYTES it is compacted on a background thread.
+        """
+        log_path = self.get_change_log_path(file_type)
+        with self.lock_changes(file_type):
+            _, _, last_seq = self.read_log_state(file_type)
+            logged_at = datetime.now().isoformat()
+            entries = [dict(operation, seq=last_seq + i + 1, at=logged_at) for i, operation in enumerate(operations)]
+            
+            logged = read_json_cached(log_path, load=parse_log) or []
+            with open(log_path, 'a', encoding='utf-8') as f:
+                dump_log(entries, f)
+            # Extend the cached parse rather than re-reading the whole log
+            logged.extend(entries)
+            cache_json(log_path, os.stat(log_path), logged)
+            
+            if os.path.getsize(log_path) > CHANGE_LOG_MAX_BYTES and log_path not in _compacting:
+                _compacting.add(log_path)
+                threading.Thread(target=self.compact, args=(file_type,), name='change-log-compaction',
+                                 daemon=True).start()
+        return entries
+    
+    def get_changes(self, file_type, since=0):
+        """Logged operations after sequence number since that are not yet compacted, and the snapshot's seq"""
+        snapshot, pending, _ = self.read_log_state(file_type)
+        return [operation for operation in pending if operation['seq'] > since], \
+            (snapshot.get('log_seq', 0) if snapshot else 0)
+    
+    def compact(self, file_type):
+        """Fold the change log into a new snapshot and truncate it"""
+        log_path = self.get_change_log_path(file_type)
+        try:
+            with self.lock_changes(file_type):
+                data = self.load_snapshot(file_type)
+                if data is None:
+                    return
+                if file_type == "categories" and data.get('format_version', 1) >= CATEGORIES_FORMAT_VERSION:
+                    # Messages dropped along with a deleted category are no longer needed
+                    kept = {message_id for ids in data['categories'].values() for message_id in ids}
+                    data['messages'] = {message_id: projection for message_id, projection
+                                        in data['messages'].items() if message_id in kept}
+                self.write_snapshot(file_type, data)
+            print(f"[DEBUG] Compacted {file_type} change log for {self.user_email}")
+        except Exception as e:
+            print(f"Error compacting {file_type} change log: {e}")
+        finally:
+            _compacting.discard(log_path)